@@ -1,24 +1,140 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, session
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+import logging
 import os # For session key
+import time
 from datetime import datetime
 
 # Import blueprints
-from routes.budget_routes import budget_bp
+from routes.budget_routes import budget_bp, current_user_id
 from routes.chatbot_routes import chatbot_bp
 from routes.recommendation_routes import recommendation_bp
-from config import Config # To ensure config is loaded and validated
+from config import Config
+from services.container import ServiceContainer, get_services
+from utils.structured_logging import configure_logging, shutdown_logging, set_request_id, reset_request_id
+from utils import metrics
+from utils.profiling import RequestProfiler
+from utils.traffic_capture import TrafficRecorder
+from utils.admission import EXTENSION_KEY as ADMISSION_KEY, AdmissionController, admission_controlled
+
+logger = logging.getLogger(__name__)
 
 def create_app():
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_DEBUG_SAMPLE_RATE, Config.LOG_QUEUE_SIZE)
+
     app = Flask(__name__)
     CORS(app)  # Enable CORS for all routes
+    if Config.TRUSTED_PROXY_HOPS > 0:
+        # remote_addr (the admission rate-limit key for sessionless callers) is the client's, not the proxy's
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_HOPS, x_proto=Config.TRUSTED_PROXY_HOPS)
     
     # Load configuration
     app.config.from_object(Config) # Though GROQ_API_KEY is used directly by services via Config class
     
     # Secret key for session management (important for chatbot session)
-    # In a production app, use a strong, randomly generated key and store it securely.
-    app.secret_key = os.urandom(24) 
+    # Set SECRET_KEY so cookies signed by one worker verify on the others and survive restarts.
+    app.secret_key = Config.SECRET_KEY or os.urandom(24)
+    if not Config.SECRET_KEY:
+        logger.warning("SECRET_KEY not set; using a random per-process key (chat sessions reset on restart "
+                       "and do not work across worker processes)")
+
+    # Services are created on first use; startup hooks run here, shutdown at exit
+    services = ServiceContainer(eager=Config.EAGER_SERVICES)
+    services.init_app(app)
+    services.on_shutdown(lambda _: shutdown_logging())  # Registered first, so it flushes last
+
+    # LLM-backed routes are rate limited and queued; other routes are never gated
+    if Config.ADMISSION_ENABLED:
+        app.extensions[ADMISSION_KEY] = AdmissionController.from_config(Config)
+
+    # Per-request correlation id: taken from X-Request-Id when the caller sends one
+    @app.before_request
+    def bind_request_id():
+        g.request_id, g.request_id_token = set_request_id(request.headers.get('X-Request-Id'))
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.route_token = metrics.current_route.set(g.route)
+
+    @app.after_request
+    def add_request_id_header(response):
+        if 'request_id' in g:
+            response.headers['X-Request-Id'] = g.request_id
+        if 'request_started' in g:
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - g.request_started,
+                                            method=request.method, route=g.route, status=str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def unbind_request_id(_exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            reset_request_id(token)
+        route_token = g.pop('route_token', None)
+        if route_token is not None:
+            metrics.current_route.reset(route_token)
+
+    if Config.PROFILE_ENABLED:
+        profiler = RequestProfiler(Config.PROFILE_DIR, Config.PROFILE_MODE, Config.PROFILE_SAMPLE_RATE,
+                                   Config.PROFILE_INTERVAL_MS, Config.PROFILE_TOKEN)
+
+        @app.before_request
+        def start_profiling():
+            if profiler.wanted(request.headers.get('X-Profile')):
+                g.profile_session = profiler.start()
+
+        @app.after_request
+        def finish_profiling(response):
+            session = g.pop('profile_session', None)
+            if session is not None:
+                route = request.url_rule.rule if request.url_rule else request.path
+                artifact = profiler.finish(session, route, g.get('request_id', '-'))
+                if artifact:
+                    response.headers['X-Profile-Artifact'] = artifact
+            return response
+
+    if Config.TRACE_CAPTURE_PATH:
+        recorder = app.extensions['traffic_recorder'] = TrafficRecorder(Config.TRACE_CAPTURE_PATH,
+                                                                        Config.TRACE_SAMPLE_RATE)
+        services.on_shutdown(lambda _: recorder.close())
+
+        @app.after_request
+        def capture_trace(response):
+            if 'request_started' in g:
+                duration = time.perf_counter() - g.request_started
+                try:
+                    recorder.record(time.time() - duration, request.method, g.route, request.args,
+                                    request.get_json(silent=True) if request.is_json else None,
+                                    session.get('session_id') or request.remote_addr,
+                                    request.headers.get('X-User-Id') or request.args.get('user_id'),
+                                    response.status_code, duration)
+                except Exception:
+                    # Capture is diagnostics only; it must never turn a served request into a 500
+                    logger.exception("Traffic capture failed", extra={"route": g.route})
+            return response
+
+    # Scrape-time gauges read services only if they exist, so /metrics never builds one
+    def conversation_count():
+        chatbot = services.built('chatbot_service')
+        return len(chatbot.conversation_history_store) if chatbot else 0
+
+    metrics.registry.gauge('chatbot_conversations', 'Sessions in conversation_history_store', conversation_count)
+
+    def admission_load():
+        controller = app.extensions.get(ADMISSION_KEY)
+        if controller is None:
+            return None
+        stats = controller.stats()
+        return {(('state', 'active'),): stats['active'], (('state', 'waiting'),): stats['waiting']}
+
+    metrics.registry.gauge('admission_llm_requests', 'LLM route requests in flight or queued', admission_load)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.registry.exposition(), mimetype='text/plain; version=0.0.4')
 
     # Register blueprints
     app.register_blueprint(budget_bp)
@@ -32,33 +148,40 @@ def create_app():
                            "budget_questionnaire": "/api/budget/questionnaire (GET)",
                            "budget_plan_create": "/api/budget/plan (POST)",
                            "budget_plan_view": "/api/budget/plan (GET)",
+                           "budget_plan_job": "/api/budget/plan (POST, Prefer: respond-async -> 202), /api/budget/jobs/<job_id> (GET)",
                            "budget_plan_reset": "/api/budget/plan (DELETE)",
+                           "budget_bulk": "/api/budget/bulk (POST multipart CSV), /api/budget/bulk/<job_id> (GET)",
+                           "budget_spending": "/api/budget/spending?month=YYYY-MM (GET)",
+                           "budget_simulate": "/api/budget/simulate (POST what-if scenarios)",
                            "chatbot_chat": "/api/chatbot/chat (POST)",
                            "chatbot_reset": "/api/chatbot/reset (POST)",
                            "chatbot_current_budget": "/api/chatbot/current_budget (GET)",
-                           "recommendations": "/api/recommendations/?product=<product_name>&city=<user_city> (GET)"
+                           "metrics": "/metrics (GET, Prometheus text)",
+                           "recommendations": "/api/recommendations/?product=<product_name>&city=<user_city> (GET)",
+                           "recommendation_cities": "/api/recommendations/cities?q=<typed city> (GET)",
+                           "recommendation_catalog": "/api/recommendations/catalog (GET), /api/recommendations/catalog/reload (POST)"
                        })
 
     @app.route('/api/chatbot/update-budget', methods=['POST'])
+    @admission_controlled
     def chatbot_update_budget():
         """Handle budget updates from chatbot interface"""
         try:
-            data = request.get_json()
+            data = request.get_json(silent=True)
             
-            if not data or 'message' not in data:
+            if not isinstance(data, dict) or not isinstance(data.get('message'), str) or not data['message']:
                 return jsonify({'error': 'Message is required'}), 400
             
             message = data['message']
             current_budget = data.get('current_budget', {})
             
-            print(f"🤖 Chatbot budget update request: {message}")
+            logger.info("Chatbot budget update request", extra={"update_message": message})
             
-            # Use chatbot service to process the update
-            from services.chatbot_service import ChatbotService
-            chatbot_service = ChatbotService()
+            # Use the app's chatbot service to process the update
+            chatbot_service = get_services().chatbot_service
             
             # Process the update
-            result = chatbot_service.process_chatbot_budget_update(message)
+            result = chatbot_service.process_chatbot_budget_update(message, current_user_id())
             
             if result['success']:
                 return jsonify({
@@ -75,12 +198,15 @@ def create_app():
                 }), 400
                 
         except Exception as e:
-            print(f"Error in chatbot budget update: {e}")
+            logger.exception("Error in chatbot budget update")
             return jsonify({'error': 'Failed to process budget update'}), 500
 
+    services.startup()
     return app
 
 if __name__ == '__main__':
+    if not Config.validate_config():
+        exit(1)
     app = create_app()
     # When running app.py directly, ensure the FLASK_APP environment variable is not strictly needed by Flask's auto-discovery
     # For development, Flask's built-in server is fine.
@@ -0,0 +1,419 @@
+"""ASGI entry point for the Flask backend.
+
+The LLM-bound routes (chat and budget plan generation) are served natively
+async with the AsyncGroq client, so thousands of in-flight model calls fit in
+one process. So are the budget push routes (/watch long-poll and /stream SSE)
+and plan job long-polls (/jobs/<id>?wait=), whose clients mostly sit waiting. Every other route is forwarded to the
+regular Flask app, so the synchronous endpoints and response formats stay
+exactly the same. Those run on a pool of ASGI_WSGI_THREADS threads rather
+than asgiref's single thread-sensitive one, so a slow synchronous request
+(geocoding, a simulation) does not hold up the others.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.http import parse_etags
+
+from app import create_app
+from config import Config
+from routes.budget_routes import (PLAN_JOB_NOT_FOUND, REQUIRED_QUESTIONNAIRE_FIELDS, plan_job_headers,
+                                  wants_async_job, watch_result)
+from routes.chatbot_routes import LEGACY_SHARED_SESSION, new_session_id
+from services.budget_store import DEFAULT_USER_ID
+from services.container import get_services
+from utils.admission import (EXTENSION_KEY as ADMISSION_KEY, ADMISSION_REJECTIONS, AdmissionRejected,
+                             rate_limit_key, rejection_body)
+from utils.structured_logging import request_id_var, set_request_id, reset_request_id
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# The undecorated body of WsgiToAsgiInstance.run_wsgi_app, which asgiref pins to one thread-sensitive thread
+_run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs requests on its own thread pool instead of one thread-sensitive thread"""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit, self.executor)(
+            scope, receive, send)
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, duplicate_header_limit, executor):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+flask_app = create_app()
+wsgi_pool = ThreadPoolExecutor(max_workers=max(1, Config.ASGI_WSGI_THREADS), thread_name_prefix='wsgi')
+wsgi_app = PooledWsgiToAsgi(flask_app, wsgi_pool)
+services = get_services(flask_app)
+admission = flask_app.extensions.get(ADMISSION_KEY)
+recorder = flask_app.extensions.get('traffic_recorder')
+
+
+NOT_AN_OBJECT = {"error": "Request body must be a JSON object"}
+
+
+async def _read_json(receive):
+    """Read the full request body and decode it as JSON (None if empty/invalid)"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def _send_json(send, payload, status=200, extra_headers=()):
+    """Send a JSON response with the same CORS header Flask-CORS would add"""
+    body = json.dumps(payload).encode('utf-8')
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'access-control-allow-origin', b'*'),
+        (b'x-request-id', (request_id_var.get() or '').encode('latin-1')),
+        *extra_headers,
+    ]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _request_cookies(scope):
+    """Parse the Cookie header of an ASGI scope into a dict"""
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            for part in value.decode('latin-1').split(';'):
+                if '=' in part:
+                    key, val = part.strip().split('=', 1)
+                    cookies[key] = val
+    return cookies
+
+
+def _client_address(scope):
+    """The caller's address, read from X-Forwarded-For past TRUSTED_PROXY_HOPS proxies as ProxyFix does"""
+    hops = Config.TRUSTED_PROXY_HOPS
+    if hops > 0:
+        forwarded = [value.decode('latin-1') for name, value in scope.get('headers', []) if name == b'x-forwarded-for']
+        hosts = [host.strip() for host in ','.join(forwarded).split(',') if host.strip()]
+        if len(hosts) >= hops:
+            return hosts[-hops]
+    return (scope.get('client') or (None,))[0]
+
+
+@asynccontextmanager
+async def _admitted(scope, send, session_id=None):
+    """Same admission control as the Flask routes; sends the 429/503 itself and yields False when rejected"""
+    if admission is None:
+        yield True
+        return
+    try:
+        ticket = await admission.admit_async(rate_limit_key(_user_id(scope), session_id, _client_address(scope)))
+    except AdmissionRejected as rejected:
+        ADMISSION_REJECTIONS.inc(route=scope['path'], reason=rejected.reason)
+        await _send_json(send, rejection_body(rejected), rejected.status,
+                         ((b'retry-after', str(rejected.retry_after).encode()),))
+        yield False
+        return
+    with ticket:
+        yield True
+
+
+def _load_session(scope):
+    """Contents of the Flask session cookie ({} when absent or not validly signed)"""
+    raw_cookie = _request_cookies(scope).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if raw_cookie:
+        try:
+            return flask_app.session_interface.get_signing_serializer(flask_app).loads(raw_cookie)
+        except Exception:
+            pass
+    return {}
+
+
+def _user_id(scope):
+    """Same lookup as budget_routes.current_user_id: X-User-Id header, then user_id query param"""
+    for name, value in scope.get('headers', []):
+        if name == b'x-user-id' and value:
+            return value.decode('latin-1')
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('user_id', [DEFAULT_USER_ID])[0] or DEFAULT_USER_ID
+
+
+async def chat(scope, receive, send):
+    """Async twin of POST /api/chatbot/chat, sharing the Flask session cookie"""
+    data = await _read_json(receive)
+    if data is not None and not isinstance(data, dict):
+        return await _send_json(send, NOT_AN_OBJECT, 400)
+    user_input = (data or {}).get('message')
+
+    # Reuse Flask's signed session cookie so both entry points see the same session
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+    session_data = _load_session(scope)
+    session_id = session_data.get('session_id')
+    if not session_id or session_id == LEGACY_SHARED_SESSION:
+        session_id = new_session_id()
+
+    if not user_input or not isinstance(user_input, str):
+        return await _send_json(send, {"error": "No message provided"}, 400)
+
+    # Rate limited by the cookie's session; clients without one yet count by address
+    async with _admitted(scope, send, session_data.get('session_id')) as admitted:
+        if not admitted:
+            return
+        response = await services.chatbot_service.get_chat_response_async(user_input, session_id, _user_id(scope))
+
+    extra_headers = ()
+    if session_data.get('session_id') != session_id:
+        session_data['session_id'] = session_id
+        cookie = f"{cookie_name}={serializer.dumps(session_data)}; HttpOnly; Path=/"
+        extra_headers = ((b'set-cookie', cookie.encode('latin-1')),)
+    await _send_json(send, {"reply": response}, 200, extra_headers)
+
+
+async def create_budget_plan(scope, receive, send):
+    """Async twin of POST /api/budget/plan"""
+    data = await _read_json(receive)
+    if not data:
+        return await _send_json(send, {"error": "No data provided"}, 400)
+    if not isinstance(data, dict):
+        return await _send_json(send, NOT_AN_OBJECT, 400)
+
+    if not all(field in data for field in REQUIRED_QUESTIONNAIRE_FIELDS):
+        return await _send_json(send, {"error": "Missing fields in questionnaire answers"}, 400)
+
+    await _generate_and_save_plan(scope, send, data)
+
+
+async def create_budget_from_questionnaire(scope, receive, send):
+    """Async twin of POST /api/budget/create-from-questionnaire"""
+    data = await _read_json(receive)
+    if not data:
+        return await _send_json(send, {"error": "No data provided"}, 400)
+    if not isinstance(data, dict):
+        return await _send_json(send, NOT_AN_OBJECT, 400)
+
+    await _generate_and_save_plan(scope, send, data)
+
+
+async def _generate_and_save_plan(scope, send, data):
+    async with _admitted(scope, send) as admitted:
+        if not admitted:
+            return
+        recommendation = await services.budget_service.get_budget_recommendation_async(data)
+    if not recommendation:
+        return await _send_json(send, {"error": "Failed to generate budget recommendation"}, 500)
+
+    # File I/O stays off the event loop
+    if await asyncio.to_thread(services.budget_service.save_budget_plan, data, recommendation, _user_id(scope)):
+        await _send_json(send, {
+            "message": "Budget plan created and saved successfully",
+            "questionnaire_answers": data,
+            "budget_plan": recommendation
+        }, 201)
+    else:
+        await _send_json(send, {"error": "Failed to save budget plan"}, 500)
+
+
+def _headers(scope):
+    return {name.decode('latin-1').title(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+def _query_args(scope):
+    return {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+
+def _number_arg(args, name, default, cast=float):
+    """Query parameter as a number, the default when missing or malformed (like request.args.get(type=))"""
+    try:
+        return cast(args[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _wants_async_job(scope):
+    return wants_async_job(_headers(scope), _query_args(scope))
+
+
+async def _send_empty(send, status, extra_headers=()):
+    headers = [
+        (b'access-control-allow-origin', b'*'),
+        (b'x-request-id', (request_id_var.get() or '').encode('latin-1')),
+        *extra_headers,
+    ]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def watch_budget_plan(scope, receive, send):
+    """Async twin of GET /api/budget/watch: a waiting client holds a suspended task, not a thread"""
+    args = _query_args(scope)
+    known_version = _number_arg(args, 'version', -1, int)
+    timeout = min(_number_arg(args, 'timeout', 25), Config.BUDGET_WATCH_MAX_TIMEOUT)
+
+    changed, plan, version = await services.budget_service.wait_for_budget_change_async(
+        known_version, timeout, _user_id(scope))
+    status, body, etag = watch_result(changed, plan, version, parse_etags(_headers(scope).get('If-None-Match')))
+    etag_header = ((b'etag', f'"{etag}"'.encode('latin-1')),) if etag else ()
+    if body is None:
+        return await _send_empty(send, status, etag_header)
+    await _send_json(send, body, status, etag_header)
+
+
+async def stream_budget_plan(scope, receive, send):
+    """Async twin of GET /api/budget/stream (Server-Sent Events)"""
+    user_id = _user_id(scope)
+    last_event_id = _headers(scope).get('Last-Event-Id') or _query_args(scope).get('version')
+    version = int(last_event_id) if last_event_id and last_event_id.isdigit() else -1
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+        (b'access-control-allow-origin', b'*'),
+        (b'x-request-id', (request_id_var.get() or '').encode('latin-1')),
+    ]})
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            change = asyncio.ensure_future(services.budget_service.wait_for_budget_change_async(
+                version, Config.BUDGET_PUSH_RECHECK, user_id))
+            await asyncio.wait({change, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                change.cancel()
+                return
+            changed, plan, version = change.result()
+            event = f"id: {version}\nevent: budget\ndata: {json.dumps(plan)}\n\n" if changed else ": keepalive\n\n"
+            await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+    finally:
+        disconnected.cancel()
+
+
+PLAN_JOB_PREFIX = '/api/budget/jobs/'
+PLAN_JOB_ROUTE = PLAN_JOB_PREFIX + '<job_id>'
+
+
+async def get_plan_job(scope, receive, send):
+    """Async twin of GET /api/budget/jobs/<id>?wait=: the long-poll sleeps on the loop, not in the WSGI thread"""
+    job_id = scope['path'][len(PLAN_JOB_PREFIX):]
+    wait = min(max(_number_arg(_query_args(scope), 'wait', 0), 0), Config.BUDGET_WATCH_MAX_TIMEOUT)
+    job = await services.plan_jobs.get_async(job_id, wait=wait)
+    if job is None or job['user_id'] != _user_id(scope):
+        return await _send_json(send, PLAN_JOB_NOT_FOUND, 404)
+    headers = tuple((name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in plan_job_headers(job).items())
+    await _send_json(send, job, 200, headers)
+
+
+def _wants_job_long_poll(scope):
+    return (scope['method'] == 'GET' and scope['path'].startswith(PLAN_JOB_PREFIX)
+            and _number_arg(_query_args(scope), 'wait', 0) > 0)
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/chatbot/chat'): chat,
+    ('POST', '/api/budget/plan'): create_budget_plan,
+    ('POST', '/api/budget/create-from-questionnaire'): create_budget_from_questionnaire,
+    ('GET', '/api/budget/watch'): watch_budget_plan,
+    ('GET', '/api/budget/stream'): stream_budget_plan,
+}
+PLAN_ROUTES = (create_budget_plan, create_budget_from_questionnaire)
+
+
+def _record_trace(scope, route, body, status, duration):
+    """Same trace line the Flask capture hook writes for this request"""
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        payload = None
+    query = _query_args(scope)
+    headers = dict(scope.get('headers', []))
+    client = _load_session(scope).get('session_id') or _client_address(scope)
+    recorder.record(time.time() - duration, scope['method'], route, query, payload, client,
+                    headers.get(b'x-user-id', b'').decode('latin-1') or query.get('user_id'), status, duration)
+
+
+async def app(scope, receive, send):
+    """Dispatch LLM and push routes to the async handlers and everything else to Flask"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                services.shutdown()
+                wsgi_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if handler in PLAN_ROUTES and _wants_async_job(scope):
+            handler = None  # Flask enqueues the job and answers 202 in milliseconds
+        elif handler is None and _wants_job_long_poll(scope):
+            handler = get_plan_job
+        if handler:
+            route = PLAN_JOB_ROUTE if handler is get_plan_job else scope['path']  # Job ids stay out of metric labels
+            # Each request runs in its own task, so the correlation id stays with it
+            incoming = dict(scope.get('headers', [])).get(b'x-request-id', b'').decode('latin-1')
+            _, token = set_request_id(incoming or None)
+            route_token = metrics.current_route.set(route)
+            started = time.perf_counter()
+            status = []
+            body = []
+
+            async def send_and_record_status(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                await send(message)
+
+            async def receive_and_keep_body():
+                message = await receive()
+                if recorder is not None:
+                    body.append(message.get('body', b''))
+                return message
+
+            try:
+                return await handler(scope, receive_and_keep_body, send_and_record_status)
+            finally:
+                duration = time.perf_counter() - started
+                metrics.REQUEST_LATENCY.observe(duration, method=scope['method'],
+                                                route=route, status=str(status[0] if status else 500))
+                if recorder is not None:
+                    try:
+                        _record_trace(scope, route, b''.join(body), status[0] if status else 500, duration)
+                    except Exception:
+                        logger.exception("Traffic capture failed", extra={"route": route})
+                metrics.current_route.reset(route_token)
+                reset_request_id(token)
+
+    await wsgi_app(scope, receive, send)
@@ -0,0 +1,332 @@
+"""Benchmarks for the Flask backend's hot functions and endpoints.
+
+Usage:
+    python benchmarks.py run --output bench.json            # everything
+    python benchmarks.py run --filter chat --quick          # subset, fewer repeats
+    python benchmarks.py compare baseline.json bench.json   # exit 1 on regressions
+
+Microbenchmarks time single service calls; endpoint benchmarks drive the
+Flask test client with Groq and Nominatim replaced by in-process stubs, so
+numbers reflect our code rather than network latency. The budget store,
+spend rollup and logs are pointed at a temporary directory.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import shutil
+import subprocess
+import tempfile
+import time
+import types
+
+_WORKDIR = tempfile.mkdtemp(prefix='budget-bench-')
+os.environ.setdefault('BUDGET_STORE_PATH', os.path.join(_WORKDIR, 'budget_plan.json'))
+os.environ.setdefault('SPEND_ROLLUP_PATH', os.path.join(_WORKDIR, 'spend_rollup.db'))
+os.environ.setdefault('SPEND_ROLLUP_INTERVAL', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('SECRET_KEY', 'benchmarks')
+os.environ.setdefault('ADMISSION_ENABLED', 'false')  # Measure the handlers, not the rate limits
+
+SAMPLE_PLAN = {
+    "Electronics & Accessories": 3500,
+    "Groceries & Household Items": 2000,
+    "Fashion & Beauty": 1800,
+    "Books & Media": 500,
+    "Home & Kitchen": 1200,
+    "Emergency/Unplanned Budget": 1000,
+    "total_budget": 10000,
+    "recommendations": ["Use Subscribe & Save for groceries", "Wait for Lightning Deals", "Track spending weekly"]
+}
+SAMPLE_ANSWERS = {
+    "age_group": "B) 26-35",
+    "monthly_budget": "10000",
+    "top_categories": ["Electronics & Accessories", "Groceries & Household Items"],
+    "shopping_behavior": "B) I compare prices before buying",
+    "unplanned_purchases": "B) Sometimes",
+    "primary_goal": "A) Save money"
+}
+LLM_PLAN_TEXT = "Here is your plan:\n" + json.dumps(SAMPLE_PLAN) + "\nLet me know if you need changes."
+LLM_CHAT_REPLY = (
+    "Here are a few ideas for your Electronics budget. 1. Look for bank offers on Prime Day. "
+    "2. Compare prices across sellers before buying. 3. Consider refurbished options for accessories. "
+    "Tips: keep ₹500 aside for unplanned purchases. Remember: you have ₹3,500 left this month!"
+)
+CITY_COORDINATES = {
+    "mumbai": (19.076, 72.8777), "delhi": (28.6139, 77.209), "bangalore": (12.9716, 77.5946),
+    "pune": (18.5204, 73.8567), "chennai": (13.0827, 80.2707), "hyderabad": (17.385, 78.4867),
+    "kolkata": (22.5726, 88.3639), "ahmedabad": (23.0225, 72.5714),
+}
+
+
+# --- stubs -------------------------------------------------------------------
+
+class _StubStream:
+    def __init__(self, text, size=24):
+        self._chunks = [text[i:i + size] for i in range(0, len(text), size)]
+
+    def __iter__(self):
+        for piece in self._chunks:
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=piece))])
+
+    def close(self):
+        pass
+
+
+class _StubCompletions:
+    def create(self, **request):
+        system = request['messages'][0]['content'] if request.get('messages') else ''
+        if request.get('stream'):
+            return _StubStream(json.dumps(SAMPLE_PLAN))
+        text = LLM_CHAT_REPLY if 'Budget Assistant' in system else LLM_PLAN_TEXT
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))],
+            usage=types.SimpleNamespace(prompt_tokens=400, completion_tokens=120))
+
+
+class StubGroq:
+    def __init__(self):
+        self.chat = types.SimpleNamespace(completions=_StubCompletions())
+
+    def close(self):
+        pass
+
+
+class StubGeocoder:
+    def geocode(self, city):
+        coordinates = CITY_COORDINATES.get(city.lower())
+        return types.SimpleNamespace(latitude=coordinates[0], longitude=coordinates[1]) if coordinates else None
+
+
+def build_app():
+    from app import create_app
+    from services.container import get_services
+
+    app = create_app()
+    services = get_services(app)
+    services.budget_service._client = StubGroq()
+    services.chatbot_service._client = StubGroq()
+    services.recommendation_service._geolocator = StubGeocoder()
+    services.budget_service.save_budget_plan(SAMPLE_ANSWERS, SAMPLE_PLAN)
+    return app, services
+
+
+# --- harness -----------------------------------------------------------------
+
+def time_function(fn, repeats, min_time):
+    """Per-call nanoseconds: loops are calibrated to `min_time` seconds, best/median over `repeats`"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - started) / loops * 1e9)
+    return {
+        "kind": "micro",
+        "loops": loops,
+        "min_ns": round(min(timings), 1),
+        "median_ns": round(statistics.median(timings), 1),
+        "mean_ns": round(statistics.fmean(timings), 1),
+    }
+
+
+def time_endpoint(client, method, path, requests, body=None, headers=None, setup=None):
+    """Latency percentiles and throughput for `requests` sequential calls
+
+    `setup`, when given, runs untimed before every call (e.g. to empty a cache).
+    """
+    send = getattr(client, method.lower())
+    for _ in range(min(20, requests)):
+        send(path, json=body, headers=headers)  # Warm caches and lazy services
+    latencies = []
+    status = None
+    total = 0.0
+    for _ in range(requests):
+        if setup:
+            setup()
+        call_started = time.perf_counter()
+        status = send(path, json=body, headers=headers).status_code
+        elapsed = time.perf_counter() - call_started
+        total += elapsed
+        latencies.append(elapsed * 1000)
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+
+    return {
+        "kind": "endpoint",
+        "requests": requests,
+        "status": status,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "throughput_rps": round(requests / total, 1),
+    }
+
+
+# --- benchmarks --------------------------------------------------------------
+
+def micro_benchmarks(services):
+    recommendation = services.recommendation_service
+    chatbot = services.chatbot_service
+    budget = services.budget_service
+    products = recommendation.catalog.snapshot.products['laptop bag']
+    long_reply = LLM_CHAT_REPLY * 3
+
+    return {
+        "recommendation.calculate_distance":
+            lambda: recommendation._calculate_distance(19.076, 72.8777, 28.6139, 77.209),
+        "recommendation.rank_products":
+            lambda: recommendation._get_best_product_by_distance_and_price(products, 19.076, 72.8777),
+        "recommendation.distance_based_recommendations":
+            lambda: recommendation.get_distance_based_recommendations("laptop", "Mumbai"),
+        "chatbot.parse_budget_update_request":
+            lambda: chatbot._parse_budget_update_request("increase my electronics budget to 5000"),
+        "chatbot.parse_budget_update_request.no_match":
+            lambda: chatbot._parse_budget_update_request("what are good deals on headphones?"),
+        "chatbot.format_ai_response.short":
+            lambda: chatbot._format_ai_response("Tips: 1. Compare prices. 2. Use coupons."),
+        "chatbot.format_ai_response.long":
+            lambda: chatbot._format_ai_response(long_reply),
+        "chatbot.get_base_prompt":
+            lambda: chatbot._get_base_prompt(),
+        "budget.clean_budget_response":
+            lambda: budget._clean_budget_response(LLM_PLAN_TEXT),
+        "budget.clean_budget_response.lines":
+            lambda: budget._clean_budget_response("Electronics: ₹3,500\nGroceries: ₹2,000\nBooks: 500"),
+    }
+
+
+def endpoint_benchmarks(services):
+    # The miss case empties the recommendation cache before every call so each one generates a plan
+    clear_plan_cache = services.budget_service._recommendation_cache.clear
+    return {
+        "GET /api/budget/plan": ('GET', '/api/budget/plan', None, None, None),
+        "GET /api/budget/plan (304)": ('GET', '/api/budget/plan', None, 'etag', None),
+        "GET /api/chatbot/current_budget": ('GET', '/api/chatbot/current_budget', None, None, None),
+        "POST /api/chatbot/chat": ('POST', '/api/chatbot/chat', {"message": "How should I spend on electronics?"}, None, None),
+        "POST /api/budget/plan (cache miss)": ('POST', '/api/budget/plan', SAMPLE_ANSWERS, None, clear_plan_cache),
+        "POST /api/budget/plan (cache hit)": ('POST', '/api/budget/plan', SAMPLE_ANSWERS, None, None),
+        "GET /api/recommendations": ('GET', '/api/recommendations/?product=laptop&city=Mumbai', None, None, None),
+        "GET /api/budget/questionnaire": ('GET', '/api/budget/questionnaire', None, None, None),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    app, services = build_app()
+    client = app.test_client()
+    repeats = 3 if args.quick else args.repeats
+    min_time = 0.05 if args.quick else args.min_time
+    requests = 100 if args.quick else args.requests
+    results = {}
+
+    for name, fn in micro_benchmarks(services).items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_function(fn, repeats, min_time)
+        print(f"{name:55s} {results[name]['median_ns'] / 1000:10.2f} µs")
+
+    for name, (method, path, body, headers, setup) in endpoint_benchmarks(services).items():
+        if args.filter and args.filter not in name:
+            continue
+        if headers == 'etag':
+            headers = {'If-None-Match': client.get(path).headers.get('ETag', '')}
+        results[name] = time_endpoint(client, method, path, requests, body, headers, setup)
+        r = results[name]
+        print(f"{name:55s} p50 {r['p50_ms']:7.3f} ms  p99 {r['p99_ms']:7.3f} ms  {r['throughput_rps']:8.1f} req/s")
+
+    services.shutdown()
+    shutil.rmtree(_WORKDIR, ignore_errors=True)
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeats": repeats,
+            "requests": requests,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+def primary_metric(result):
+    return result['median_ns'] if result['kind'] == 'micro' else result['p50_ms']
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'benchmark':55s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for name in sorted(set(baseline) & set(current)):
+        before, after = primary_metric(baseline[name]), primary_metric(current[name])
+        change = (after - before) / before if before else 0.0
+        unit = 'ns' if current[name]['kind'] == 'micro' else 'ms'
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif change < -args.threshold:
+            flag = '  faster'
+        print(f"{name:55s} {before:10.2f}{unit} {after:10.2f}{unit} {change:+7.1%}{flag}")
+    for name in sorted(set(current) - set(baseline)):
+        print(f"{name:55s} {'(new)':>12s}")
+    for name in sorted(set(baseline) - set(current)):
+        print(f"{name:55s} {'(missing)':>12s}")
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run benchmarks")
+    run_parser.add_argument('--output', help="Write results as JSON")
+    run_parser.add_argument('--filter', help="Only benchmarks whose name contains this text")
+    run_parser.add_argument('--repeats', type=int, default=7, help="Timed repeats per microbenchmark")
+    run_parser.add_argument('--min-time', type=float, default=0.2, help="Seconds per microbenchmark repeat")
+    run_parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint benchmark")
+    run_parser.add_argument('--quick', action='store_true', help="Fewer repeats/requests for a smoke run")
+
+    compare_parser = commands.add_parser('compare', help="Compare two result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help="Relative slowdown that counts as a regression (default 0.10)")
+
+    args = parser.parse_args()
+    return run(args) if args.command == 'run' else compare(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,33 @@
+"""Generate budget plans in bulk from a CSV export of questionnaire answers.
+
+Usage:
+    python bulk_plans.py answers.csv plans.jsonl --concurrency 8 --rate 4
+
+Rerunning with the same output file resumes where the last run stopped.
+"""
+import argparse
+import json
+
+from services.budget_service import BudgetService
+from services.bulk_plan_service import BulkPlanPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk budget-plan generation")
+    parser.add_argument('input', help="CSV with questionnaire answer columns")
+    parser.add_argument('output', help="JSONL file to append plans to (also the resume checkpoint)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Parallel recommendation calls")
+    parser.add_argument('--rate', type=float, default=2.0, help="Max recommendation calls per second (0 = unlimited)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="CSV rows read per chunk")
+    parser.add_argument('--id-column', default='user_id', help="Column identifying each row")
+    args = parser.parse_args()
+
+    pipeline = BulkPlanPipeline(BudgetService(), concurrency=args.concurrency, rate_per_sec=args.rate,
+                                chunk_size=args.chunk_size, id_column=args.id_column)
+    stats = pipeline.run(args.input, args.output)
+    print(json.dumps(stats, indent=2))
+    return 0 if stats['status'] == 'completed' else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
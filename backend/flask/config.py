@@ -1,4 +1,5 @@
 import os
+import logging
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -7,13 +8,122 @@ load_dotenv()
 class Config:
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+    # Budget plan storage: "json" (budget_plan.json), "sqlite" (per-user rows, WAL)
+    # or "log" (append-only change log + snapshots)
+    BUDGET_STORE = os.getenv("BUDGET_STORE", "json").lower()
+    BUDGET_STORE_PATH = os.getenv("BUDGET_STORE_PATH")  # Defaults to budget_plan.json / budget_plans.db / budget_log/
+    BUDGET_SNAPSHOT_EVERY = int(os.getenv("BUDGET_SNAPSHOT_EVERY", "1000"))  # log records between snapshots
+
+    # Push notifications (/api/budget/watch long-poll and /api/budget/stream SSE)
+    BUDGET_WATCH_MAX_TIMEOUT = int(os.getenv("BUDGET_WATCH_MAX_TIMEOUT", "55"))  # seconds
+    BUDGET_PUSH_RECHECK = int(os.getenv("BUDGET_PUSH_RECHECK", "15"))  # store recheck for writes from other workers
+    # Waiting watch/stream clients per process under a sync server (each holds a thread); more get 503.
+    # asgi.py serves both routes on the event loop, where waiting costs no thread
+    BUDGET_WATCH_MAX_WAITERS = int(os.getenv("BUDGET_WATCH_MAX_WAITERS", "4"))
+    # Threads asgi.py runs the synchronous Flask routes on (the same concurrency as gunicorn's WEB_THREADS)
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", os.getenv("WEB_THREADS", "8")))
+
+    # Budget recommendation result cache (identical questionnaire answers share one plan)
+    BUDGET_CACHE_SIZE = int(os.getenv("BUDGET_CACHE_SIZE", "256"))
+    BUDGET_CACHE_TTL = int(os.getenv("BUDGET_CACHE_TTL", "3600"))  # seconds
+    BUDGET_DELTA_HISTORY = int(os.getenv("BUDGET_DELTA_HISTORY", "1024"))  # plan versions kept for ?since= deltas
+    # Round monthly_budget to this many rupees for cache lookups (0 = exact amount)
+    BUDGET_AMOUNT_BUCKET = int(os.getenv("BUDGET_AMOUNT_BUCKET", "0"))
+
+    # "llm": the model writes the whole plan (local allocator is the fallback)
+    # "local": the rule-based allocator writes the split, the model only adds tips
+    BUDGET_ALLOCATION_MODE = os.getenv("BUDGET_ALLOCATION_MODE", "llm").lower()
+    BUDGET_LLM_TIPS = os.getenv("BUDGET_LLM_TIPS", "true").lower() == "true"
+
+    # JSON-mode streamed plan generation with incremental validation
+    BUDGET_STRUCTURED_OUTPUT = os.getenv("BUDGET_STRUCTURED_OUTPUT", "true").lower() == "true"
+    BUDGET_PLAN_MAX_TOKENS = int(os.getenv("BUDGET_PLAN_MAX_TOKENS", "400"))
+    BUDGET_PLAN_MAX_ATTEMPTS = int(os.getenv("BUDGET_PLAN_MAX_ATTEMPTS", "2"))
+
+    # Background plan generation: POST /api/budget/plan with "Prefer: respond-async" returns 202 and a job id
+    BUDGET_PLAN_ASYNC = os.getenv("BUDGET_PLAN_ASYNC", "false").lower() == "true"  # 202 even without the header
+    PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "4"))  # plans generated at once, per process
+    PLAN_JOB_MAX_PENDING = int(os.getenv("PLAN_JOB_MAX_PENDING", "64"))  # queued beyond that before 503
+    PLAN_JOB_TTL = int(os.getenv("PLAN_JOB_TTL", "3600"))  # seconds a job (and its Idempotency-Key) is kept
+    PLAN_JOB_STALE_AFTER = int(os.getenv("PLAN_JOB_STALE_AFTER", "300"))  # no progress -> reported as failed
+
+    # Bulk plan generation (/api/budget/bulk and bulk_plans.py)
+    BULK_JOBS_DIR = os.getenv("BULK_JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bulk_jobs'))
+    BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "8"))
+    BULK_RATE_PER_SEC = float(os.getenv("BULK_RATE_PER_SEC", "2"))
+    BULK_JOB_TTL = int(os.getenv("BULK_JOB_TTL", "86400"))  # seconds a finished job and its files are kept
+
+    # Spend-vs-budget rollup fed by the Express order database (/api/budget/spending)
+    ORDERS_DB_PATH = os.getenv("ORDERS_DB_PATH", os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'express', 'prisma', 'dev.db'))
+    SPEND_ROLLUP_PATH = os.getenv("SPEND_ROLLUP_PATH")  # Defaults to spend_rollup.db
+    SPEND_ROLLUP_INTERVAL = int(os.getenv("SPEND_ROLLUP_INTERVAL", "30"))  # seconds between ingests (0 = off)
+    SPEND_ROLLUP_LOOKBACK = int(os.getenv("SPEND_ROLLUP_LOOKBACK", "86400"))  # re-read window for late orders
+    # Express user whose orders count against the "default" budget (empty = all orders)
+    SPEND_DEFAULT_ORDER_USER = os.getenv("SPEND_DEFAULT_ORDER_USER", "")
+
+    # Recommendation catalog (related items and products); edits are picked up without a restart
+    CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json'))
+    CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "10"))  # seconds between file checks (0 = off)
+
+    # Known cities for /api/recommendations/cities and for normalizing the recommendation `city` parameter
+    CITIES_PATH = os.getenv("CITIES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cities.json'))
+    # Cities not in the list as typed: "geocode" (ask Nominatim for the text first, e.g. for towns missing
+    # from the list, and fall back to a typo correction) or "reject" (correct typos, else 400 with
+    # suggestions, never calling the geocoder for unknown names)
+    CITY_UNKNOWN_POLICY = os.getenv("CITY_UNKNOWN_POLICY", "geocode").lower()
+
+    # Logging: records go through a background queue; DEBUG events are sampled
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # Opt-in request profiling: send "X-Profile: <PROFILE_TOKEN or 1>" or set a sample rate
+    PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "sample").lower()  # "sample" (collapsed stacks) or "cprofile" (pstats)
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # fraction of requests profiled unasked
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # when set, X-Profile must carry this value
+
+    # Admission control for LLM-backed routes (chat, plan generation, chatbot budget updates); per process
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))  # LLM requests in flight
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))  # requests allowed to wait for a slot
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))  # seconds before a waiter gets 503
+    ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "10"))  # LLM requests/second (0 = unlimited)
+    ADMISSION_GLOBAL_BURST = int(os.getenv("ADMISSION_GLOBAL_BURST", "20"))
+    ADMISSION_SESSION_RATE = float(os.getenv("ADMISSION_SESSION_RATE", "0.5"))  # per user id, chat session or address
+    ADMISSION_SESSION_BURST = int(os.getenv("ADMISSION_SESSION_BURST", "5"))
+    # Reverse proxies in front of the app that append to X-Forwarded-For (0 = clients connect directly).
+    # Sessionless callers are rate limited by address, so behind a proxy or load balancer set this,
+    # or they all share the proxy's address and one bucket
+    TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+    # Sanitized request traces for replay_traffic.py (empty path = capture off)
+    TRACE_CAPTURE_PATH = os.getenv("TRACE_CAPTURE_PATH", "")
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))  # fraction of clients recorded
+
+    # Flask session signing key; must be the same in every worker (and across restarts) for chat sessions
+    SECRET_KEY = os.getenv("SECRET_KEY")
+
+    # Chat sessions, pending budget confirmations and plan caches: "memory" (this process only)
+    # or "sqlite" (shared by worker processes on the host; gunicorn.conf.py selects it)
+    SHARED_STATE = os.getenv("SHARED_STATE", "memory").lower()
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH")  # Defaults to shared_state.db
+    CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "86400"))  # idle seconds before a conversation is dropped
+    CHAT_PENDING_TTL = int(os.getenv("CHAT_PENDING_TTL", "900"))  # seconds a budget change waits for "yes"
+
+    # Build every service in create_app instead of on first request (e.g. before forking workers)
+    EAGER_SERVICES = os.getenv("EAGER_SERVICES", "false").lower() == "true"
+
     @staticmethod
     def validate_config():
+        """Warn about missing settings; returns False when the LLM features cannot work"""
         if not Config.GROQ_API_KEY:
-            print("❌ Error: GROQ_API_KEY not found in environment variables.")
-            print("Please create a .env file in the 'amazon_budget_app' directory with your API key.")
-            print("Example .env content: GROQ_API_KEY=your_api_key_here")
-            exit(1)
-
-# Validate configuration on import
-Config.validate_config()
+            logging.getLogger(__name__).error(
+                "GROQ_API_KEY not found in environment variables. Please create a .env file in the "
+                "'amazon_budget_app' directory with your API key (GROQ_API_KEY=your_api_key_here).")
+            return False
+        return True
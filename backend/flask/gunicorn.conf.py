@@ -0,0 +1,56 @@
+"""Gunicorn settings for serving the API with several worker processes.
+
+Usage:
+    SECRET_KEY=... gunicorn -c gunicorn.conf.py
+    WEB_CONCURRENCY=8 WEB_THREADS=8 gunicorn -c gunicorn.conf.py
+
+The app is imported and created once in the master (preload_app) and the
+workers are forked from it, so modules load once and pages are shared
+copy-on-write. Services (Groq clients, stores) are still built lazily in
+each worker on first use. Chat sessions, pending budget confirmations and
+plan caches live in the SQLite shared state store so any worker can serve
+any request; SECRET_KEY must be set so session cookies verify on every
+worker. Metrics on /metrics are per worker.
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(HERE, '.env'))
+# Per-process state would split sessions between workers; .env or the environment can still override
+os.environ.setdefault('SHARED_STATE', 'sqlite')
+
+chdir = HERE
+wsgi_app = 'app:create_app()'
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Requests mostly wait on Groq/Nominatim, so each worker also runs a few threads
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '8'))
+# Let LLM routes use at most half of each worker's threads (plus a short queue), so cheap
+# endpoints always find a free thread during a burst of chat/plan traffic
+os.environ.setdefault('ADMISSION_MAX_CONCURRENT', str(max(1, threads // 2)))
+os.environ.setdefault('ADMISSION_MAX_QUEUE', str(max(1, threads // 4)))
+# Long-poll and SSE clients park a thread each; cap them at a quarter of the threads
+os.environ.setdefault('BUDGET_WATCH_MAX_WAITERS', str(max(1, threads // 4)))
+preload_app = True
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))  # streamed plan generation can take a while
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '5000'))
+max_requests_jitter = 500
+accesslog = os.getenv('WEB_ACCESS_LOG')  # Request logs already come from the app; set to "-" for stdout
+
+
+def on_starting(server):
+    from config import Config
+    if not Config.SECRET_KEY:
+        raise SystemExit("SECRET_KEY must be set when running several workers (chat sessions are "
+                         "signed cookies and every worker has to verify them)")
+    if Config.SHARED_STATE == 'memory' and workers > 1:
+        server.log.warning("SHARED_STATE=memory with %d workers: chat sessions will not be shared", workers)
+    if Config.BUDGET_STORE == 'json':
+        server.log.info("BUDGET_STORE=json: fine for a few workers; use sqlite for heavier write load")
@@ -0,0 +1,271 @@
+"""Replay captured traffic to size capacity before peak sale events.
+
+Usage:
+    # Traces from TRACE_CAPTURE_PATH (several files from forked workers are merged)
+    python replay_traffic.py replay trace.jsonl trace.*.jsonl --speed 4 --concurrency 32
+    python replay_traffic.py replay trace.jsonl --target http://staging:5000 --output report.json
+
+    # A trace following the sample.txt flow (questionnaire -> plan -> recommendations -> chat)
+    python replay_traffic.py synthesize trace.jsonl --sessions 200 --arrival-rate 2
+
+Requests are sent at their recorded offsets divided by --speed, through at
+most --concurrency connections; each traced session gets its own cookie jar.
+Without --target the app runs in this process with Groq and the geocoder
+stubbed (see benchmarks.py), which measures our own overhead; with a target
+it measures the real deployment. The report gives p50/p95/p99 latency,
+error rate and rejections (429/503 from admission control) per route, plus
+how far sends fell behind schedule.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CHAT_PROMPTS = [
+    "How can I save money on groceries?",
+    "What's my current budget?",
+    "Suggest a good laptop within my electronics budget",
+    "Increase my fashion budget to 2500",
+    "Any deals on books this week?",
+    "What if I cut my fashion budget by 1000?",
+]
+QUESTIONNAIRE_CHOICES = {
+    "age_group": ["A) 18-25", "B) 26-35", "C) 36-45", "D) 46+"],
+    "shopping_behavior": ["A) I plan purchases and stick to budget", "B) I impulse buy when I see deals",
+                          "C) I buy essentials first, then extras if budget allows"],
+    "unplanned_purchases": ["A) 0-1", "B) 2-4", "C) 5+"],
+    "primary_goal": ["A) Save money for other priorities", "B) Avoid overspending and debt",
+                     "C) Better track where my money goes", "D) Plan for upcoming major purchases"],
+    "top_categories": ["Electronics & Accessories", "Groceries & Household Items", "Fashion & Beauty",
+                       "Books & Media", "Home & Kitchen"],
+}
+PRODUCTS = ["laptop", "phone", "book"]
+CITIES = ["Mumbai", "Delhi", "Bangalore", "Pune", "Chennai", "Hyderabad"]
+
+
+def load_traces(paths):
+    traces = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            traces.extend(json.loads(line) for line in f if line.strip())
+    traces.sort(key=lambda trace: trace['ts'])
+    return traces
+
+
+def materialize(value, field=None):
+    """Turn a sanitized body shape back into a concrete value"""
+    if isinstance(value, dict):
+        if '$str' in value:
+            length = value['$str']
+            text = random.choice(CHAT_PROMPTS) if field == 'message' else 'x'
+            return (text * (length // len(text) + 1))[:length]
+        return {key: materialize(item, key) for key, item in value.items()}
+    if isinstance(value, list):
+        return [materialize(item, field) for item in value]
+    return value
+
+
+def synthesize(args):
+    """Write a trace of the sample.txt call sequence for --sessions simulated shoppers"""
+    rng = random.Random(args.seed)
+    start = time.time()
+    traces = []
+    arrival = 0.0
+    for number in range(args.sessions):
+        arrival += rng.expovariate(args.arrival_rate)
+        session = f"synthetic-{number}"
+        t = arrival
+
+        def add(method, route, query=None, body=None):
+            traces.append({"ts": round(start + t, 3), "method": method, "route": route, "query": query or {},
+                           "body": body, "session": session})
+
+        add('GET', '/api/budget/questionnaire')
+        t += rng.uniform(10, 40)  # Filling in the questionnaire
+        answers = {field: rng.choice(options) for field, options in QUESTIONNAIRE_CHOICES.items()
+                   if field != 'top_categories'}
+        answers['top_categories'] = rng.sample(QUESTIONNAIRE_CHOICES['top_categories'], 2)
+        answers['monthly_budget'] = rng.choice([5000, 10000, 20000, 50000])
+        add('POST', '/api/budget/plan', body=answers)
+        for _ in range(rng.randint(1, 3)):
+            t += rng.uniform(3, 20)
+            add('GET', '/api/recommendations/', {"product": rng.choice(PRODUCTS), "city": rng.choice(CITIES)})
+        for _ in range(rng.randint(1, 4)):
+            t += rng.uniform(5, 30)
+            add('POST', '/api/chatbot/chat', body={"message": {"$str": rng.randint(15, 80)}})
+        t += rng.uniform(1, 10)
+        add('GET', '/api/budget/plan')
+
+    traces.sort(key=lambda trace: trace['ts'])
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for trace in traces:
+            f.write(json.dumps(trace, ensure_ascii=False) + '\n')
+    print(f"Wrote {len(traces)} requests for {args.sessions} sessions over "
+          f"{traces[-1]['ts'] - traces[0]['ts']:.0f}s to {args.output}")
+    return 0
+
+
+class HttpClient:
+    """One traced session against a running server (keeps its own cookies)"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def send(self, method, path, query, body, headers):
+        url = self.base_url + path + ('?' + urllib.parse.urlencode(query) if query else '')
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers=headers)
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class InProcessClient:
+    """One traced session against the app in this process (Flask test client)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, method, path, query, body, headers):
+        return self.client.open(path, method=method, query_string=query, json=body, headers=headers).status_code
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))], 2)
+
+
+def replay(args):
+    traces = load_traces(args.traces)
+    if args.limit:
+        traces = traces[:args.limit]
+    if not traces:
+        raise SystemExit("No requests in the trace files")
+
+    if args.target:
+        make_client = lambda: HttpClient(args.target, args.timeout)
+    else:
+        import benchmarks
+        app, services = benchmarks.build_app()
+        make_client = lambda: InProcessClient(app)
+
+    clients = {}
+    lock = threading.Lock()
+    results = {}   # route -> list of (latency_ms, status or None)
+    lags = []
+    skipped = 0
+
+    def run(trace, scheduled):
+        lag = time.perf_counter() - scheduled
+        with lock:
+            client = clients.get(trace['session'])
+            if client is None:
+                client = clients[trace['session']] = make_client()
+        headers = {'X-User-Id': trace['user']} if trace.get('user') else {}
+        query = {key: materialize(value) for key, value in (trace.get('query') or {}).items()}
+        body = materialize(trace['body']) if trace.get('body') is not None else None
+        started = time.perf_counter()
+        try:
+            status = client.send(trace['method'], trace['route'], query, body, headers)
+        except Exception:
+            status = None  # Connection error or timeout
+        latency = (time.perf_counter() - started) * 1000
+        with lock:
+            results.setdefault(f"{trace['method']} {trace['route']}", []).append((latency, status))
+            lags.append(lag * 1000)
+
+    first_ts = traces[0]['ts']
+    duration = (traces[-1]['ts'] - first_ts) / args.speed
+    print(f"Replaying {len(traces)} requests over {duration:.1f}s ({args.speed}x) "
+          f"with concurrency {args.concurrency} against {args.target or 'in-process app'}")
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for trace in traces:
+            if '<' in trace['route']:
+                skipped += 1  # Routes with path parameters (job ids) cannot be replayed
+                continue
+            scheduled = began + (trace['ts'] - first_ts) / args.speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, trace, scheduled)
+    elapsed = time.perf_counter() - began
+
+    report = {"requests": sum(len(samples) for samples in results.values()), "skipped": skipped,
+              "elapsed_s": round(elapsed, 2), "speed": args.speed, "concurrency": args.concurrency,
+              "target": args.target or "in-process", "routes": {}}
+    lags.sort()
+    report["schedule_lag_ms"] = {"p50": percentile(lags, 0.50), "p99": percentile(lags, 0.99)}
+
+    print(f"\n{'route':45s} {'count':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'errors':>7s} {'rejected':>9s}")
+    for route, samples in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, status in samples if status is None or (status >= 500 and status != 503))
+        rejected = sum(1 for _, status in samples if status in (429, 503))
+        report["routes"][route] = {
+            "count": len(samples),
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "error_rate": round(errors / len(samples), 4),
+            "rejected_rate": round(rejected / len(samples), 4),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        }
+        r = report["routes"][route]
+        print(f"{route:45s} {r['count']:6d} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} "
+              f"{r['error_rate']:7.1%} {r['rejected_rate']:9.1%}")
+    print(f"\nSchedule lag p50 {report['schedule_lag_ms']['p50']} ms, p99 {report['schedule_lag_ms']['p99']} ms "
+          f"(high lag: --concurrency is the bottleneck, not the server)")
+    if skipped:
+        print(f"Skipped {skipped} request(s) to routes with path parameters")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if not args.target:
+        services.shutdown()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traffic trace replay")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help="Replay trace files and report latency per route")
+    replay_parser.add_argument('traces', nargs='+', help="JSONL trace files (merged by timestamp)")
+    replay_parser.add_argument('--target', help="Base URL of a running server (default: in-process app, LLM stubbed)")
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="Time compression: 4 replays 4x faster")
+    replay_parser.add_argument('--concurrency', type=int, default=16, help="Requests in flight at most")
+    replay_parser.add_argument('--timeout', type=float, default=60, help="Per-request timeout with --target")
+    replay_parser.add_argument('--limit', type=int, help="Only the first N requests")
+    replay_parser.add_argument('--output', help="Write the report as JSON")
+
+    synth_parser = commands.add_parser('synthesize', help="Write a trace of the sample.txt call flow")
+    synth_parser.add_argument('output')
+    synth_parser.add_argument('--sessions', type=int, default=100, help="Simulated shoppers")
+    synth_parser.add_argument('--arrival-rate', type=float, default=1.0, help="New sessions per second")
+    synth_parser.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args()
+    return replay(args) if args.command == 'replay' else synthesize(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
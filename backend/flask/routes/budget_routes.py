@@ -1,10 +1,116 @@
-from flask import Blueprint, request, jsonify
-from services.budget_service import BudgetService  # Changed from relative to absolute import
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
+from services.container import service_proxy
+from services.budget_store import BudgetVersionConflict, DEFAULT_USER_ID
+from services.bulk_plan_service import BulkPlanPipeline
+from services.plan_jobs import PlanJobConflict, PlanQueueFull
+from services.budget_simulator import plan_categories
+from services.spend_rollup import get_spend_rollup
+from utils.admission import admission_controlled
+from utils.http_cache import conditional_plan_response, parse_plan_version, plan_etag
+from config import Config
 import os  # Import os module
 import json  # Import json module
+import calendar
+import datetime
+import math
+import threading
+import uuid
 
 budget_bp = Blueprint('budget_bp', __name__, url_prefix='/api/budget')
-budget_service = BudgetService()
+budget_service = service_proxy('budget_service')  # Built on first request, not at import
+plan_jobs = service_proxy('plan_jobs')
+bulk_jobs = service_proxy('bulk_jobs')
+
+# Sync workers park a thread per watch/stream client or job long-poll; beyond this many, new ones are turned away
+watch_slots = threading.BoundedSemaphore(max(1, Config.BUDGET_WATCH_MAX_WAITERS))
+
+REQUIRED_QUESTIONNAIRE_FIELDS = ["age_group", "monthly_budget", "top_categories", "shopping_behavior", "unplanned_purchases", "primary_goal"]
+
+def current_user_id():
+    """User whose plan a request targets (X-User-Id header or user_id query param)"""
+    return request.headers.get('X-User-Id') or request.args.get('user_id') or DEFAULT_USER_ID
+
+def expected_version(data):
+    """Optional compare-and-swap version from the body or an If-Match header.
+
+    Raises ValueError when the value is not a plan version or one of our ETags.
+    """
+    if isinstance(data, dict) and data.get('version') is not None:
+        return parse_plan_version(data['version'])
+    if_match = request.headers.get('If-Match')
+    if if_match is None or if_match.strip() == '*':
+        return None
+    return parse_plan_version(if_match)
+
+def invalid_version_response():
+    return jsonify({
+        "success": False,
+        "error": "version / If-Match must be a plan version or an ETag such as \"budget-v3\""
+    }), 400
+
+def version_conflict_response(conflict, data):
+    # A failed If-Match precondition is 412; a stale version in the body is a 409 conflict
+    status = 409 if isinstance(data, dict) and data.get('version') is not None else 412
+    return jsonify({
+        "success": False,
+        "error": "Budget plan was modified by another request",
+        "expected_version": conflict.expected,
+        "current_version": conflict.actual
+    }), status
+
+def watch_result(changed, plan, version, if_none_match):
+    """(status, body, etag) for a finished /watch wait; shared with the async handler in asgi.py
+
+    A timeout answers 304 only to a conditional request (If-None-Match naming
+    the current plan) and 204 otherwise; either way the ETag carries the version.
+    """
+    etag = plan_etag(plan) if plan else None
+    if changed and plan:
+        return 200, plan, etag
+    if changed:
+        return 404, {"message": "No budget plan found. Please create one first.", "version": version}, None
+    if etag and if_none_match.contains(etag):
+        return 304, None, etag
+    return 204, None, etag
+
+def waiters_full_response():
+    response = jsonify({"error": "Too many clients are waiting for budget changes; please retry shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+def wants_async_job(headers, args):
+    """Client asked for 202 + job id instead of waiting for the plan ("Prefer: respond-async" or ?async=1)"""
+    return (Config.BUDGET_PLAN_ASYNC or 'respond-async' in headers.get('Prefer', '').lower()
+            or args.get('async', '').lower() in ('1', 'true'))
+
+PLAN_JOB_NOT_FOUND = {"error": "Job not found (finished jobs are kept for PLAN_JOB_TTL seconds)"}
+
+def plan_job_headers(job):
+    """Location, plus Retry-After while the job is unfinished; shared with the async handler in asgi.py"""
+    headers = {'Location': f"/api/budget/jobs/{job['id']}"}
+    if job['status'] in ('queued', 'running'):
+        headers['Retry-After'] = '1'
+    return headers
+
+def plan_job_response(job, status):
+    response = jsonify(job)
+    response.status_code = status
+    response.headers.update(plan_job_headers(job))
+    return response
+
+def enqueue_plan_job(data):
+    """202 with the job for these answers; a retry (same Idempotency-Key or same answers in flight) gets the same job"""
+    try:
+        job, _ = plan_jobs.submit(data, current_user_id(), request.headers.get('Idempotency-Key'))
+    except PlanJobConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except PlanQueueFull as e:
+        response = jsonify({"error": "Too many plans are being generated; please try again shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return plan_job_response(job, 202 if job['status'] in ('queued', 'running') else 200)
 
 @budget_bp.route('/questionnaire', methods=['GET'])
 def get_questionnaire():
@@ -12,21 +118,26 @@ def get_questionnaire():
     return jsonify(schema), 200
 
 @budget_bp.route('/plan', methods=['POST'])
+@admission_controlled
 def create_budget_plan():
     data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     
     # Basic validation (can be more thorough)
-    required_fields = ["age_group", "monthly_budget", "top_categories", "shopping_behavior", "unplanned_purchases", "primary_goal"]
-    if not all(field in data for field in required_fields):
+    if not all(field in data for field in REQUIRED_QUESTIONNAIRE_FIELDS):
         return jsonify({"error": "Missing fields in questionnaire answers"}), 400
 
+    if wants_async_job(request.headers, request.args):
+        return enqueue_plan_job(data)
+
     recommendation = budget_service.get_budget_recommendation(data)
     if not recommendation:
         return jsonify({"error": "Failed to generate budget recommendation"}), 500
     
-    if budget_service.save_budget_plan(data, recommendation):
+    if budget_service.save_budget_plan(data, recommendation, current_user_id()):
         return jsonify({
             "message": "Budget plan created and saved successfully",
             "questionnaire_answers": data,
@@ -37,14 +148,15 @@ def create_budget_plan():
 
 @budget_bp.route('/plan', methods=['GET'])
 def get_budget_plan():
-    plan = budget_service.load_budget_plan()
+    user_id = current_user_id()
+    plan = budget_service.load_budget_plan(user_id=user_id)
     if plan:
-        return jsonify(plan), 200
+        return conditional_plan_response(plan, budget_service, user_id)
     return jsonify({"message": "No budget plan found. Please create one first."}), 404
 
 @budget_bp.route('/plan', methods=['DELETE'])
 def reset_budget_plan():
-    if budget_service.reset_budget_file():
+    if budget_service.reset_budget_file(current_user_id()):
         return jsonify({"message": "Budget plan reset successfully."}), 200
     return jsonify({"error": "Failed to reset budget plan."}), 500
 
@@ -53,6 +165,7 @@ def get_budget_file_path():
     """Debug endpoint to check file paths"""
     return jsonify({
         "current_directory": os.getcwd(),
+        "budget_store": Config.BUDGET_STORE,
         "budget_file_path": budget_service.budget_file_path,
         "file_exists": os.path.exists(budget_service.budget_file_path),
         "is_writable": os.access(os.path.dirname(budget_service.budget_file_path), os.W_OK)
@@ -60,24 +173,36 @@ def get_budget_file_path():
 
 @budget_bp.route('/update-file', methods=['POST'])
 def update_budget_file():
-    """Direct endpoint to update budget_plan.json file"""
+    """Direct endpoint to overwrite the stored budget plan"""
     try:
         data = request.json
         if not data:
             return jsonify({"error": "No data provided"}), 400
             
-        # Get absolute path to budget_plan.json
+        try:
+            expected = expected_version(data)
+        except ValueError:
+            return invalid_version_response()
+
         file_path = budget_service.budget_file_path
         
-        # Write the data to the file
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Write the data through the configured store
+        budget_plan = data.get('budget_plan', {k: v for k, v in data.items() if k != 'version'})
+        if not budget_service.save_budget_plan(
+            data.get('questionnaire_answers', {}),
+            budget_plan,
+            current_user_id(),
+            expected_version=expected
+        ):
+            return jsonify({"success": False, "error": "Failed to save budget plan"}), 500
             
         return jsonify({
             "success": True,
             "message": f"Budget file updated successfully at {file_path}"
         })
         
+    except BudgetVersionConflict as conflict:
+        return version_conflict_response(conflict, data)
     except Exception as e:
         return jsonify({
             "success": False,
@@ -97,38 +222,36 @@ def update_budget_category():
         
         if not category or amount is None:
             return jsonify({"error": "Category and amount are required"}), 400
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount < 0:
+            return jsonify({"error": "amount must be a finite, non-negative number"}), 400
         
-        # Load current budget
-        current_plan = budget_service.load_budget_plan()
-        if not current_plan or 'budget_plan' not in current_plan:
+        try:
+            expected = expected_version(data)
+        except ValueError:
+            return invalid_version_response()
+
+        user_id = current_user_id()
+        if not budget_service.load_budget_plan(force_refresh=True, user_id=user_id):
             return jsonify({"error": "No existing budget plan found"}), 404
         
-        # Update the category
-        current_plan['budget_plan'][category] = int(amount)
-        
-        # Recalculate total
-        new_total = 0
-        for key, value in current_plan['budget_plan'].items():
-            if key not in ['total_budget', 'recommendations']:
-                new_total += int(value)
-        
-        current_plan['budget_plan']['total_budget'] = new_total
-        
-        # Save updated plan
-        if budget_service.save_budget_plan(
-            current_plan.get('questionnaire_answers', {}),
-            current_plan['budget_plan']
-        ):
+        # Single-category write; the store recalculates the total
+        updated_plan = budget_service.update_budget_category(category, amount, user_id,
+                                                             expected_version=expected)
+        if updated_plan:
+            new_total = updated_plan['budget_plan']['total_budget']
             return jsonify({
                 "success": True,
                 "message": f"Successfully updated {category} to ₹{amount:,}",
                 "new_total": new_total,
                 "updated_category": category,
-                "updated_amount": amount
+                "updated_amount": amount,
+                "version": updated_plan.get('version')
             }), 200
         else:
             return jsonify({"error": "Failed to save budget update"}), 500
             
+    except BudgetVersionConflict as conflict:
+        return version_conflict_response(conflict, data)
     except Exception as e:
         return jsonify({
             "success": False,
@@ -143,20 +266,29 @@ def get_budget_file_info():
         import time
         
         file_path = budget_service.budget_file_path
+        if Config.BUDGET_STORE == 'json':
+            file_path = budget_service.store.path_for(current_user_id())
         
         if os.path.exists(file_path):
             # Get file modification time
             mtime = os.path.getmtime(file_path)
             last_modified = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
             file_size = os.path.getsize(file_path)
-            
-            return jsonify({
-                "exists": True,
-                "last_modified": last_modified,
-                "modification_timestamp": mtime,
-                "size": file_size,
-                "path": file_path
-            }), 200
+
+            # Same file state -> same ETag, so pollers get an empty 304
+            etag = f"file-{os.stat(file_path).st_mtime_ns}-{file_size}"
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = jsonify({
+                    "exists": True,
+                    "last_modified": last_modified,
+                    "modification_timestamp": mtime,
+                    "size": file_size,
+                    "path": file_path
+                })
+            response.set_etag(etag)
+            return response
         else:
             return jsonify({
                 "exists": False,
@@ -172,19 +304,80 @@ def get_budget_file_info():
             "exists": False
         }), 500
 
+@budget_bp.route('/spending', methods=['GET'])
+def get_budget_spending():
+    """Spent vs allocated per category for a month (?month=YYYY-MM, default current)"""
+    user_id = current_user_id()
+    plan = budget_service.load_budget_plan(user_id=user_id)
+    if not plan:
+        return jsonify({"message": "No budget plan found. Please create one first."}), 404
+    rollup = get_spend_rollup()
+    summary = rollup.spend_vs_budget(plan.get('budget_plan', {}), user_id, request.args.get('month'))
+    summary["last_ingest_at"] = rollup.last_ingest_at
+    return jsonify(summary), 200
+
+@budget_bp.route('/simulate', methods=['POST'])
+def simulate_budget_plan():
+    """What-if simulation: overspend probability per category for the plan and each scenario
+
+    Body (all optional): "adjustments" (one what-if), "scenarios" ([{"name", "adjustments"}]),
+    "sweep" ({"category", "min", "max", "step"}, or "from"/"to" to move money), "paths", "seed",
+    "shopping_behavior"/"unplanned_purchases" overrides, and "use_spending" to simulate only the
+    rest of the current month on top of recorded spending.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    for field, expected_type, name in (('scenarios', list, 'a list'), ('adjustments', list, 'a list'),
+                                       ('sweep', dict, 'an object')):
+        if data.get(field) is not None and not isinstance(data[field], expected_type):
+            return jsonify({"error": f'"{field}" must be {name}'}), 400
+
+    user_id = current_user_id()
+    plan = budget_service.load_budget_plan(user_id=user_id)
+    if not plan:
+        return jsonify({"message": "No budget plan found. Please create one first."}), 404
+
+    try:
+        scenarios = list(data.get('scenarios') or [])
+        if data.get('adjustments'):
+            scenarios.insert(0, {"name": "what-if", "adjustments": data['adjustments']})
+        if data.get('sweep'):
+            allocations = plan_categories(plan.get('budget_plan', {}))
+            scenarios.extend(budget_service.simulator.sweep(allocations, data['sweep']))
+        options = {"paths": data.get('paths'), "seed": data.get('seed')}
+        if data.get('use_spending'):
+            today = datetime.date.today()
+            days_in_month = calendar.monthrange(today.year, today.month)[1]
+            options["spent"] = get_spend_rollup().spent(user_id)
+            options["elapsed"] = (today.day - 1) / days_in_month
+        answers = {field: data[field] for field in ('shopping_behavior', 'unplanned_purchases') if data.get(field)}
+        result = budget_service.simulate_plan(plan, scenarios, answers, **options)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200
+
 @budget_bp.route('/create-from-questionnaire', methods=['POST'])
+@admission_controlled
 def create_budget_from_questionnaire():
     """Create budget plan from questionnaire answers - used by frontend"""
     data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     
+    if wants_async_job(request.headers, request.args):
+        return enqueue_plan_job(data)
+
     # Get budget recommendation
     recommendation = budget_service.get_budget_recommendation(data)
     if not recommendation:
         return jsonify({"error": "Failed to generate budget recommendation"}), 500
     
-    if budget_service.save_budget_plan(data, recommendation):
+    if budget_service.save_budget_plan(data, recommendation, current_user_id()):
         return jsonify({
             "message": "Budget plan created and saved successfully",
             "questionnaire_answers": data,
@@ -193,9 +386,134 @@ def create_budget_from_questionnaire():
     else:
         return jsonify({"error": "Failed to save budget plan"}), 500
 
+@budget_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_plan_job(job_id):
+    """Status of a background plan job; ?wait=<seconds> long-polls until it finishes
+
+    A long-poll holds a watch slot; when none is free the current status is returned at once
+    (with Retry-After while the job runs). asgi.py serves ?wait= polls on the event loop instead.
+    """
+    wait = min(max(request.args.get('wait', default=0, type=float), 0), Config.BUDGET_WATCH_MAX_TIMEOUT)
+    if wait and watch_slots.acquire(blocking=False):
+        try:
+            job = plan_jobs.get(job_id, wait=wait)
+        finally:
+            watch_slots.release()
+    else:
+        job = plan_jobs.get(job_id)
+    if job is None or job['user_id'] != current_user_id():
+        return jsonify(PLAN_JOB_NOT_FOUND), 404
+    return plan_job_response(job, 200)
+
 @budget_bp.route('/reset', methods=['POST'])
 def reset_budget():
     """Reset budget plan - used by frontend"""
-    if budget_service.reset_budget_file():
+    if budget_service.reset_budget_file(current_user_id()):
         return jsonify({"message": "Budget plan reset successfully."}), 200
     return jsonify({"error": "Failed to reset budget plan."}), 500
+
+
+@budget_bp.route('/bulk', methods=['POST'])
+def start_bulk_plan_job():
+    """Start bulk plan generation for an uploaded CSV of questionnaire answers"""
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({"error": "CSV file is required (multipart field 'file')"}), 400
+
+    try:
+        concurrency = int(request.form.get('concurrency', 4))
+        rate = float(request.form.get('rate', Config.BULK_RATE_PER_SEC))
+    except ValueError:
+        return jsonify({"error": "concurrency and rate must be numbers"}), 400
+    # A rate of 0 would switch the pipeline's limiter off, so API jobs always run rate limited
+    if concurrency < 1 or not math.isfinite(rate) or rate <= 0:
+        return jsonify({"error": "concurrency must be at least 1 and rate must be above 0"}), 400
+    concurrency = min(concurrency, Config.BULK_MAX_CONCURRENCY)
+    rate = min(rate, Config.BULK_RATE_PER_SEC)
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(Config.BULK_JOBS_DIR, exist_ok=True)
+    input_path, _ = bulk_jobs.paths(job_id)
+    upload.save(input_path)
+
+    pipeline = BulkPlanPipeline(budget_service._get_current_object(), concurrency=concurrency, rate_per_sec=rate,
+                                id_column=request.form.get('id_column', 'user_id'))
+    bulk_jobs.start(job_id, pipeline)
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/api/budget/bulk/{job_id}",
+        "result_url": f"/api/budget/bulk/{job_id}/result"
+    }), 202
+
+@budget_bp.route('/bulk/<job_id>', methods=['GET'])
+def get_bulk_plan_job(job_id):
+    """Progress of a bulk plan generation job"""
+    job = bulk_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown bulk job"}), 404
+    return jsonify({"job_id": job_id, **job}), 200
+
+@budget_bp.route('/bulk/<job_id>/result', methods=['GET'])
+def get_bulk_plan_result(job_id):
+    """Download the JSONL plans written so far by a bulk job"""
+    if bulk_jobs.get(job_id) is None:
+        return jsonify({"error": "Unknown bulk job"}), 404
+    _, output_path = bulk_jobs.paths(job_id)
+    if not os.path.exists(output_path):
+        return jsonify({"error": "No results yet"}), 404
+    return send_file(output_path, mimetype='application/x-ndjson', as_attachment=True,
+                     download_name=f"budget_plans_{job_id}.jsonl")
+
+@budget_bp.route('/changes', methods=['GET'])
+def get_budget_changes():
+    """Budget change records newer than ?since=<version> (log store only)"""
+    since = request.args.get('since', default=0, type=int)
+    changes = budget_service.get_changes_since(since, current_user_id())
+    if changes is None:
+        return jsonify({"error": "Change history is not available for this version; reload the full plan"}), 410
+    return jsonify({"since": since, "changes": changes}), 200
+
+@budget_bp.route('/watch', methods=['GET'])
+def watch_budget_plan():
+    """Long-poll: returns the plan as soon as its version differs from ?version=, else 304/204 on timeout"""
+    known_version = request.args.get('version', default=-1, type=int)
+    timeout = min(request.args.get('timeout', default=25, type=float), Config.BUDGET_WATCH_MAX_TIMEOUT)
+
+    if not watch_slots.acquire(blocking=False):
+        return waiters_full_response()
+    try:
+        changed, plan, version = budget_service.wait_for_budget_change(known_version, timeout, current_user_id())
+    finally:
+        watch_slots.release()
+    status, body, etag = watch_result(changed, plan, version, request.if_none_match)
+    response = jsonify(body) if body is not None else Response(status=status)
+    response.status_code = status
+    if etag:
+        response.set_etag(etag)
+    return response
+
+@budget_bp.route('/stream', methods=['GET'])
+def stream_budget_plan():
+    """Server-Sent Events: one `budget` event per version change, keepalive comments in between"""
+    user_id = current_user_id()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('version')
+    known_version = int(last_event_id) if last_event_id and last_event_id.isdigit() else -1
+
+    def events():
+        version = known_version
+        while True:
+            changed, plan, version = budget_service.wait_for_budget_change(
+                version, Config.BUDGET_PUSH_RECHECK, user_id)
+            if changed:
+                yield f"id: {version}\nevent: budget\ndata: {json.dumps(plan)}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    # The slot is held for the whole stream and given back when the server closes the response
+    if not watch_slots.acquire(blocking=False):
+        return waiters_full_response()
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(watch_slots.release)
+    return response
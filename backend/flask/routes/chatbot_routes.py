@@ -1,37 +1,51 @@
+import secrets
+
 from flask import Blueprint, request, jsonify, session
-from services.chatbot_service import ChatbotService  # Changed from relative to absolute import
+from services.chatbot_service import LEGACY_SHARED_SESSION
+from services.container import service_proxy
+from routes.budget_routes import current_user_id
+from utils.admission import admission_controlled
+from utils.http_cache import conditional_plan_response
 
 chatbot_bp = Blueprint('chatbot_bp', __name__, url_prefix='/api/chatbot')
-chatbot_service = ChatbotService()
+chatbot_service = service_proxy('chatbot_service')  # Built on first request, not at import
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+def chat_session_id():
+    """This client's chat session, kept in the signed Flask session cookie (created on first use).
+
+    Cookies from before per-client ids carry the shared 'default_session'; they get their own id too.
+    """
+    session_id = session.get('session_id')
+    if not session_id or session_id == LEGACY_SHARED_SESSION:
+        session_id = session['session_id'] = new_session_id()
+    return session_id
 
 @chatbot_bp.route('/chat', methods=['POST'])
+@admission_controlled
 def chat():
-    data = request.json
-    user_input = data.get('message')
-    session_id = session.get('session_id', 'default_session') # Using Flask session for simple session management
-
-    if not user_input:
+    data = request.get_json(silent=True)
+    if data is not None and not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    user_input = (data or {}).get('message')
+    if not user_input or not isinstance(user_input, str):
         return jsonify({"error": "No message provided"}), 400
 
-    response = chatbot_service.get_chat_response(user_input, session_id)
-    session['session_id'] = session_id # Ensure session_id is stored
+    response = chatbot_service.get_chat_response(user_input, chat_session_id(), current_user_id())
     return jsonify({"reply": response})
 
 @chatbot_bp.route('/reset', methods=['POST'])
 def reset_chat():
-    session_id = session.get('session_id', 'default_session')
-    message = chatbot_service.reset_conversation(session_id)
+    message = chatbot_service.reset_conversation(chat_session_id(), current_user_id())
     return jsonify({"message": message})
 
 @chatbot_bp.route('/current_budget', methods=['GET'])
 def get_current_budget_for_chatbot():
-    budget_info = chatbot_service.get_current_budget_info()
-    if budget_info:
-        # Return the full budget structure that the frontend expects
-        full_budget_data = chatbot_service._load_user_budget()
-        if full_budget_data:
-            return jsonify(full_budget_data), 200
-        else:
-            # Fallback to just the budget_plan if full data not available
-            return jsonify({"budget_plan": budget_info}), 200
+    # get_current_budget_info already returns the full budget structure the frontend expects
+    user_id = current_user_id()
+    full_budget_data = chatbot_service.get_current_budget_info(user_id)
+    if full_budget_data:
+        return conditional_plan_response(full_budget_data, chatbot_service.budget_service, user_id)
     return jsonify({"message": "No budget plan found for chatbot context."}), 404
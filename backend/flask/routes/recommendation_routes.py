@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
-from services.recommendation_service import RecommendationService  # Changed from relative to absolute import
+from services.container import service_proxy
+from services.catalog import CatalogError
 
 recommendation_bp = Blueprint('recommendation_bp', __name__, url_prefix='/api/recommendations')
-recommendation_service = RecommendationService()
+recommendation_service = service_proxy('recommendation_service')  # Built on first request, not at import
 
 @recommendation_bp.route('/', methods=['GET'])
 def get_recommendations():
@@ -18,3 +19,42 @@ def get_recommendations():
          return jsonify(recommendations), 400 if "geocode" in recommendations["error"] else 500
          
     return jsonify(recommendations), 200
+
+
+@recommendation_bp.route('/cities', methods=['GET'])
+def search_cities():
+    """Autocomplete and normalization for the city parameter: ?q=<typed text>&limit=<n>
+
+    "city" is the canonical match (exact, alias or corrected typo) or null; "suggestions"
+    are completions of the prefix, or the closest names when nothing starts with it.
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({"error": "Missing 'q' query parameter"}), 400
+    limit = max(1, min(request.args.get('limit', default=8, type=int), 10))
+
+    cities = recommendation_service.cities
+    resolved = cities.resolve(query, suggestions=limit)
+    return jsonify({
+        "query": query,
+        "city": resolved["city"],
+        "match": resolved["match"],
+        "suggestions": cities.complete(query, limit) or resolved["suggestions"]
+    }), 200
+
+@recommendation_bp.route('/catalog', methods=['GET'])
+def get_catalog_status():
+    """Version and size of the catalog snapshot this worker is serving"""
+    return jsonify(recommendation_service.catalog.status()), 200
+
+@recommendation_bp.route('/catalog/reload', methods=['POST'])
+def reload_catalog():
+    """Load catalog.json in this worker now (other workers' watchers follow within CATALOG_RELOAD_INTERVAL)
+
+    A broken file leaves the current catalog in place.
+    """
+    try:
+        swapped = recommendation_service.catalog.reload(force=True)
+    except CatalogError as e:
+        return jsonify({"error": str(e), **recommendation_service.catalog.status()}), 422
+    return jsonify({"swapped": swapped, **recommendation_service.catalog.status()}), 200
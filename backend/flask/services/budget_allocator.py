@@ -0,0 +1,137 @@
+"""Rule-based budget allocator.
+
+Turns questionnaire answers into a category split using the same allocation
+ranges the LLM prompt spells out, so a plan can be created in microseconds
+without a model call (and still be created when Groq is unavailable).
+"""
+
+ELECTRONICS = "Electronics & Accessories"
+GROCERIES = "Groceries & Household Items"
+FASHION = "Fashion & Beauty"
+BOOKS = "Books & Media"
+HOME = "Home & Kitchen"
+EMERGENCY = "Emergency/Unplanned Budget"
+
+# (min %, max %) of the monthly budget, mirroring the recommendation prompt
+CATEGORY_RANGES = {
+    ELECTRONICS: (25, 40),
+    GROCERIES: (15, 25),
+    FASHION: (15, 25),
+    BOOKS: (3, 8),
+    HOME: (10, 20),
+    EMERGENCY: (10, 15),
+}
+
+CATEGORY_KEYWORDS = {
+    ELECTRONICS: ("electronic", "accessor"),
+    GROCERIES: ("grocer", "household"),
+    FASHION: ("fashion", "beauty"),
+    BOOKS: ("book", "media"),
+    HOME: ("home", "kitchen"),
+}
+
+# Position inside each category's range (0 = min, 1 = max) before any adjustments
+BASE_POSITION = 0.3
+
+ROUNDING = 100  # Allocate in multiples of ₹100
+
+
+def _text(value):
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value).lower()
+    return str(value or "").lower()
+
+
+class BudgetAllocator:
+    """Deterministic questionnaire -> category split"""
+
+    def categories_from_answer(self, top_categories):
+        """Map a free-form or option-string top_categories answer to category names"""
+        text = _text(top_categories)
+        return [category for category, keywords in CATEGORY_KEYWORDS.items()
+                if any(keyword in text for keyword in keywords)]
+
+    def _positions(self, questionnaire_answers):
+        """Where each category should sit inside its allowed range"""
+        positions = {category: BASE_POSITION for category in CATEGORY_RANGES}
+
+        for category in self.categories_from_answer(questionnaire_answers.get('top_categories')):
+            positions[category] += 0.6
+
+        age = _text(questionnaire_answers.get('age_group'))
+        if '18-25' in age:
+            positions[ELECTRONICS] += 0.2
+            positions[FASHION] += 0.2
+        elif '26-35' in age:
+            positions[ELECTRONICS] += 0.1
+            positions[HOME] += 0.1
+        elif '36-45' in age:
+            positions[HOME] += 0.2
+            positions[GROCERIES] += 0.1
+        elif '46' in age:
+            positions[HOME] += 0.3
+            positions[GROCERIES] += 0.2
+            positions[ELECTRONICS] -= 0.1
+
+        behavior = _text(questionnaire_answers.get('shopping_behavior'))
+        if 'impulse' in behavior:
+            positions[EMERGENCY] += 0.4
+        elif 'essential' in behavior:
+            positions[GROCERIES] += 0.3
+            positions[EMERGENCY] += 0.1
+        elif 'plan' in behavior:
+            positions[EMERGENCY] -= 0.3
+
+        unplanned = _text(questionnaire_answers.get('unplanned_purchases'))
+        if '5+' in unplanned:
+            positions[EMERGENCY] += 0.5
+        elif '2-4' in unplanned:
+            positions[EMERGENCY] += 0.2
+        elif '0-1' in unplanned:
+            positions[EMERGENCY] -= 0.2
+
+        return {category: min(1.0, max(0.0, position)) for category, position in positions.items()}
+
+    def allocate(self, questionnaire_answers, monthly_budget):
+        """Return {category: amount} summing exactly to monthly_budget"""
+        positions = self._positions(questionnaire_answers)
+        weights = {}
+        for category, (low, high) in CATEGORY_RANGES.items():
+            weights[category] = low + (high - low) * positions[category]
+        total_weight = sum(weights.values())
+
+        unit = ROUNDING if monthly_budget >= ROUNDING * 20 else 1
+        allocation = {}
+        for category, weight in weights.items():
+            allocation[category] = int(monthly_budget * weight / total_weight // unit * unit)
+
+        # Hand the rounding remainder to the largest category so the split sums exactly
+        remainder = monthly_budget - sum(allocation.values())
+        largest = max(allocation, key=allocation.get)
+        allocation[largest] += remainder
+        return allocation
+
+    def default_tips(self, questionnaire_answers):
+        """Rule-based tips used when the LLM is skipped or unavailable"""
+        tips = []
+        top = self.categories_from_answer(questionnaire_answers.get('top_categories'))
+        if ELECTRONICS in top:
+            tips.append("Electronics: Wait for sales like Big Billion Day for 20-30% savings")
+        if GROCERIES in top:
+            tips.append("Buy groceries monthly in bulk to optimize delivery costs")
+        if FASHION in top:
+            tips.append("Fashion: Add items to your wishlist and buy during end-of-season sales")
+
+        behavior = _text(questionnaire_answers.get('shopping_behavior'))
+        unplanned = _text(questionnaire_answers.get('unplanned_purchases'))
+        if 'impulse' in behavior or '5+' in unplanned:
+            tips.append("Wait 24 hours before checking out deals outside your plan")
+        tips.append("Set price alerts for high-value purchases")
+        return tips[:3]
+
+    def build_plan(self, questionnaire_answers, monthly_budget, recommendations=None):
+        """Full plan in the same shape the LLM returns"""
+        plan = self.allocate(questionnaire_answers, monthly_budget)
+        plan['total_budget'] = monthly_budget
+        plan['recommendations'] = recommendations or self.default_tips(questionnaire_answers)
+        return plan
@@ -0,0 +1,255 @@
+"""Log-structured budget store: append-only change log plus periodic snapshots.
+
+Every mutation is one JSON line appended to the active log segment, so a
+category change costs an O(1) append instead of re-serializing the plan.
+Plans live in memory; on startup the latest snapshot is loaded and the
+segments written after it are replayed. Every `snapshot_every` records the
+state is compacted into a new snapshot and the replayed segments are dropped.
+
+Layout of the store directory:
+    snapshot.json            {"segment": k, "plans": {...}} - covers segments <= k
+    changes-000007.log       one JSON record per line
+"""
+import copy
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from services.budget_store import (
+    BudgetVersionConflict, DEFAULT_USER_ID, BASE_DIR, recalculate_total, fcntl
+)
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r'^changes-(\d{6})\.log$')
+
+
+class LogBudgetStore:
+    """Per-user plans rebuilt from an append-only change log"""
+
+    def __init__(self, path=None, snapshot_every=1000, history_limit=100):
+        self.path = path or os.path.join(BASE_DIR, 'budget_log')
+        self.snapshot_every = snapshot_every
+        self.history_limit = history_limit
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._plans = {}    # user_id -> {'questionnaire_answers', 'budget_plan', 'version'}
+        self._history = {}  # user_id -> deque of recent change records
+        self._segment = 0
+        self._offset = 0    # Bytes of the active segment already applied
+        self._records_since_snapshot = 0
+        self._reload()
+
+    # --- files ---------------------------------------------------------------
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"changes-{segment:06d}.log")
+
+    def _snapshot_path(self):
+        return os.path.join(self.path, 'snapshot.json')
+
+    def _segments(self):
+        found = []
+        for name in os.listdir(self.path):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize appends and compaction across threads and worker processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # --- replay --------------------------------------------------------------
+
+    def _reload(self):
+        """Load the snapshot and replay every later segment"""
+        with self._lock:
+            self._plans, self._history = {}, {}
+            snapshot_segment = 0
+            if os.path.exists(self._snapshot_path()):
+                with open(self._snapshot_path(), 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                self._plans = snapshot.get('plans', {})
+                snapshot_segment = snapshot.get('segment', 0)
+
+            segments = [s for s in self._segments() if s > snapshot_segment]
+            self._segment = segments[-1] if segments else snapshot_segment + 1
+            self._offset = 0
+            self._records_since_snapshot = 0
+            for segment in segments:
+                offset = self._replay_segment(segment, 0)
+                if segment == self._segment:
+                    self._offset = offset
+
+    def _replay_segment(self, segment, offset):
+        """Apply complete records of a segment from `offset`; returns the new offset"""
+        path = self._segment_path(segment)
+        if not os.path.exists(path):
+            return offset
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn tail from a crash mid-append; it is rewritten over
+                offset += len(line)
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    continue
+                self._records_since_snapshot += 1
+        return offset
+
+    def _catch_up(self):
+        """Pick up records appended (or a compaction done) by other processes"""
+        if os.path.exists(self._segment_path(self._segment + 1)) or \
+                (self._offset and not os.path.exists(self._segment_path(self._segment))):
+            self._reload()
+            return
+        path = self._segment_path(self._segment)
+        if os.path.exists(path) and os.path.getsize(path) > self._offset:
+            self._offset = self._replay_segment(self._segment, self._offset)
+
+    def _apply(self, record):
+        user_id = record['user']
+        op = record['op']
+        if op == 'save':
+            self._plans[user_id] = {
+                'questionnaire_answers': record['answers'],
+                'budget_plan': record['plan'],
+                'version': record['version']
+            }
+        elif op == 'set':
+            plan = self._plans.get(user_id)
+            if plan is None:
+                return
+            plan['budget_plan'][record['category']] = record['amount']
+            plan['budget_plan']['total_budget'] = record['total_budget']
+            plan['version'] = record['version']
+        elif op == 'delete':
+            self._plans.pop(user_id, None)
+
+        history = self._history.setdefault(user_id, deque(maxlen=self.history_limit))
+        history.append(record)
+
+    # --- writes --------------------------------------------------------------
+
+    def _append(self, record):
+        """Append one record to the active segment and apply it in memory"""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        path = self._segment_path(self._segment)
+        with open(path, 'ab') as f:
+            if f.tell() != self._offset:
+                # Drop a torn tail left by a crashed writer before appending
+                f.truncate(self._offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._offset += len(line)
+        self._apply(record)
+        self._records_since_snapshot += 1
+        if self._records_since_snapshot >= self.snapshot_every:
+            self._compact()
+
+    def _compact(self):
+        """Write a snapshot covering the active segment, then start a new one"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.snapshot-', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'segment': self._segment, 'plans': self._plans}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path())
+
+        covered = self._segment
+        self._segment += 1
+        self._offset = 0
+        self._records_since_snapshot = 0
+        open(self._segment_path(self._segment), 'ab').close()
+        for segment in self._segments():
+            if segment <= covered:
+                os.remove(self._segment_path(segment))
+        logger.info("Budget log compacted into snapshot", extra={"segment": covered})
+
+    def _check_version(self, user_id, expected_version):
+        current = self._plans.get(user_id)
+        current_version = current['version'] if current else 0
+        if expected_version is not None and expected_version != current_version:
+            raise BudgetVersionConflict(expected_version, current_version)
+        # Keep numbering monotonic across delete + re-create so `since` queries stay valid
+        history = self._history.get(user_id)
+        return max(current_version, history[-1]['version'] if history else 0)
+
+    # --- store interface -----------------------------------------------------
+
+    def load(self, user_id=DEFAULT_USER_ID, force_refresh=False):
+        with self._lock:
+            self._catch_up()
+            plan = self._plans.get(user_id)
+            return copy.deepcopy(plan) if plan else None
+
+    def version(self, user_id=DEFAULT_USER_ID):
+        """Current plan version (0 when there is none), without copying the plan"""
+        with self._lock:
+            self._catch_up()
+            plan = self._plans.get(user_id)
+            return plan['version'] if plan else 0
+
+    def save(self, user_id, answers, budget_plan, expected_version=None):
+        with self._file_lock():
+            self._catch_up()
+            version = self._check_version(user_id, expected_version) + 1
+            self._append({'user': user_id, 'op': 'save', 'version': version, 'ts': time.time(),
+                          'answers': answers, 'plan': budget_plan})
+        return True
+
+    def update_category(self, user_id, category, amount, expected_version=None):
+        with self._file_lock():
+            self._catch_up()
+            if user_id not in self._plans:
+                return None
+            version = self._check_version(user_id, expected_version) + 1
+            plan = dict(self._plans[user_id]['budget_plan'])
+            plan[category] = int(amount)
+            self._append({'user': user_id, 'op': 'set', 'version': version, 'ts': time.time(),
+                          'category': category, 'amount': int(amount),
+                          'total_budget': recalculate_total(plan)})
+            return copy.deepcopy(self._plans[user_id])
+
+    def delete(self, user_id=DEFAULT_USER_ID):
+        with self._file_lock():
+            self._catch_up()
+            if user_id in self._plans:
+                version = self._plans[user_id]['version'] + 1
+                self._append({'user': user_id, 'op': 'delete', 'version': version, 'ts': time.time()})
+        return True
+
+    def changes_since(self, user_id, version):
+        """Change records newer than `version`, or None when history no longer reaches back that far"""
+        with self._lock:
+            self._catch_up()
+            history = self._history.get(user_id, ())
+            changes = [record for record in history if record['version'] > version]
+            oldest_kept = history[0]['version'] if history else None
+            if changes and oldest_kept is not None and oldest_kept > version + 1:
+                return None
+            current = self._plans.get(user_id)
+            if not changes and current and current['version'] > version:
+                return None  # Compacted away before this process saw it
+            return copy.deepcopy(changes)
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+
+class BudgetChangeNotifier:
+    """In-process wake-ups for clients waiting on a user's budget to change.
+
+    Writers call notify(user_id) after a successful save; waiters block on a
+    per-user condition instead of polling the store. Event-loop waiters
+    (asgi.py) park a future instead, so they hold no thread while waiting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conditions = {}   # user_id -> threading.Condition
+        self._generations = {}  # user_id -> number of notifications so far
+        self._async_waiters = {}  # user_id -> {(loop, future)}
+
+    def _condition(self, user_id):
+        with self._lock:
+            condition = self._conditions.get(user_id)
+            if condition is None:
+                condition = self._conditions[user_id] = threading.Condition()
+            return condition
+
+    def generation(self, user_id):
+        return self._generations.get(user_id, 0)
+
+    def notify(self, user_id):
+        condition = self._condition(user_id)
+        with condition:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            condition.notify_all()
+        with self._lock:
+            waiters = self._async_waiters.pop(user_id, ())
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # That loop has been closed; its waiter is gone with it
+
+    def wait(self, user_id, generation, timeout):
+        """Block until notify() moves past `generation` or timeout; True if notified"""
+        condition = self._condition(user_id)
+        with condition:
+            return condition.wait_for(lambda: self.generation(user_id) != generation, timeout)
+
+    async def wait_async(self, user_id, generation, timeout):
+        """Event-loop twin of wait(): suspends the calling task instead of a thread"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            # Checked under the lock notify() pops waiters with, so a notification cannot slip between
+            if self.generation(user_id) != generation:
+                return True
+            self._async_waiters.setdefault(user_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.generation(user_id) != generation
+        finally:
+            with self._lock:
+                waiters = self._async_waiters.get(user_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._async_waiters[user_id]
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(True)
+
+
+# Shared by every BudgetService in the process, like the budget store
+budget_notifier = BudgetChangeNotifier()
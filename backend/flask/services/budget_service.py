@@ -1,19 +1,66 @@
+import asyncio
+import copy
 import json
+import logging
 import os
 import re 
 from config import Config  # Changed from relative to absolute import
-from groq import Groq 
 import time
+from utils.singleflight import SingleFlight, AsyncSingleFlight
+from services.budget_allocator import BudgetAllocator
+from services.budget_simulator import BudgetSimulator
+from services.plan_parser import IncrementalPlanParser, PlanValidationError
+from services.budget_store import create_budget_store, BudgetVersionConflict, DEFAULT_USER_ID
+from services.budget_notifier import budget_notifier
+from services.shared_state import get_state_store
+from utils.metrics import track_llm_call, CACHE_REQUESTS, PLAN_FALLBACKS
+
+logger = logging.getLogger(__name__)
 
 class BudgetService:
     def __init__(self):
-        self.client = Groq(api_key=Config.GROQ_API_KEY)
-        self.budget_file_path = 'budget_plan.json' # Relative to app root
+        self._client = None
+        # Per-user plan storage (budget_plan.json by default, SQLite when configured)
+        store_options = {'snapshot_every': Config.BUDGET_SNAPSHOT_EVERY} if Config.BUDGET_STORE == 'log' else {}
+        self.store = create_budget_store(Config.BUDGET_STORE, Config.BUDGET_STORE_PATH, **store_options)
+        self.budget_file_path = self.store.path
+        self.notifier = budget_notifier
+        self._async_client = None
+        self._json_stream_rejected = False  # Set when the provider refuses stream=True in JSON mode
+
+        # Identical questionnaire submissions share one in-flight call and one cached plan
+        # (the cache is shared across worker processes when SHARED_STATE=sqlite)
+        state = get_state_store()
+        self._recommendation_cache = state.cache('budget_recommendations', max_size=Config.BUDGET_CACHE_SIZE,
+                                                 ttl=Config.BUDGET_CACHE_TTL)
+        self._recommendation_flight = SingleFlight()
+        self._async_recommendation_flight = AsyncSingleFlight()
+        self.allocator = BudgetAllocator()
+        self.simulator = BudgetSimulator()
+        # Plans recently served, keyed by (user_id, version), so readers can ask for deltas
+        self._served_versions = state.cache('served_plan_versions', max_size=Config.BUDGET_DELTA_HISTORY)
+
+    @property
+    def client(self):
+        """Groq client, created (and the SDK imported) on first use"""
+        if self._client is None:
+            from groq import Groq
+            self._client = Groq(api_key=Config.GROQ_API_KEY)
+        return self._client
 
-        # Add file caching
-        self._file_cache = None
-        self._file_cache_timestamp = None
-        self._file_cache_duration = 30  # Cache for 30 seconds
+    @property
+    def async_client(self):
+        """Async Groq client, created on first use by the ASGI entry point"""
+        if self._async_client is None:
+            from groq import AsyncGroq
+            self._async_client = AsyncGroq(api_key=Config.GROQ_API_KEY)
+        return self._async_client
+
+    def close(self):
+        """Release the HTTP connection pools of any clients created so far"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
     def _clean_budget_response(self, response: str):
         """Clean and parse the budget response from API"""
@@ -33,12 +80,12 @@ class BudgetService:
                             budget_dict[category] = int(amount)
                 return budget_dict
         except Exception as e:
-            print(f"Error parsing budget response: {e}")
+            logger.error("Error parsing budget response: %s", e)
             return {}
 
-    def get_budget_recommendation(self, questionnaire_answers):
-        """Get budget recommendation based on questionnaire answers"""
-        prompt = f"""
+    def _build_recommendation_prompt(self, questionnaire_answers):
+        """Build the budget advisor prompt for the given questionnaire answers"""
+        return f"""
         You are an Amazon shopping budget advisor with deep knowledge of Indian market prices. Based on the following questionnaire responses, create a REALISTIC monthly budget breakdown for Amazon shopping that reflects actual market prices and spending patterns.
 
         Questionnaire Responses:
@@ -68,6 +115,7 @@ class BudgetService:
 
         Return response as JSON object with category names as keys and budget amounts in INR as values.
         Also include "total_budget" field and "recommendations" field with 2-3 practical tips.
+        Respond with ONLY the JSON object and use exactly the category names from the example below.
 
         Example realistic format for ₹50,000 budget:
         {{
@@ -85,82 +133,413 @@ class BudgetService:
             ]
         }}
         """
-        try:
-            response = self.client.chat.completions.create(
-                model="llama-3.3-70b-versatile", # Ensure this model is available or use a suitable one
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=1024,
+
+    def _recommendation_request(self, questionnaire_answers, stream=True):
+        """Keyword arguments for the chat completion call behind a recommendation
+
+        In JSON mode the reply is streamed unless `stream` is False (the retry after a rejected stream).
+        """
+        request = dict(
+            model="llama-3.3-70b-versatile", # Ensure this model is available or use a suitable one
+            messages=[{"role": "user", "content": self._build_recommendation_prompt(questionnaire_answers)}],
+            temperature=0.7,
+            max_tokens=1024,
+        )
+        if Config.BUDGET_STRUCTURED_OUTPUT:
+            # JSON mode keeps the reply to the bare object, so a much smaller cap is enough
+            request.update(
+                response_format={"type": "json_object"},
+                max_tokens=Config.BUDGET_PLAN_MAX_TOKENS,
+                stream=stream,
             )
-            raw_response = response.choices[0].message.content
-            budget_data = self._clean_budget_response(raw_response)
-            return budget_data
+        return request
+
+    def _stream_plan(self, questionnaire_answers):
+        """Stream a JSON-mode plan, validating members as they arrive and stopping once the object closes"""
+        with track_llm_call('budget_plan') as call:
+            stream = self.client.chat.completions.create(**self._recommendation_request(questionnaire_answers))
+            parser = IncrementalPlanParser()
+            try:
+                for chunk in stream:
+                    call.record_chunk(chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta and parser.feed(delta):
+                        break
+            finally:
+                stream.close()
+        return parser.result()
+
+    async def _stream_plan_async(self, questionnaire_answers):
+        with track_llm_call('budget_plan') as call:
+            stream = await self.async_client.chat.completions.create(**self._recommendation_request(questionnaire_answers))
+            parser = IncrementalPlanParser()
+            try:
+                async for chunk in stream:
+                    call.record_chunk(chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta and parser.feed(delta):
+                        break
+            finally:
+                await stream.close()
+        return parser.result()
+
+    @staticmethod
+    def _parse_budget_amount(value):
+        try:
+            return int(float(str(value).replace(',', '').replace('₹', '').strip()))
+        except (ValueError, TypeError):
+            return None
+
+    def _recommendation_cache_key(self, questionnaire_answers):
+        """Normalize questionnaire answers into a hashable cache key"""
+        def normalize(value):
+            if isinstance(value, (list, tuple)):
+                return tuple(sorted(normalize(v) for v in value))
+            return str(value).strip().lower()
+
+        key = []
+        for field in ("age_group", "top_categories", "shopping_behavior", "unplanned_purchases", "primary_goal"):
+            key.append(normalize(questionnaire_answers.get(field)))
+
+        budget = self._parse_budget_amount(questionnaire_answers.get('monthly_budget'))
+        if budget is not None and Config.BUDGET_AMOUNT_BUCKET > 0:
+            bucket = Config.BUDGET_AMOUNT_BUCKET
+            budget = max(bucket, int(round(budget / bucket)) * bucket)
+        key.append(budget if budget is not None else normalize(questionnaire_answers.get('monthly_budget')))
+        return tuple(key)
+
+    def _plan_for_budget(self, cached_plan, questionnaire_answers):
+        """Copy a cached plan, rescaling it when it was generated for another budget in the same bucket"""
+        plan = copy.deepcopy(cached_plan)
+        budget = self._parse_budget_amount(questionnaire_answers.get('monthly_budget'))
+        cached_total = self._parse_budget_amount(plan.get('total_budget'))
+        if not budget or not cached_total or budget == cached_total:
+            return plan
+
+        scale = budget / cached_total
+        categories = [category for category, amount in plan.items()
+                      if category not in ('total_budget', 'recommendations')
+                      and isinstance(amount, (int, float)) and not isinstance(amount, bool)]
+        if categories:
+            # Rounding each category on its own drifts from the total, so the remainder
+            # goes to the emergency budget (or the largest category) and the plan still adds up
+            target = int(round(sum(plan[category] for category in categories) * scale))
+            for category in categories:
+                plan[category] = int(round(plan[category] * scale))
+            remainder_category = ('Emergency/Unplanned Budget' if 'Emergency/Unplanned Budget' in categories
+                                  else max(categories, key=lambda category: plan[category]))
+            plan[remainder_category] += target - sum(plan[category] for category in categories)
+        plan['total_budget'] = budget
+        return plan
+
+    def _tips_request(self, questionnaire_answers):
+        """Keyword arguments for the small chat completion that only writes tips"""
+        prompt = f"""
+        You are an Amazon shopping budget advisor for the Indian market. Give 2-3 short, practical tips for this user.
+
+        Age group: {questionnaire_answers.get('age_group')}
+        Monthly budget: ₹{questionnaire_answers.get('monthly_budget')}
+        Top categories: {questionnaire_answers.get('top_categories')}
+        Shopping behavior: {questionnaire_answers.get('shopping_behavior')}
+        Unplanned purchases: {questionnaire_answers.get('unplanned_purchases')}
+        Primary goal: {questionnaire_answers.get('primary_goal')}
+
+        Return ONLY a JSON array of strings.
+        """
+        return dict(
+            model="llama-3.3-70b-versatile",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=200,
+        )
+
+    def _parse_tips(self, response: str):
+        try:
+            json_match = re.search(r'\[.*\]', response, re.DOTALL)
+            tips = json.loads(json_match.group()) if json_match else []
+            return [str(tip) for tip in tips if tip][:3]
+        except Exception as e:
+            logger.error("Error parsing budget tips: %s", e)
+            return []
+
+    def _local_budget_recommendation(self, questionnaire_answers, tips=None):
+        """Rule-based plan; empty when the monthly budget is unusable"""
+        budget = self._parse_budget_amount(questionnaire_answers.get('monthly_budget'))
+        if not budget or budget <= 0:
+            return {}
+        return self.allocator.build_plan(questionnaire_answers, budget, tips)
+
+    def _fallback_recommendation(self, questionnaire_answers):
+        """Local plan used when the LLM fails, so the user never gets an empty plan"""
+        logger.warning("Falling back to local budget allocation")
+        PLAN_FALLBACKS.inc(mode=Config.BUDGET_ALLOCATION_MODE)
+        return self._local_budget_recommendation(questionnaire_answers)
+
+    def _plan_attempts(self):
+        """Which call to make next for a JSON-mode plan; shared by the sync and async generators.
+
+        Yields "stream" or "complete" and is sent the exception each attempt failed with.
+        Invalid plans are retried streamed, up to BUDGET_PLAN_MAX_ATTEMPTS; an API error gets
+        one non-streamed JSON-mode request, in case the provider rejects streaming in JSON mode.
+        Once it has rejected that request shape (HTTP 400), later plans skip streaming altogether.
+        Yields None when there is nothing left to try.
+        """
+        for attempt in range(1, Config.BUDGET_PLAN_MAX_ATTEMPTS + 1):
+            if self._json_stream_rejected:
+                error = yield 'complete'
+                if isinstance(error, PlanValidationError):
+                    logger.warning("Invalid budget plan (attempt %d): %s", attempt, error)
+                    continue
+                logger.error("Error getting budget recommendation: %s", error)
+                break
+            error = yield 'stream'
+            if isinstance(error, PlanValidationError):
+                logger.warning("Invalid budget plan (attempt %d): %s", attempt, error)
+                continue
+            if getattr(error, 'status_code', None) == 400:
+                self._json_stream_rejected = True
+            logger.error("Streamed budget plan request failed, retrying without streaming: %s", error)
+            error = yield 'complete'
+            logger.error("Error getting budget recommendation: %s", error)
+            break
+        yield None
+
+    def _complete(self, request, call_name):
+        """Text of a non-streamed chat completion, timed and counted"""
+        with track_llm_call(call_name) as call:
+            response = self.client.chat.completions.create(**request)
+            call.usage = response.usage
+        return response.choices[0].message.content
+
+    async def _complete_async(self, request, call_name):
+        with track_llm_call(call_name) as call:
+            response = await self.async_client.chat.completions.create(**request)
+            call.usage = response.usage
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _parse_plan(text):
+        """Validate a whole JSON-mode reply with the same parser streamed replies go through"""
+        parser = IncrementalPlanParser()
+        parser.feed(text)
+        return parser.result()
+
+    def _generate_budget_recommendation(self, questionnaire_answers):
+        """Produce a fresh budget recommendation (LLM or local allocator, per config)"""
+        if Config.BUDGET_ALLOCATION_MODE == 'local':
+            tips = None
+            if Config.BUDGET_LLM_TIPS:
+                try:
+                    tips = self._parse_tips(self._complete(self._tips_request(questionnaire_answers), 'budget_tips'))
+                except Exception as e:
+                    logger.error("Error getting budget tips: %s", e)
+            return self._local_budget_recommendation(questionnaire_answers, tips)
+
+        if Config.BUDGET_STRUCTURED_OUTPUT:
+            attempts = self._plan_attempts()
+            kind = next(attempts)
+            while kind:
+                try:
+                    if kind == 'stream':
+                        return self._stream_plan(questionnaire_answers)
+                    request = self._recommendation_request(questionnaire_answers, stream=False)
+                    return self._parse_plan(self._complete(request, 'budget_plan'))
+                except Exception as e:
+                    kind = attempts.send(e)
+            return {}
+
+        try:
+            return self._clean_budget_response(
+                self._complete(self._recommendation_request(questionnaire_answers), 'budget_plan'))
         except Exception as e:
-            print(f"❌ Error getting budget recommendation: {e}")
+            logger.error("Error getting budget recommendation: %s", e)
+            return {}
+
+    async def _generate_budget_recommendation_async(self, questionnaire_answers):
+        if Config.BUDGET_ALLOCATION_MODE == 'local':
+            tips = None
+            if Config.BUDGET_LLM_TIPS:
+                try:
+                    tips = self._parse_tips(
+                        await self._complete_async(self._tips_request(questionnaire_answers), 'budget_tips'))
+                except Exception as e:
+                    logger.error("Error getting budget tips: %s", e)
+            return self._local_budget_recommendation(questionnaire_answers, tips)
+
+        if Config.BUDGET_STRUCTURED_OUTPUT:
+            attempts = self._plan_attempts()
+            kind = next(attempts)
+            while kind:
+                try:
+                    if kind == 'stream':
+                        return await self._stream_plan_async(questionnaire_answers)
+                    request = self._recommendation_request(questionnaire_answers, stream=False)
+                    return self._parse_plan(await self._complete_async(request, 'budget_plan'))
+                except Exception as e:
+                    kind = attempts.send(e)
             return {}
 
-    def save_budget_plan(self, answers, budget_plan):
-        """Saves the budget plan to a JSON file."""
         try:
-            with open(self.budget_file_path, 'w') as f:
-                json.dump({
-                    'questionnaire_answers': answers,
-                    'budget_plan': budget_plan
-                }, f, indent=2)
-            # Clear cache after successful save
-            self._file_cache = None
-            self._file_cache_timestamp = None
-            return True
+            return self._clean_budget_response(
+                await self._complete_async(self._recommendation_request(questionnaire_answers), 'budget_plan'))
         except Exception as e:
-            print(f"Error saving budget plan: {e}")
+            logger.error("Error getting budget recommendation: %s", e)
+            return {}
+
+    def get_budget_recommendation(self, questionnaire_answers):
+        """Get budget recommendation based on questionnaire answers"""
+        key = self._recommendation_cache_key(questionnaire_answers)
+        cached = self._recommendation_cache.get(key)
+        CACHE_REQUESTS.inc(cache='budget_recommendation', result='miss' if cached is None else 'hit')
+        if cached is None:
+            cached = self._recommendation_flight.do(key, self._generate_budget_recommendation, questionnaire_answers)
+            if not cached:
+                # Fallback plans are not cached so the next request retries the LLM
+                return self._fallback_recommendation(questionnaire_answers)
+            self._recommendation_cache.set(key, cached)
+        return self._plan_for_budget(cached, questionnaire_answers)
+
+    async def get_budget_recommendation_async(self, questionnaire_answers):
+        """Async variant of get_budget_recommendation for the ASGI entry point"""
+        key = self._recommendation_cache_key(questionnaire_answers)
+        cached = self._recommendation_cache.get(key)
+        CACHE_REQUESTS.inc(cache='budget_recommendation', result='miss' if cached is None else 'hit')
+        if cached is None:
+            cached = await self._async_recommendation_flight.do(key, self._generate_budget_recommendation_async, questionnaire_answers)
+            if not cached:
+                return self._fallback_recommendation(questionnaire_answers)
+            self._recommendation_cache.set(key, cached)
+        return self._plan_for_budget(cached, questionnaire_answers)
+
+    def save_budget_plan(self, answers, budget_plan, user_id=DEFAULT_USER_ID, expected_version=None):
+        """Saves the budget plan for a user (compare-and-swap when expected_version is given)."""
+        try:
+            saved = self.store.save(user_id, answers, budget_plan, expected_version=expected_version)
+            if saved:
+                self.notifier.notify(user_id)
+            return saved
+        except BudgetVersionConflict:
+            raise
+        except Exception as e:
+            logger.error("Error saving budget plan: %s", e)
             return False
 
-    def load_budget_plan(self, force_refresh=False):
-        """Load budget plan from file with smart caching"""
+    def load_budget_plan(self, force_refresh=False, user_id=DEFAULT_USER_ID):
+        """Load a user's budget plan (the JSON store caches by file mtime)"""
         try:
-            budget_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'budget_plan.json')
-            current_time = time.time() if hasattr(time, 'time') else 0
-            
-            # Use cached data if available and not forcing refresh
-            if (not force_refresh and self._file_cache and self._file_cache_timestamp and 
-                current_time - self._file_cache_timestamp < self._file_cache_duration):
-                return self._file_cache
-            
-            if os.path.exists(budget_file_path):
-                # Check file modification time to see if it actually changed
-                file_mtime = os.path.getmtime(budget_file_path)
-                
-                if (not force_refresh and self._file_cache and self._file_cache_timestamp and 
-                    file_mtime <= self._file_cache_timestamp):
-                    # File hasn't been modified, return cached data
-                    return self._file_cache
-                
-                with open(budget_file_path, 'r', encoding='utf-8') as file:
-                    data = json.load(file)
-                    
-                    # Update cache
-                    self._file_cache = data
-                    self._file_cache_timestamp = file_mtime
-                    
-                    if force_refresh:
-                        print(f"🔄 Force loaded budget data from file")
-                    
-                    return data
-            else:
-                print(f"⚠️ Budget file not found at: {budget_file_path}")
-                return None
+            plan = self.store.load(user_id, force_refresh=force_refresh)
         except Exception as e:
-            print(f"❌ Error loading budget plan: {e}")
+            logger.error("Error loading budget plan: %s", e)
             return None
+        self._remember_version(user_id, plan)
+        return plan
+
+    def budget_version(self, user_id=DEFAULT_USER_ID):
+        """Version of a user's stored plan (0 when there is none, None when the store is unreadable)"""
+        try:
+            return self.store.version(user_id)
+        except Exception as e:
+            logger.error("Error reading budget plan version: %s", e)
+            return None
+
+    def simulate_plan(self, plan, scenarios=None, answers=None, **options):
+        """What-if simulation of a stored plan (see BudgetSimulator.simulate); raises ValueError on bad scenarios"""
+        questionnaire_answers = dict(plan.get('questionnaire_answers') or {})
+        questionnaire_answers.update(answers or {})
+        return self.simulator.simulate(plan.get('budget_plan', {}), questionnaire_answers, scenarios, **options)
+
+    def update_budget_category(self, category, amount, user_id=DEFAULT_USER_ID, expected_version=None):
+        """Set one category and recalculate the total; returns the updated plan or None"""
+        try:
+            updated = self.store.update_category(user_id, category, amount, expected_version=expected_version)
+            if updated:
+                self._remember_version(user_id, updated)
+                self.notifier.notify(user_id)
+            return updated
+        except BudgetVersionConflict:
+            raise
+        except Exception as e:
+            logger.error("Error updating budget category: %s", e)
+            return None
+
+    def wait_for_budget_change(self, known_version, timeout, user_id=DEFAULT_USER_ID):
+        """Block until the user's plan version differs from known_version.
+
+        Returns (changed, plan, version). Writes in this process wake the waiter
+        immediately; writes from other workers are caught by a periodic recheck.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            generation = self.notifier.generation(user_id)
+            plan = self.load_budget_plan(user_id=user_id)
+            version = plan.get('version', 0) if plan else 0
+            if version != known_version:
+                return True, plan, version
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False, plan, version
+            self.notifier.wait(user_id, generation, min(remaining, Config.BUDGET_PUSH_RECHECK))
+
+    async def wait_for_budget_change_async(self, known_version, timeout, user_id=DEFAULT_USER_ID):
+        """Async variant of wait_for_budget_change: waits without holding a thread, loads in one"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            generation = self.notifier.generation(user_id)
+            plan = await asyncio.to_thread(self.load_budget_plan, user_id=user_id)
+            version = plan.get('version', 0) if plan else 0
+            if version != known_version:
+                return True, plan, version
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False, plan, version
+            await self.notifier.wait_async(user_id, generation, min(remaining, Config.BUDGET_PUSH_RECHECK))
+
+    def get_changes_since(self, version, user_id=DEFAULT_USER_ID):
+        """Budget changes after `version` (None when the store cannot answer incrementally)"""
+        changes_since = getattr(self.store, 'changes_since', None)
+        return changes_since(user_id, version) if changes_since else None
+
+    def _remember_version(self, user_id, plan):
+        """Keep a copy of each plan version handed out, the base for later deltas"""
+        if not plan or plan.get('version') is None:
+            return
+        key = (user_id, plan['version'])
+        if self._served_versions.get(key) is None:
+            self._served_versions.set(key, copy.deepcopy(plan.get('budget_plan', {})))
+
+    def get_plan_delta(self, since, plan, user_id=DEFAULT_USER_ID):
+        """Categories changed between version `since` and `plan`.
+
+        Returns None when the base version is unknown (never served or
+        evicted), in which case the caller sends the full plan.
+        """
+        version = plan.get('version')
+        if version is None:
+            return None
+        current = plan.get('budget_plan', {})
+        if since == version:
+            base = current
+        else:
+            base = self._served_versions.get((user_id, since))
+            if base is None:
+                return None
+        return {
+            "delta": True,
+            "since": since,
+            "version": version,
+            "changed": {key: value for key, value in current.items() if base.get(key) != value},
+            "removed": [key for key in base if key not in current]
+        }
 
-    def reset_budget_file(self):
-        """Reset the budget plan JSON file"""
+    def reset_budget_file(self, user_id=DEFAULT_USER_ID):
+        """Reset a user's budget plan"""
         try:
-            if os.path.exists(self.budget_file_path):
-                os.remove(self.budget_file_path)
-            return True
+            deleted = self.store.delete(user_id)
+            self.notifier.notify(user_id)
+            return deleted
         except Exception as e:
-            print(f"❌ Error clearing previous data: {e}")
+            logger.error("Error clearing previous data: %s", e)
             return False
 
     def get_questionnaire_schema(self):
@@ -200,7 +579,7 @@ class BudgetService:
             }
         }
 
-    def process_chatbot_update(self, update_message):
+    def process_chatbot_update(self, update_message, user_id=DEFAULT_USER_ID):
         """
         Process budget updates from chatbot interface
         """
@@ -210,12 +589,12 @@ class BudgetService:
             
             # Check if it's a complex request (multiple operations)
             if any(word in update_message.lower() for word in [' and ', ' also ', ' then ', ', ']):
-                return chatbot.update_budget_from_complex_request(update_message)
+                return chatbot.update_budget_from_complex_request(update_message, user_id)
             else:
-                return chatbot.process_chatbot_budget_update(update_message)
+                return chatbot.process_chatbot_budget_update(update_message, user_id)
                 
         except Exception as e:
-            print(f"Error in budget service chatbot update: {e}")
+            logger.error("Error in budget service chatbot update: %s", e)
             return {
                 'success': False,
                 'message': 'Failed to process budget update through chatbot service.',
@@ -0,0 +1,297 @@
+"""Monte-Carlo what-if simulation of a month's spending against a budget plan.
+
+Each simulated month draws, per category, how much of its allocation the
+user actually spends (a log-normal multiplier whose spread follows the
+questionnaire's shopping_behavior) plus a Poisson number of unplanned
+purchases (rate from unplanned_purchases) that land in random categories.
+Unplanned purchases are paid from the Emergency/Unplanned budget first;
+whatever it cannot cover spills into the category where it happened.
+
+A scenario changes allocations ("cut Fashion by 2000", "move 500 from
+Electronics to Home"). Spending habits do not follow a new limit one to
+one: demand moves with (new / current allocation) ** elasticity, where
+disciplined planners adapt more than impulse buyers. Every scenario is
+evaluated on the same random draws as the current plan, so differences
+between them are not sampling noise. All paths and scenarios are computed
+as NumPy arrays: 10,000 months for one what-if take about 10 ms. Sweeps
+share a fixed budget of path x scenario evaluations, so hundreds of
+scenarios get fewer paths each and still finish well under a second.
+"""
+import math
+import time
+
+from services.budget_allocator import ELECTRONICS, GROCERIES, FASHION, BOOKS, HOME, EMERGENCY
+
+ESSENTIALS = (GROCERIES, HOME)
+
+
+def finite(value, what):
+    """float(value), raising ValueError for NaN and infinities (which float() accepts) as for any bad number"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{what} must be a number, got {value!r}") from e
+    if not math.isfinite(number):
+        raise ValueError(f"{what} must be a finite number, got {value!r}")
+    return number
+
+# shopping_behavior keyword -> (sigma essentials, sigma other categories, median share of the allocation spent,
+#                               elasticity essentials, elasticity other categories)
+BEHAVIOR_PROFILES = {
+    'plan': (0.08, 0.12, 0.85, 0.5, 0.9),
+    'essential': (0.08, 0.22, 0.88, 0.3, 0.7),
+    'impulse': (0.15, 0.35, 0.92, 0.3, 0.4),
+}
+DEFAULT_PROFILE = (0.12, 0.22, 0.88, 0.4, 0.6)
+
+# unplanned_purchases keyword -> expected unplanned purchases per month
+UNPLANNED_RATES = {'5+': 6.0, '2-4': 3.0, '0-1': 0.7}
+DEFAULT_UNPLANNED_RATE = 2.0
+
+# Where unplanned purchases happen, and their typical size as a share of the monthly budget
+UNPLANNED_WEIGHTS = {ELECTRONICS: 0.25, FASHION: 0.3, HOME: 0.2, GROCERIES: 0.15, BOOKS: 0.1}
+UNPLANNED_MEDIAN_SHARE = 0.04
+UNPLANNED_SIGMA = 0.6
+
+DEFAULT_PATHS = 10000
+MAX_PATHS = 100000
+MAX_SCENARIOS = 5000
+# Paths x scenarios evaluated per request at most; large sweeps get fewer paths each
+MAX_WORK = 2_000_000
+# Scenario x path x category cells held in memory at once
+BATCH_CELLS = 4_000_000
+
+
+def plan_categories(budget_plan):
+    """Numeric category allocations of a stored plan, in plan order"""
+    allocations = {}
+    for category, amount in budget_plan.items():
+        if category in ('total_budget', 'recommendations'):
+            continue
+        try:
+            allocations[category] = float(amount)
+        except (TypeError, ValueError):
+            continue
+    return allocations
+
+
+class BudgetSimulator:
+    """Vectorized what-if evaluation of budget reallocations"""
+
+    def profile(self, questionnaire_answers):
+        answers = questionnaire_answers or {}
+        behavior = str(answers.get('shopping_behavior') or '').lower()
+        unplanned = str(answers.get('unplanned_purchases') or '').lower()
+        profile = next((values for keyword, values in BEHAVIOR_PROFILES.items() if keyword in behavior),
+                       DEFAULT_PROFILE)
+        rate = next((value for keyword, value in UNPLANNED_RATES.items() if keyword in unplanned),
+                    DEFAULT_UNPLANNED_RATE)
+        return profile, rate * (1.3 if 'impulse' in behavior else 1.0)
+
+    def apply_adjustments(self, allocations, adjustments):
+        """New allocations after a list of changes; raises ValueError on an unknown category or bad amount
+
+        {"category": c, "delta": -2000}   change by an amount
+        {"category": c, "amount": 1000}   set to an amount
+        {"from": a, "to": b, "amount": 500}   move money between categories
+        """
+        result = dict(allocations)
+
+        def category(name):
+            if name not in result:
+                raise ValueError(f"Unknown category: {name}")
+            return name
+
+        if not isinstance(adjustments or [], list):
+            raise ValueError("adjustments must be a list")
+        for change in adjustments or []:
+            if not isinstance(change, dict):
+                raise ValueError(f"Invalid adjustment {change!r}")
+            try:
+                if 'from' in change:
+                    source, target = category(change['from']), category(change['to'])
+                    amount = finite(change['amount'], "amount")
+                    result[source] -= amount
+                    result[target] += amount
+                elif 'delta' in change:
+                    result[category(change['category'])] += finite(change['delta'], "delta")
+                else:
+                    result[category(change['category'])] = finite(change['amount'], "amount")
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Invalid adjustment {change!r}") from e
+        negative = [name for name, amount in result.items() if amount < 0]
+        if negative:
+            raise ValueError(f"Adjustments leave a negative allocation for {', '.join(negative)}")
+        return result
+
+    def sweep(self, allocations, sweep):
+        """Scenarios for a range of changes to one category, or of amounts moved between two
+
+        Steps that would leave an allocation negative are left out.
+        """
+        try:
+            low, high = finite(sweep['min'], "min"), finite(sweep['max'], "max")
+            step = finite(sweep.get('step') or (high - low) / 20 or 1, "step")
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError("sweep needs finite numeric min, max and step") from e
+        if step <= 0 or high < low:
+            raise ValueError("sweep needs min <= max and a positive step")
+        count = int(math.floor((high - low) / step + 1e-9)) + 1
+        if count > MAX_SCENARIOS:
+            raise ValueError(f"sweep would create {count} scenarios (at most {MAX_SCENARIOS})")
+        scenarios = []
+        for index in range(count):
+            amount = round(low + index * step, 2)
+            if 'to' in sweep:
+                change = {"from": sweep.get('from') or sweep.get('category'), "to": sweep['to'], "amount": amount}
+            else:
+                change = {"category": sweep.get('category'), "delta": amount}
+            try:
+                self.apply_adjustments(allocations, [change])
+            except ValueError as e:
+                if 'negative' not in str(e):
+                    raise
+                continue
+            scenarios.append({"name": f"{amount:+g}", "adjustments": [change]})
+        return scenarios
+
+    def simulate(self, budget_plan, questionnaire_answers=None, scenarios=None, paths=DEFAULT_PATHS,
+                 seed=None, spent=None, elapsed=0.0):
+        """Overspend risk of the current plan and of each scenario
+
+        `spent` (category -> amount) and `elapsed` (fraction of the month gone)
+        simulate only the rest of the month on top of what was already spent.
+        """
+        import numpy as np  # Only simulations need it
+
+        started = time.perf_counter()
+        allocations = plan_categories(budget_plan)
+        if not allocations:
+            raise ValueError("Budget plan has no categories to simulate")
+        scenarios = list(scenarios or [])
+        if len(scenarios) > MAX_SCENARIOS:
+            raise ValueError(f"At most {MAX_SCENARIOS} scenarios per request")
+        evaluated = [{"name": "current", "allocations": allocations}]
+        for index, scenario in enumerate(scenarios):
+            if not isinstance(scenario, dict):
+                raise ValueError(f"Scenario {index + 1} must be an object with name and adjustments")
+            evaluated.append({
+                "name": scenario.get('name') or f"scenario {index + 1}",
+                "adjustments": scenario.get('adjustments', []),
+                "allocations": self.apply_adjustments(allocations, scenario.get('adjustments'))
+            })
+        paths = max(100, min(int(finite(paths or DEFAULT_PATHS, "paths")), MAX_PATHS, MAX_WORK // len(evaluated)))
+        elapsed = min(max(finite(elapsed or 0.0, "elapsed"), 0.0), 1.0)
+        remaining = 1.0 - elapsed
+
+        names = list(allocations)
+        columns = len(names)
+        emergency = names.index(EMERGENCY) if EMERGENCY in allocations else None
+        base = np.array([allocations[name] for name in names])
+        already = np.array([finite((spent or {}).get(name, 0.0), f"spent[{name}]") for name in names])
+        total_budget = base.sum()
+
+        (sigma_essential, sigma_other, median_share, elasticity_essential, elasticity_other), rate = \
+            self.profile(questionnaire_answers)
+        essential = np.array([name in ESSENTIALS for name in names])
+        sigma = np.where(essential, sigma_essential, sigma_other)
+        elasticity = np.where(essential, elasticity_essential, elasticity_other)
+
+        rng = np.random.default_rng(seed)
+        # Planned spending for the rest of the month; the emergency budget is only drawn on by unplanned purchases
+        # Log-normal draws as exp(mu + sigma * z) on float32 normals, about twice as fast as rng.lognormal
+        multipliers = np.exp(np.log(median_share) + sigma * rng.standard_normal((paths, columns), dtype=np.float32))
+        demand = multipliers * (base * remaining)
+        if emergency is not None:
+            demand[:, emergency] = 0.0
+
+        # Unplanned purchases: counts per path, padded to the largest count and masked
+        weights = np.array([UNPLANNED_WEIGHTS.get(name, 0.0) for name in names])
+        counts = rng.poisson(rate * remaining, size=paths)
+        most = int(counts.max()) if paths else 0
+        unplanned = np.zeros((paths, columns))
+        if most and weights.sum() > 0:
+            amounts = np.exp(np.log(UNPLANNED_MEDIAN_SHARE * total_budget)
+                             + UNPLANNED_SIGMA * rng.standard_normal((paths, most), dtype=np.float32))
+            amounts *= np.arange(most) < counts[:, None]
+            where = rng.choice(columns, size=(paths, most), p=weights / weights.sum())
+            cells = (np.arange(paths)[:, None] * columns + where).ravel()
+            unplanned = np.bincount(cells, weights=amounts.ravel(), minlength=paths * columns).reshape(paths, columns)
+        unplanned_total = unplanned.sum(axis=1)
+
+        matrix = np.array([[scenario["allocations"][name] for name in names] for scenario in evaluated])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(base > 0, matrix / base, 1.0)
+        factors = ratio ** elasticity
+
+        # float32 halves the memory traffic of the (scenario, path, category) arrays; cents do not matter here
+        demand = demand.astype(np.float32)
+        unplanned = unplanned.astype(np.float32)
+        spent_before = already.any()
+        p90_index = min(paths - 1, int(paths * 0.9))
+        batch = max(1, BATCH_CELLS // (paths * columns))
+        for first in range(0, len(evaluated), batch):
+            limits = matrix[first:first + batch]                                                     # (B, C)
+            spend = demand[None] * factors[first:first + batch, None, :].astype(np.float32)       # (B, P, C)
+            if spent_before:
+                spend += already.astype(np.float32)
+            if emergency is not None:
+                buffer = np.maximum(limits[:, emergency] - already[emergency], 0.0)                  # (B,)
+                covered = np.minimum(unplanned_total[None], buffer[:, None])                         # (B, P)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    uncovered = np.where(unplanned_total > 0, 1.0 - covered / unplanned_total, 0.0)
+                spend += unplanned[None] * uncovered[..., None].astype(np.float32)
+                spend[..., emergency] += covered.astype(np.float32)
+                shortfall = unplanned_total[None] - covered                                          # (B, P)
+            else:
+                spend += unplanned[None]
+            totals = spend.sum(axis=2, dtype=np.float64)
+            expected = spend.mean(axis=1, dtype=np.float64)
+
+            # From here on `spend` holds the excess over each limit, reordered in place for the percentile
+            spend -= limits[:, None, :].astype(np.float32)
+            probability = np.count_nonzero(spend > 0.005, axis=1) / paths
+            spend.partition(p90_index, axis=1)
+            p90 = spend[:, p90_index, :] + limits
+            np.maximum(spend, 0.0, out=spend)
+            expected_over = spend.mean(axis=1, dtype=np.float64)
+            if emergency is not None:
+                # The buffer cannot be overspent; its risk is running out, and the excess is what spilled over
+                probability[:, emergency] = np.count_nonzero(shortfall > 0.005, axis=1) / paths
+                expected_over[:, emergency] = shortfall.mean(axis=1)
+            total_limits = limits.sum(axis=1)
+            total_probability = np.count_nonzero(totals > total_limits[:, None] + 0.005, axis=1) / paths
+            total_over = np.maximum(totals - total_limits[:, None], 0.0).mean(axis=1)
+
+            for offset, scenario in enumerate(evaluated[first:first + batch]):
+                scenario["categories"] = {
+                    name: {
+                        "allocated": round(float(limits[offset, column]), 2),
+                        "overspend_probability": round(float(probability[offset, column]), 4),
+                        "expected_spend": round(float(expected[offset, column]), 2),
+                        "p90_spend": round(float(p90[offset, column]), 2),
+                        "expected_overspend": round(float(expected_over[offset, column]), 2),
+                    }
+                    for column, name in enumerate(names)
+                }
+                scenario["total"] = {
+                    "allocated": round(float(total_limits[offset]), 2),
+                    "overspend_probability": round(float(total_probability[offset]), 4),
+                    "expected_spend": round(float(totals[offset].mean()), 2),
+                    "expected_overspend": round(float(total_over[offset]), 2),
+                }
+                del scenario["allocations"]
+
+        current = evaluated.pop(0)
+        return {
+            "paths": paths,
+            "seed": seed,
+            "elapsed_fraction": round(elapsed, 4),
+            "assumptions": {
+                "unplanned_purchases_per_month": round(rate, 2),
+                "median_share_spent": median_share,
+            },
+            "current": current,
+            "scenarios": evaluated,
+            "compute_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
@@ -0,0 +1,376 @@
+"""Storage backends for budget plans, keyed by user id.
+
+`JsonFileBudgetStore` keeps the original budget_plan.json layout (other users
+get their own file under budget_plans/, named after a hash of the id). `SqliteBudgetStore` keeps one row per
+category in a WAL-mode database, so reads are indexed point queries and a
+category update is a single-row write. `LogBudgetStore` (budget_log_store.py)
+appends every change to a log and compacts it into periodic snapshots.
+
+Every stored plan carries a `version` that increases on each write; passing
+`expected_version` turns a write into a compare-and-swap.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl  # POSIX only; Windows falls back to the in-process lock
+except ImportError:
+    fcntl = None
+
+DEFAULT_USER_ID = 'default'
+PLAN_META_KEYS = ('total_budget', 'recommendations')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BudgetVersionConflict(Exception):
+    """A compare-and-swap write found a different version than expected"""
+
+    def __init__(self, expected, actual):
+        super().__init__(f"Budget plan version conflict: expected {expected}, found {actual}")
+        self.expected = expected
+        self.actual = actual
+
+
+def recalculate_total(budget_plan):
+    """Sum every category of a plan (everything except the meta keys)"""
+    total = 0
+    for key, value in budget_plan.items():
+        if key not in PLAN_META_KEYS:
+            total += int(value)
+    return total
+
+
+class JsonFileBudgetStore:
+    """One JSON document per user; the default user keeps budget_plan.json"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(BASE_DIR, 'budget_plan.json')
+        self.users_dir = os.path.join(os.path.dirname(self.path), 'budget_plans')
+        self._cache = {}  # file path -> (data, file signature)
+        self._thread_lock = threading.Lock()
+        self._legacy_checked = set()  # user ids whose pre-hash file name was looked for
+
+    def path_for(self, user_id=DEFAULT_USER_ID):
+        """The user's file: a readable prefix plus the id's sha256, so "a/b", "a b" and "a_b" never share one"""
+        if user_id == DEFAULT_USER_ID:
+            return self.path
+        user_id = str(user_id)
+        digest = hashlib.sha256(user_id.encode('utf-8')).hexdigest()
+        readable = re.sub(r'[^A-Za-z0-9_.-]', '_', user_id)[:32]
+        path = os.path.join(self.users_dir, f"{readable}-{digest}.json")
+        if user_id not in self._legacy_checked:
+            self._legacy_checked.add(user_id)
+            self._adopt_legacy_file(user_id, path)
+        return path
+
+    def _adopt_legacy_file(self, user_id, path):
+        """Rename a file saved under the old sanitized-id name, when that name was unambiguous"""
+        if not re.fullmatch(r'[A-Za-z0-9_.-]+', user_id):
+            return  # Its old name may hold another user's plan
+        legacy = os.path.join(self.users_dir, f"{user_id}.json")
+        if os.path.exists(legacy) and not os.path.exists(path):
+            try:
+                os.replace(legacy, path)
+            except FileNotFoundError:
+                pass  # Another worker moved it first
+            else:
+                logger.info("Renamed legacy budget file", extra={"path": path})
+
+    def load(self, user_id=DEFAULT_USER_ID, force_refresh=False):
+        path = self.path_for(user_id)
+        cached = self._cache.get(path)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._cache.pop(path, None)
+            logger.debug("Budget file not found", extra={"path": path})
+            return None
+
+        # Every write os.replace()s the file, so a new inode/mtime means new content,
+        # including writes from other worker processes
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if not force_refresh and cached and cached[1] == signature:
+            CACHE_REQUESTS.inc(cache='budget_store', result='hit')
+            return cached[0]
+        CACHE_REQUESTS.inc(cache='budget_store', result='miss')
+
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        self._cache[path] = (data, signature)
+        if force_refresh:
+            logger.debug("Force loaded budget data from file")
+        return data
+
+    def version(self, user_id=DEFAULT_USER_ID):
+        """Current plan version (0 when there is none); a stat when the cached document is current"""
+        data = self.load(user_id)
+        return data.get('version', 0) if data else 0
+
+    @contextmanager
+    def _write_lock(self, path):
+        """Serialize writers: a thread lock in-process plus an fcntl lock across processes"""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_current(self, path):
+        """Read the on-disk document while holding the write lock (never from cache)"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _atomic_write(self, path, document):
+        """Write to a temp file, fsync it, then os.replace so readers never see a torn file"""
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.budget-', suffix='.tmp')
+        try:
+            # mkstemp creates 0600 files; keep the usual permissions of budget_plan.json
+            os.chmod(tmp_path, 0o644)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(document, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if hasattr(os, 'O_DIRECTORY'):
+            # Persist the rename itself
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self._cache.pop(path, None)
+
+    def save(self, user_id, answers, budget_plan, expected_version=None):
+        path = self.path_for(user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._write_lock(path):
+            current = self._read_current(path)
+            current_version = current.get('version', 0) if current else 0
+            if expected_version is not None and expected_version != current_version:
+                raise BudgetVersionConflict(expected_version, current_version)
+            self._atomic_write(path, {
+                'questionnaire_answers': answers,
+                'budget_plan': budget_plan,
+                'version': current_version + 1
+            })
+        return True
+
+    def update_category(self, user_id, category, amount, expected_version=None):
+        path = self.path_for(user_id)
+        with self._write_lock(path):
+            data = self._read_current(path)
+            if not data or 'budget_plan' not in data:
+                return None
+            current_version = data.get('version', 0)
+            if expected_version is not None and expected_version != current_version:
+                raise BudgetVersionConflict(expected_version, current_version)
+            data['budget_plan'][category] = int(amount)
+            data['budget_plan']['total_budget'] = recalculate_total(data['budget_plan'])
+            data['version'] = current_version + 1
+            self._atomic_write(path, data)
+        return data
+
+    def delete(self, user_id=DEFAULT_USER_ID):
+        path = self.path_for(user_id)
+        with self._write_lock(path):
+            self._cache.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+        return True
+
+
+class SqliteBudgetStore:
+    """Per-user plans in SQLite (WAL): one row per plan, one row per category"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS budget_plans (
+        user_id TEXT PRIMARY KEY,
+        questionnaire_answers TEXT NOT NULL,
+        total_budget INTEGER NOT NULL DEFAULT 0,
+        recommendations TEXT NOT NULL DEFAULT '[]',
+        version INTEGER NOT NULL DEFAULT 1,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS budget_categories (
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID;
+    """
+
+    # Constant SQL so sqlite3's per-connection statement cache reuses prepared statements
+    SELECT_PLAN = "SELECT questionnaire_answers, total_budget, recommendations, version FROM budget_plans WHERE user_id = ?"
+    SELECT_CATEGORIES = "SELECT category, amount FROM budget_categories WHERE user_id = ? ORDER BY position"
+    UPSERT_PLAN = """
+        INSERT INTO budget_plans (user_id, questionnaire_answers, total_budget, recommendations, version, updated_at)
+        VALUES (?, ?, ?, ?, 1, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            questionnaire_answers = excluded.questionnaire_answers,
+            total_budget = excluded.total_budget,
+            recommendations = excluded.recommendations,
+            version = budget_plans.version + 1,
+            updated_at = excluded.updated_at
+    """
+    DELETE_CATEGORIES = "DELETE FROM budget_categories WHERE user_id = ?"
+    INSERT_CATEGORY = "INSERT INTO budget_categories (user_id, category, amount, position) VALUES (?, ?, ?, ?)"
+    UPSERT_CATEGORY = """
+        INSERT INTO budget_categories (user_id, category, amount, position)
+        VALUES (?, ?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM budget_categories WHERE user_id = ?))
+        ON CONFLICT(user_id, category) DO UPDATE SET amount = excluded.amount
+    """
+    REFRESH_TOTAL = """
+        UPDATE budget_plans
+        SET total_budget = (SELECT COALESCE(SUM(amount), 0) FROM budget_categories WHERE user_id = ?),
+            version = version + 1,
+            updated_at = ?
+        WHERE user_id = ?
+    """
+    DELETE_PLAN = "DELETE FROM budget_plans WHERE user_id = ?"
+    SELECT_VERSION = "SELECT version FROM budget_plans WHERE user_id = ?"
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(BASE_DIR, 'budget_plans.db')
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        """One connection per thread and process; WAL lets readers run alongside a writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()  # A preforked worker must not reuse the parent's connection
+        return conn
+
+    @contextmanager
+    def _write_transaction(self):
+        """BEGIN IMMEDIATE takes the write lock up front so version checks cannot race"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def _read_transaction(self):
+        """Multi-statement reads in one transaction, so they all see the same committed plan"""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.commit()
+
+    def _check_version(self, conn, user_id, expected_version):
+        row = conn.execute(self.SELECT_VERSION, (user_id,)).fetchone()
+        current_version = row[0] if row else 0
+        if expected_version is not None and expected_version != current_version:
+            raise BudgetVersionConflict(expected_version, current_version)
+        return row is not None
+
+    def load(self, user_id=DEFAULT_USER_ID, force_refresh=False):
+        with self._read_transaction() as conn:
+            row = conn.execute(self.SELECT_PLAN, (user_id,)).fetchone()
+            if row is None:
+                return None
+            answers, total_budget, recommendations, version = row
+            budget_plan = {category: amount for category, amount in conn.execute(self.SELECT_CATEGORIES, (user_id,))}
+        budget_plan['total_budget'] = total_budget
+        budget_plan['recommendations'] = json.loads(recommendations)
+        return {
+            'questionnaire_answers': json.loads(answers),
+            'budget_plan': budget_plan,
+            'version': version
+        }
+
+    def version(self, user_id=DEFAULT_USER_ID):
+        """Current plan version (0 when there is none) from one indexed lookup"""
+        row = self._connection().execute(self.SELECT_VERSION, (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def save(self, user_id, answers, budget_plan, expected_version=None):
+        categories = [(key, value) for key, value in budget_plan.items() if key not in PLAN_META_KEYS]
+        try:
+            total = int(budget_plan.get('total_budget', 0))
+        except (TypeError, ValueError):
+            total = recalculate_total(budget_plan)
+        with self._write_transaction() as conn:
+            self._check_version(conn, user_id, expected_version)
+            conn.execute(self.UPSERT_PLAN, (
+                user_id, json.dumps(answers), total,
+                json.dumps(budget_plan.get('recommendations', [])), time.time()
+            ))
+            conn.execute(self.DELETE_CATEGORIES, (user_id,))
+            conn.executemany(self.INSERT_CATEGORY, [
+                (user_id, category, int(amount), position)
+                for position, (category, amount) in enumerate(categories)
+            ])
+        return True
+
+    def update_category(self, user_id, category, amount, expected_version=None):
+        with self._write_transaction() as conn:
+            if not self._check_version(conn, user_id, expected_version):
+                return None
+            conn.execute(self.UPSERT_CATEGORY, (user_id, category, int(amount), user_id))
+            conn.execute(self.REFRESH_TOTAL, (user_id, time.time(), user_id))
+        return self.load(user_id)
+
+    def delete(self, user_id=DEFAULT_USER_ID):
+        with self._write_transaction() as conn:
+            conn.execute(self.DELETE_CATEGORIES, (user_id,))
+            conn.execute(self.DELETE_PLAN, (user_id,))
+        return True
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def create_budget_store(backend, path=None, **options):
+    """Return the store selected by Config.BUDGET_STORE, shared by every BudgetService in the process"""
+    with _stores_lock:
+        store = _stores.get((backend, path))
+        if store is None:
+            if backend == 'sqlite':
+                store = SqliteBudgetStore(path)
+            elif backend == 'log':
+                from services.budget_log_store import LogBudgetStore
+                store = LogBudgetStore(path, **options)
+            else:
+                store = JsonFileBudgetStore(path)
+            _stores[(backend, path)] = store
+        return store
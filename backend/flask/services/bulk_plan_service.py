@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+
+from services.shared_state import get_state_store
+from utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+QUESTIONNAIRE_FIELDS = ["age_group", "monthly_budget", "top_categories", "shopping_behavior", "unplanned_purchases", "primary_goal"]
+
+
+class BulkPlanPipeline:
+    """Generate budget plans for a CSV of questionnaire answers.
+
+    Rows are streamed with pandas in chunks, recommendations run on a bounded
+    thread pool behind a token-bucket rate limit, and every finished plan is
+    appended to a JSONL file. That file is also the checkpoint: rerunning with
+    the same output skips rows already written, so an interrupted run resumes.
+    """
+
+    def __init__(self, budget_service, concurrency=4, rate_per_sec=2.0, chunk_size=500, id_column='user_id'):
+        self.budget_service = budget_service
+        self.concurrency = max(1, int(concurrency))
+        if rate_per_sec and rate_per_sec < 0:
+            raise ValueError("rate_per_sec must be positive (0 = unlimited)")
+        self.rate_limiter = TokenBucket(rate_per_sec, capacity=self.concurrency) if rate_per_sec else None
+        self.chunk_size = chunk_size
+        self.id_column = id_column
+
+        self._lock = threading.Lock()
+        self.stats = {'status': 'pending', 'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0}
+
+    @staticmethod
+    def errors_path(output_path):
+        return output_path + '.errors.jsonl'
+
+    def _completed_ids(self, output_path):
+        """Row ids already present in the output (the resume checkpoint)"""
+        done = set()
+        if not os.path.exists(output_path):
+            return done
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(str(json.loads(line)['id']))
+                except (ValueError, KeyError):
+                    continue  # A torn last line from a crash is simply redone
+        return done
+
+    @staticmethod
+    def _terminate_torn_line(output_path):
+        """Make sure appends after a crash start on a fresh line"""
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            with open(output_path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+
+    def _row_to_answers(self, row):
+        answers = {field: row.get(field, '') for field in QUESTIONNAIRE_FIELDS}
+        # CSV exports flatten the two top categories into one cell
+        categories = answers['top_categories']
+        if isinstance(categories, str) and any(sep in categories for sep in ';|'):
+            answers['top_categories'] = [c.strip() for c in categories.replace('|', ';').split(';') if c.strip()]
+        return answers
+
+    def _rows(self, input_path, done):
+        """Yield (row_id, answers) for rows that still need a plan"""
+        import pandas as pd  # Heavy; only bulk jobs need it
+
+        row_number = 0
+        for chunk in pd.read_csv(input_path, chunksize=self.chunk_size, dtype=str, keep_default_na=False):
+            for row in chunk.to_dict('records'):
+                row_id = str(row.get(self.id_column) or row_number)
+                row_number += 1
+                if row_id in done:
+                    with self._lock:
+                        self.stats['skipped'] += 1
+                    continue
+                yield row_id, self._row_to_answers(row)
+
+    def _generate(self, row_id, answers):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        return row_id, answers, self.budget_service.get_budget_recommendation(answers)
+
+    def _record(self, out, errors, future):
+        try:
+            row_id, answers, plan = future.result()
+            error = None if plan else 'Failed to generate budget recommendation'
+        except Exception as e:
+            row_id, answers, plan, error = getattr(future, 'row_id', None), None, None, str(e)
+
+        with self._lock:
+            self.stats['processed'] += 1
+            if error:
+                self.stats['failed'] += 1
+                errors.write(json.dumps({'id': row_id, 'error': error}) + '\n')
+                errors.flush()
+            else:
+                self.stats['succeeded'] += 1
+                out.write(json.dumps({'id': row_id, 'questionnaire_answers': answers, 'budget_plan': plan}) + '\n')
+                out.flush()
+
+    def run(self, input_path, output_path):
+        """Process input_path into output_path; returns the final stats"""
+        self.stats['status'] = 'running'
+        done = self._completed_ids(output_path)
+        # Keep a small backlog per worker so memory stays flat on large files
+        max_in_flight = self.concurrency * 2
+
+        try:
+            self._terminate_torn_line(output_path)
+            with open(output_path, 'a', encoding='utf-8') as out, \
+                    open(self.errors_path(output_path), 'a', encoding='utf-8') as errors, \
+                    ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                in_flight = set()
+                for row_id, answers in self._rows(input_path, done):
+                    future = pool.submit(self._generate, row_id, answers)
+                    future.row_id = row_id
+                    in_flight.add(future)
+                    if len(in_flight) >= max_in_flight:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for f in finished:
+                            self._record(out, errors, f)
+                for f in as_completed(in_flight):
+                    self._record(out, errors, f)
+            self.stats['status'] = 'completed'
+        except Exception as e:
+            logger.error("Bulk plan generation failed: %s", e)
+            self.stats['status'] = 'failed'
+            self.stats['error'] = str(e)
+        return dict(self.stats)
+
+
+class BulkJobRegistry:
+    """Bulk jobs started through the API, tracked in the shared state store.
+
+    A job runs in the worker that accepted the upload, which publishes its
+    progress every `publish_interval` seconds, so a status poll that reaches
+    any other worker still finds it. Records (and their upload and result
+    files) are dropped `ttl` seconds after the job's last update; a running
+    job that stops publishing (its worker died) is reported as interrupted.
+    """
+
+    def __init__(self, jobs_dir, ttl=86400, publish_interval=1.0):
+        self.jobs_dir = jobs_dir
+        self.ttl = ttl
+        self.publish_interval = publish_interval
+        self.stale_after = max(30.0, publish_interval * 10)
+        self.jobs = get_state_store().namespace('bulk_jobs', ttl=ttl)
+
+    def paths(self, job_id):
+        """(input CSV, output JSONL) for a job"""
+        return (os.path.join(self.jobs_dir, f"{job_id}.csv"), os.path.join(self.jobs_dir, f"{job_id}.jsonl"))
+
+    def get(self, job_id):
+        """The job's progress as reported to clients, or None when unknown or expired"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job = dict(job)
+        updated_at = job.pop('updated_at', 0)
+        if job['status'] in ('pending', 'running') and time.time() - updated_at > self.stale_after:
+            job.update(status='failed', error="Bulk job was interrupted; upload the file again")
+        return job
+
+    def start(self, job_id, pipeline):
+        """Record the job and run the pipeline on a background thread"""
+        self.evict_expired()
+        self._publish(job_id, pipeline.stats)
+        threading.Thread(target=self._run, args=(job_id, pipeline), name=f"bulk-{job_id[:8]}", daemon=True).start()
+
+    def _publish(self, job_id, stats):
+        self.jobs[job_id] = {**stats, "updated_at": time.time()}
+
+    def _run(self, job_id, pipeline):
+        finished = threading.Event()
+
+        def publish_progress():
+            while not finished.wait(self.publish_interval):
+                self._publish(job_id, dict(pipeline.stats))
+
+        threading.Thread(target=publish_progress, daemon=True).start()
+        try:
+            stats = pipeline.run(*self.paths(job_id))
+        finally:
+            finished.set()
+        self._publish(job_id, stats)
+
+    def evict_expired(self):
+        """Delete files of jobs whose records have expired"""
+        # Listing the namespace also drops expired records from the in-memory store
+        known = set(self.jobs)
+        cutoff = time.time() - self.ttl
+        try:
+            names = os.listdir(self.jobs_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.split('.', 1)[0] in known:
+                continue
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
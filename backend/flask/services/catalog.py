@@ -0,0 +1,196 @@
+"""Recommendation catalog held in immutable snapshots and reloaded in the background.
+
+The catalog (related items per product and the products sold for each
+item) lives in catalog.json instead of code. A CatalogLoader parses it into
+a CatalogSnapshot: read-only mappings plus the indexes derived from them,
+built once per catalog version. When the file changes, the loader's
+watcher thread builds a complete new snapshot on the side and swaps it in
+with a single reference assignment. Readers never take a lock: a request
+grabs `loader.snapshot` once and uses that object throughout, so it sees
+either the old catalog or the new one, never a mix, and a refresh costs
+requests nothing. A catalog that fails to parse is logged and the previous
+snapshot stays in service.
+
+    snapshot = loader.snapshot
+    for item_name, products in snapshot.related("laptop"):
+        ...
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CATALOG_RELOADS = registry.counter('catalog_reloads_total', 'Catalog reload attempts by result (swapped, failed)')
+
+PRODUCT_FIELDS = ('id', 'name', 'seller_city', 'price')
+
+
+class CatalogError(ValueError):
+    """The catalog source is missing or malformed"""
+
+
+class CatalogSnapshot:
+    """One immutable catalog version with its derived indexes"""
+    __slots__ = ('version', 'source', 'loaded_at', 'recommendations', 'products', 'seller_cities',
+                 '_related', '_product_count')
+
+    def __init__(self, recommendations, products, version, source=None):
+        freeze = object.__setattr__
+        freeze(self, 'version', version)
+        freeze(self, 'source', source)
+        freeze(self, 'loaded_at', time.time())
+        freeze(self, 'recommendations', MappingProxyType(
+            {name.lower(): tuple(items) for name, items in recommendations.items()}))
+        freeze(self, 'products', MappingProxyType(
+            {name.lower(): tuple(MappingProxyType(dict(product)) for product in items)
+             for name, items in products.items()}))
+        # Main product -> ((item name, products), ...) with items nobody sells left out
+        freeze(self, '_related', MappingProxyType({
+            name: tuple((item, self.products[item.lower()]) for item in items if self.products.get(item.lower()))
+            for name, items in self.recommendations.items()
+        }))
+        freeze(self, 'seller_cities', frozenset(
+            product['seller_city'] for items in self.products.values() for product in items))
+        freeze(self, '_product_count', sum(len(items) for items in self.products.values()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CatalogSnapshot is immutable; load a new snapshot instead")
+
+    def related(self, main_product):
+        """(item name, products) pairs recommended alongside `main_product`"""
+        return self._related.get(main_product.lower(), ())
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "main_products": len(self.recommendations),
+            "item_types": len(self.products),
+            "products": self._product_count,
+            "seller_cities": len(self.seller_cities),
+        }
+
+
+def parse_catalog(data, version, source=None):
+    """Validate catalog JSON ({"recommendations": {...}, "products": {...}}) into a snapshot"""
+    if not isinstance(data, dict):
+        raise CatalogError("Catalog must be a JSON object")
+    recommendations, products = data.get('recommendations'), data.get('products')
+    if not isinstance(recommendations, dict) or not isinstance(products, dict):
+        raise CatalogError("Catalog needs 'recommendations' and 'products' objects")
+    for name, items in recommendations.items():
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            raise CatalogError(f"recommendations[{name!r}] must be a list of item names")
+    for name, items in products.items():
+        if not isinstance(items, list):
+            raise CatalogError(f"products[{name!r}] must be a list")
+        for product in items:
+            missing = [field for field in PRODUCT_FIELDS if field not in product] if isinstance(product, dict) \
+                else list(PRODUCT_FIELDS)
+            if missing:
+                raise CatalogError(f"A product under {name!r} is missing {', '.join(missing)}")
+            if not isinstance(product['price'], (int, float)) or isinstance(product['price'], bool):
+                raise CatalogError(f"Product {product['id']!r} has a non-numeric price")
+    return CatalogSnapshot(recommendations, products, version, source)
+
+
+def load_catalog_file(path):
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except OSError as e:
+        raise CatalogError(f"Cannot read catalog {path}: {e}") from e
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise CatalogError(f"Catalog {path} is not valid JSON: {e}") from e
+    # Content hash, so every worker reports the same version for the same file
+    return parse_catalog(data, hashlib.sha1(raw).hexdigest()[:12], path)
+
+
+class CatalogLoader:
+    """Current catalog snapshot, swapped atomically when the source file changes"""
+
+    def __init__(self, path, interval=0):
+        self.path = path
+        self.interval = interval
+        self.failures = 0
+        self.last_error = None
+        self._file_state = False  # Never stat'ed; a missing file (None) still gets one load attempt
+        self._reload_lock = threading.Lock()  # Serializes reloaders only; readers never wait on it
+        self._stop = threading.Event()
+        self._watching = False
+        self.snapshot = CatalogSnapshot({}, {}, version='empty')
+        self.reload()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force=False):
+        """Swap in a new snapshot if the file changed (or when forced); returns True when swapped
+
+        Raises CatalogError when forced and the catalog cannot be loaded.
+        """
+        with self._reload_lock:
+            file_state = self._stat()
+            if not force and file_state == self._file_state:
+                return False
+            try:
+                snapshot = load_catalog_file(self.path)
+            except CatalogError as e:
+                self._file_state = file_state  # Do not retry a broken file until it changes again
+                self.failures += 1
+                self.last_error = str(e)
+                CATALOG_RELOADS.inc(result='failed')
+                logger.error("Catalog reload failed; keeping version %s: %s", self.snapshot.version, e)
+                if force:
+                    raise
+                return False
+            self._file_state = file_state
+            self.last_error = None
+            if snapshot.version == self.snapshot.version:
+                return False  # Touched but unchanged
+            previous, self.snapshot = self.snapshot, snapshot  # The swap: one reference assignment
+            CATALOG_RELOADS.inc(result='swapped')
+            logger.info("Catalog swapped", extra={"previous_version": previous.version, "version": snapshot.version,
+                                                  "item_types": len(snapshot.products)})
+            return True
+
+    def start(self):
+        """Poll the file every `interval` seconds (0 = reload only on request)"""
+        if not self.interval or self._watching:
+            return
+        self._watching = True
+        # Threads do not survive a fork: a worker forked after this (gunicorn preload) starts its own watcher
+        os.register_at_fork(after_in_child=self._start_watcher)
+        self._start_watcher()
+
+    def _start_watcher(self):
+        if not self._stop.is_set():
+            threading.Thread(target=self._watch, name='catalog-watcher', daemon=True).start()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Catalog watcher error")
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {**self.snapshot.describe(), "path": self.path, "reload_interval": self.interval,
+                "failures": self.failures, "last_error": self.last_error}
@@ -1,88 +1,121 @@
+import asyncio
 import json
-import os
+import logging
 import datetime
 import re
-from groq import Groq
 from config import Config
 from services.budget_service import BudgetService
+from services.budget_store import DEFAULT_USER_ID
+from services.response_formatter import format_response
+from services.shared_state import get_state_store
+from services.spend_rollup import get_spend_rollup
+from utils.lru_cache import LRUCache
+from utils.metrics import track_llm_call, CACHE_REQUESTS
 
-class ChatbotService:
-    def __init__(self):
-        self.client = Groq(api_key=Config.GROQ_API_KEY)
-        self.budget_service = BudgetService()
-        self.conversation_history_store = {}
-        self.pending_budget_updates = {}
-        # Reduce cache duration and add file modification tracking
-        self._cached_budget = None
-        self._cache_timestamp = None
-        self._cache_duration = 10  # Reduced to 10 seconds for more frequent updates
-        self._last_file_mtime = None
-
-    def _get_budget_file_mtime(self):
-        """Get the modification time of budget_plan.json"""
-        try:
-            budget_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'budget_plan.json')
-            if os.path.exists(budget_file_path):
-                return os.path.getmtime(budget_file_path)
-        except Exception as e:
-            print(f"Error getting budget file mtime: {e}")
-        return None
+logger = logging.getLogger(__name__)
 
-    def _is_budget_file_modified(self):
-        """Check if budget_plan.json has been modified since last cache"""
-        current_mtime = self._get_budget_file_mtime()
-        if current_mtime and self._last_file_mtime:
-            return current_mtime > self._last_file_mtime
-        return True  # If we can't determine, assume it's modified
+# The one session every client shared before per-client session ids; not a client identity
+LEGACY_SHARED_SESSION = "default_session"
 
-    def _load_user_budget(self, force_refresh=False):
-        """Load user's budget plan with smart caching and file modification detection"""
-        current_time = datetime.datetime.now().timestamp()
-        
-        # Check if budget file has been modified
-        file_modified = self._is_budget_file_modified()
-        
-        # Force refresh if:
-        # 1. Explicitly requested
-        # 2. Cache is expired
-        # 3. Budget file has been modified
-        # 4. No cached data exists
-        should_refresh = (
-            force_refresh or 
-            not self._cached_budget or 
-            not self._cache_timestamp or 
-            current_time - self._cache_timestamp > self._cache_duration or
-            file_modified
-        )
+class ChatbotService:
+    def __init__(self, budget_service=None):
+        self._client = None
+        self.budget_service = budget_service or BudgetService()
+        # Dict-like views over the shared state store, so every worker process sees the same sessions
+        state = get_state_store()
+        self.conversation_history_store = state.namespace('conversations', ttl=Config.CHAT_SESSION_TTL)
+        self.pending_budget_updates = state.namespace('pending_budget_updates', ttl=Config.CHAT_PENDING_TTL)
+        # Each user's plan, reused while the store reports the same version (10s at most)
+        self._cache_duration = 10
+        self._budget_cache = LRUCache(max_size=256, ttl=self._cache_duration)  # user_id -> (plan, loaded_at)
+        self._async_client = None
+
+    @property
+    def client(self):
+        """Groq client, created (and the SDK imported) on first use"""
+        if self._client is None:
+            from groq import Groq
+            self._client = Groq(api_key=Config.GROQ_API_KEY)
+        return self._client
+
+    @property
+    def async_client(self):
+        """Async Groq client, created on first use by the ASGI entry point"""
+        if self._async_client is None:
+            from groq import AsyncGroq
+            self._async_client = AsyncGroq(api_key=Config.GROQ_API_KEY)
+        return self._async_client
+
+    def close(self):
+        """Release the HTTP connection pool of the sync client, if one was created"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _load_user_budget(self, force_refresh=False, user_id=DEFAULT_USER_ID):
+        """Load a user's budget plan, reusing the cached copy while the store version is unchanged"""
+        cached = None if force_refresh else self._budget_cache.get(user_id)
+        # A version lookup is a stat or one indexed query, cheaper than reloading the plan
+        if cached is not None and cached[0].get('version', 0) == self.budget_service.budget_version(user_id):
+            CACHE_REQUESTS.inc(cache='chatbot_budget', result='hit')
+            return cached[0]
+        CACHE_REQUESTS.inc(cache='chatbot_budget', result='miss')
         
-        if should_refresh:
-            print(f"🔄 Loading fresh budget data - Force: {force_refresh}, File modified: {file_modified}, Cache expired: {current_time - (self._cache_timestamp or 0) > self._cache_duration}")
-            
-            # Load fresh data from file
-            budget_data = self.budget_service.load_budget_plan(force_refresh=True)
-            
-            # Update cache and file modification time
-            if budget_data:
-                self._cached_budget = budget_data
-                self._cache_timestamp = current_time
-                self._last_file_mtime = self._get_budget_file_mtime()
-                print(f"✅ Budget cache updated at {datetime.datetime.now().strftime('%H:%M:%S')}")
-                print(f"📊 Current budget total: ₹{budget_data.get('budget_plan', {}).get('total_budget', 0):,}")
-            else:
-                print("❌ Failed to load budget data")
+        budget_data = self.budget_service.load_budget_plan(force_refresh=True, user_id=user_id)
+        if budget_data:
+            self._budget_cache.set(user_id, (budget_data, datetime.datetime.now().timestamp()))
+            logger.debug("Budget cache updated", extra={
+                "user_id": user_id, "version": budget_data.get('version'),
+                "total_budget": budget_data.get('budget_plan', {}).get('total_budget', 0)})
         else:
-            print(f"📋 Using cached budget data (age: {current_time - self._cache_timestamp:.1f}s)")
+            self._budget_cache.pop(user_id)
+            logger.error("Failed to load budget data")
+        return budget_data
+
+    def _clear_budget_cache(self, user_id=None):
+        """Clear one user's cached budget (every user's when None) to force a fresh load"""
+        if user_id is None:
+            self._budget_cache.clear()
+        else:
+            self._budget_cache.pop(user_id)
+        logger.debug("Budget cache cleared")
+
+    def _match_budget_category(self, category, user_id=DEFAULT_USER_ID):
+        """Plan category named by free text ("fashion", "my books"), or None"""
+        category = category.strip()
+        category_mappings = {
+            'books': 'Books & Media',
+            'book': 'Books & Media',
+            'media': 'Books & Media',
+            'electronics': 'Electronics & Accessories',
+            'electronic': 'Electronics & Accessories',
+            'accessories': 'Electronics & Accessories',
+            'grocery': 'Groceries & Household Items',
+            'groceries': 'Groceries & Household Items',
+            'household': 'Groceries & Household Items',
+            'fashion': 'Fashion & Beauty',
+            'beauty': 'Fashion & Beauty',
+            'home': 'Home & Kitchen',
+            'kitchen': 'Home & Kitchen',
+            'emergency': 'Emergency/Unplanned Budget',
+            'unplanned': 'Emergency/Unplanned Budget'
+        }
         
-        return self._cached_budget
-
-    def _clear_budget_cache(self):
-        """Clear the budget cache to force fresh load"""
-        self._cached_budget = None
-        self._cache_timestamp = None
-        self._last_file_mtime = None
-        print("🗑️ Budget cache cleared - next request will load fresh data")
+        # Find matching category
+        for key, value in category_mappings.items():
+            if key in category.lower():
+                return value
+        
+        # Try partial matching with existing categories
+        current_budget = self._load_user_budget(user_id=user_id)
+        if current_budget and 'budget_plan' in current_budget:
+            for cat in current_budget['budget_plan'].keys():
+                if cat.lower() != 'total_budget' and cat.lower() != 'recommendations':
+                    if any(word in cat.lower() for word in category.split()):
+                        return cat
+        return None
 
-    def _parse_budget_update_request(self, user_input):
+    def _parse_budget_update_request(self, user_input, user_id=DEFAULT_USER_ID):
         """Parse budget update requests from user input"""
         # Common patterns for budget updates
         patterns = [
@@ -100,42 +133,7 @@ class ChatbotService:
                 else:
                     category, amount = match.groups()
                 
-                # Clean category name
-                category = category.strip()
-                category_mappings = {
-                    'books': 'Books & Media',
-                    'book': 'Books & Media',
-                    'media': 'Books & Media',
-                    'electronics': 'Electronics & Accessories',
-                    'electronic': 'Electronics & Accessories',
-                    'accessories': 'Electronics & Accessories',
-                    'grocery': 'Groceries & Household Items',
-                    'groceries': 'Groceries & Household Items',
-                    'household': 'Groceries & Household Items',
-                    'fashion': 'Fashion & Beauty',
-                    'beauty': 'Fashion & Beauty',
-                    'home': 'Home & Kitchen',
-                    'kitchen': 'Home & Kitchen',
-                    'emergency': 'Emergency/Unplanned Budget',
-                    'unplanned': 'Emergency/Unplanned Budget'
-                }
-                
-                # Find matching category
-                matched_category = None
-                for key, value in category_mappings.items():
-                    if key in category.lower():
-                        matched_category = value
-                        break
-                
-                if not matched_category:
-                    # Try partial matching with existing categories
-                    current_budget = self._load_user_budget()
-                    if current_budget and 'budget_plan' in current_budget:
-                        for cat in current_budget['budget_plan'].keys():
-                            if cat.lower() != 'total_budget' and cat.lower() != 'recommendations':
-                                if any(word in cat.lower() for word in category.split()):
-                                    matched_category = cat
-                                    break
+                matched_category = self._match_budget_category(category, user_id)
                 
                 return {
                     'category': matched_category or category,
@@ -145,11 +143,68 @@ class ChatbotService:
         
         return None
 
-    def _confirm_budget_update(self, session_id, update_request):
+    def _parse_what_if_request(self, user_input, user_id=DEFAULT_USER_ID):
+        """Adjustments for "what if I cut fashion by 2000" style questions, or None"""
+        text = user_input.lower().replace(',', '')
+        if not re.search(r'\bwhat\s+(?:would\s+happen\s+|happens\s+)?if\b', text):
+            return None
+        
+        move = re.search(r'(?:move|shift|transfer)\s+(?:₹|rs\.?\s*)?(\d+)\s+from\s+(?:my\s+)?(.+?)\s+to\s+(?:my\s+)?(.+?)'
+                         r'(?:\s+budget)?\s*[?.!]*$', text)
+        if move:
+            amount, source, target = move.groups()
+            source, target = self._match_budget_category(source, user_id), self._match_budget_category(target, user_id)
+            if source and target:
+                return [{"from": source, "to": target, "amount": int(amount)}]
+            return None
+        
+        change = re.search(r'(cut|reduce|decrease|lower|increase|raise|boost|set|change)\s+(?:my\s+)?(.+?)\s+'
+                           r'(?:budget\s+)?(by|to)\s+(?:₹|rs\.?\s*)?(\d+)', text)
+        if not change:
+            return None
+        verb, category, mode, amount = change.groups()
+        category = self._match_budget_category(category, user_id)
+        if not category:
+            return None
+        if mode == 'to':
+            return [{"category": category, "amount": int(amount)}]
+        sign = -1 if verb in ('cut', 'reduce', 'decrease', 'lower') else 1
+        return [{"category": category, "delta": sign * int(amount)}]
+
+    def _answer_what_if(self, adjustments, user_id=DEFAULT_USER_ID):
+        """Simulate a what-if locally instead of asking the model to do the arithmetic"""
+        current_budget = self._load_user_budget(user_id=user_id)
+        if not current_budget or 'budget_plan' not in current_budget:
+            return "I couldn't find a budget plan yet. Create one from the questionnaire and I can simulate changes to it."
+        try:
+            # Fixed seed: asking the same question twice gives the same numbers
+            result = self.budget_service.simulate_plan(
+                current_budget, [{"name": "what-if", "adjustments": adjustments}], seed=0)
+        except ValueError as e:
+            return f"I couldn't simulate that change: {e}"
+        
+        before, after = result['current'], result['scenarios'][0]
+        lines = [f"I simulated {result['paths']:,} months of spending with and without that change:", ""]
+        for category, scenario in after['categories'].items():
+            current = before['categories'][category]
+            if (current['allocated'] == scenario['allocated']
+                    and abs(current['overspend_probability'] - scenario['overspend_probability']) < 0.01):
+                continue
+            risk = "chance of running out" if category == 'Emergency/Unplanned Budget' else "chance of overspending"
+            lines.append(f"• {category}: ₹{current['allocated']:,.0f} → ₹{scenario['allocated']:,.0f}, "
+                         f"{risk} {current['overspend_probability']:.0%} → {scenario['overspend_probability']:.0%}")
+        lines.append(f"• Whole budget: ₹{before['total']['allocated']:,.0f} → ₹{after['total']['allocated']:,.0f}, "
+                     f"chance of going over {before['total']['overspend_probability']:.0%} → "
+                     f"{after['total']['overspend_probability']:.0%}")
+        lines += ["", "Nothing has been changed yet. To apply it, ask me to set the category to the new amount."]
+        return "\n".join(lines)
+
+    def _confirm_budget_update(self, session_id, update_request, user_id=DEFAULT_USER_ID):
         """Store pending budget update and ask for confirmation"""
-        self.pending_budget_updates[session_id] = update_request
+        # The confirmation applies to the plan of the user who asked, whatever the "yes" request carries
+        self.pending_budget_updates[session_id] = {**update_request, 'user_id': user_id}
         
-        current_budget = self._load_user_budget()
+        current_budget = self._load_user_budget(user_id=user_id)
         current_amount = 0
         
         if current_budget and 'budget_plan' in current_budget:
@@ -176,12 +231,11 @@ Would you like me to proceed with this change? Please reply with:
         user_input_lower = user_input.lower().strip()
         
         if any(word in user_input_lower for word in ['yes', 'confirm', 'proceed', 'ok', 'sure']):
-            # User confirmed - proceed with update
-            update_request = self.pending_budget_updates[session_id]
-            success = self._execute_budget_update(update_request)
-            
-            # Clear pending update
-            del self.pending_budget_updates[session_id]
+            # User confirmed - take the pending update (pop is atomic, so a retried request cannot apply it twice)
+            update_request = self.pending_budget_updates.pop(session_id)
+            if update_request is None:
+                return None
+            success = self._execute_budget_update(update_request, update_request.get('user_id', DEFAULT_USER_ID))
             
             if success:
                 return f"✅ Successfully updated your {update_request['category']} budget to ₹{update_request['amount']:,}!\n\nYour budget has been saved and updated. You can see the changes in your budget overview."
@@ -190,68 +244,56 @@ Would you like me to proceed with this change? Please reply with:
         
         elif any(word in user_input_lower for word in ['no', 'cancel', 'abort', 'stop']):
             # User cancelled
-            del self.pending_budget_updates[session_id]
+            self.pending_budget_updates.pop(session_id)
             return "Budget update cancelled. Your current budget remains unchanged."
         
         else:
             # Invalid response
             return "Please respond with 'yes' to confirm the budget update or 'no' to cancel."
 
-    def _execute_budget_update(self, update_request):
+    def _execute_budget_update(self, update_request, user_id=DEFAULT_USER_ID):
         """Execute the actual budget update"""
         try:
             # Load current budget data with force refresh
-            current_data = self._load_user_budget(force_refresh=True)
+            current_data = self._load_user_budget(force_refresh=True, user_id=user_id)
             if not current_data or 'budget_plan' not in current_data:
-                print("❌ No budget data found for update")
+                logger.error("No budget data found for update")
                 return False
             
-            # Update the specific category
-            current_data['budget_plan'][update_request['category']] = update_request['amount']
-            
-            # Recalculate total budget
-            new_total = 0
-            for key, value in current_data['budget_plan'].items():
-                if key not in ['total_budget', 'recommendations']:
-                    new_total += int(value)
-            
-            current_data['budget_plan']['total_budget'] = new_total
-            
-            # Save to server (budget_plan.json)
-            success = self.budget_service.save_budget_plan(
-                current_data.get('questionnaire_answers', {}),
-                current_data['budget_plan']
+            # Single-category write; the store recalculates the total
+            updated_data = self.budget_service.update_budget_category(
+                update_request['category'], update_request['amount'], user_id
             )
+            success = updated_data is not None
+            new_total = updated_data['budget_plan']['total_budget'] if success else 0
             
             if success:
                 # Clear cache to force fresh load on next request
-                self._clear_budget_cache()
-                print(f"✅ Budget updated successfully: {update_request['category']} = ₹{update_request['amount']:,}")
-                print(f"📊 New total budget: ₹{new_total:,}")
-                
-                # Wait a moment for file system to update, then verify the change
-                import time
-                time.sleep(0.1)
+                self._clear_budget_cache(user_id)
+                logger.info("Budget updated", extra={"user_id": user_id, "category": update_request['category'],
+                                                      "amount": update_request['amount'], "total_budget": new_total})
                 
                 # Verify the update by loading fresh data
-                verification_data = self._load_user_budget(force_refresh=True)
+                verification_data = self._load_user_budget(force_refresh=True, user_id=user_id)
                 if verification_data and 'budget_plan' in verification_data:
                     actual_amount = verification_data['budget_plan'].get(update_request['category'], 0)
                     if actual_amount == update_request['amount']:
-                        print(f"✅ Update verified: {update_request['category']} is now ₹{actual_amount:,}")
+                        logger.debug("Update verified", extra={"category": update_request['category'], "amount": actual_amount})
                     else:
-                        print(f"⚠️ Update verification failed: Expected ₹{update_request['amount']:,}, got ₹{actual_amount:,}")
+                        logger.warning("Update verification failed: expected %s, got %s", update_request['amount'], actual_amount)
                 
             return success
             
         except Exception as e:
-            print(f"❌ Error executing budget update: {e}")
+            logger.error("Error executing budget update: %s", e)
             return False
 
-    def _get_base_prompt(self):
+    def _get_base_prompt(self, user_id=DEFAULT_USER_ID):
         """Get the base prompt for the Amazon budgeting chatbot with fresh budget data"""
-        # Always load fresh budget data for system prompt
-        user_budget_data = self._load_user_budget(force_refresh=False)  # Let caching work, but respect file changes
+        # Cached plan, reloaded whenever the store's version moves on
+        user_budget_data = self._load_user_budget(user_id=user_id)
+        cached = self._budget_cache.get(user_id)
+        loaded_at = cached[1] if cached else 0
         current_date = datetime.datetime.now().strftime("%B %Y")
         current_time = datetime.datetime.now().strftime("%H:%M:%S")
         
@@ -328,9 +370,19 @@ IMPORTANT: Always use these EXACT current budget amounts when discussing user's
 These values are live and up-to-date from the budget file.
 
 Data Freshness: Loaded at {current_time}
-Cache Status: {'Fresh data' if datetime.datetime.now().timestamp() - (self._cache_timestamp or 0) < 5 else 'Cached data'}
+Cache Status: {'Fresh data' if datetime.datetime.now().timestamp() - loaded_at < 5 else 'Cached data'}
 """
             
+            # Live remaining amounts come from the in-memory order rollup (no order scan per chat)
+            spending = get_spend_rollup().spend_vs_budget(budget_info, user_id)
+            if spending['total_spent'] > 0:
+                base_prompt += f"""
+SPENDING THIS MONTH ({spending['month']}, from Amazon orders):
+"""
+                for category, amounts in spending['categories'].items():
+                    base_prompt += f"• {category}: spent ₹{amounts['spent']:,.0f}, remaining ₹{amounts['remaining']:,.0f}\n"
+                base_prompt += f"Total: spent ₹{spending['total_spent']:,.0f} of ₹{spending['total_allocated']:,.0f}, remaining ₹{spending['total_remaining']:,.0f}\n"
+
         if user_budget_data and 'questionnaire_answers' in user_budget_data:
             q_answers = user_budget_data['questionnaire_answers']
             base_prompt += f"""
@@ -373,123 +425,136 @@ If a user asks "what's my current budget", show them the exact breakdown listed
         return base_prompt
 
     def _format_ai_response(self, response):
-        """Format AI response for better readability"""
-        sentences = response.split('. ')
-        if len(response) > 150:
-            formatted = ""
-            current_line = ""
-            for sentence in sentences:
-                if not sentence.endswith('.') and not sentence.endswith('!') and not sentence.endswith('?'):
-                    sentence += '.'
-                if len(current_line + sentence) > 80:
-                    if current_line:
-                        formatted += current_line.strip() + "\n"
-                    current_line = sentence + " "
-                else:
-                    current_line += sentence + " "
-            if current_line:
-                formatted += current_line.strip()
-            return formatted
-        
-        formatted_response = response
-        patterns = [
-            ('Here are ', 'Here are \n• '), ('1. ', '\n1. '), ('2. ', '\n2. '), ('3. ', '\n3. '),
-            ('• ', '\n• '), ('- ', '\n- '), ('Recommendations:', 'Recommendations:\n'),
-            ('Tips:', 'Tips:\n'), ('Options:', 'Options:\n'), ('Consider:', 'Consider:\n'),
-            ('Remember:', 'Remember:\n'),
-        ]
-        for old, new in patterns:
-            formatted_response = formatted_response.replace(old, new)
-        return formatted_response
+        """Format AI response for better readability (see services/response_formatter.py)"""
+        return format_response(response)
 
-    def get_chat_response(self, user_input: str, session_id: str = "default_session"):
-        """Handles a single chat interaction with fresh budget data."""
-        
+    def _begin_chat_turn(self, user_input, session_id, user_id=DEFAULT_USER_ID):
+        """Handle budget confirmations/updates and append the user message.
+
+        Returns (reply, None) when the turn is answered locally, otherwise
+        (None, conversation_history) ready to be sent to the model.
+        """
         # Check if user is confirming a pending budget update
         if session_id in self.pending_budget_updates:
             confirmation_response = self._process_budget_confirmation(user_input, session_id)
             if confirmation_response:
-                return confirmation_response
+                return confirmation_response, None
+        
+        # "What if I cut X by N" is simulated here; the model is unreliable at the arithmetic
+        what_if = self._parse_what_if_request(user_input, user_id)
+        if what_if:
+            return self._answer_what_if(what_if, user_id), None
         
         # Check if user is requesting a budget update
-        budget_update_request = self._parse_budget_update_request(user_input)
+        budget_update_request = self._parse_budget_update_request(user_input, user_id)
         if budget_update_request:
-            return self._confirm_budget_update(session_id, budget_update_request)
+            return self._confirm_budget_update(session_id, budget_update_request, user_id), None
         
         # Always get fresh system prompt to ensure latest budget data
-        base_prompt = self._get_base_prompt()
+        base_prompt = self._get_base_prompt(user_id)
         
-        # Initialize or update conversation history with fresh system prompt
-        if session_id not in self.conversation_history_store:
-            self.conversation_history_store[session_id] = [{"role": "system", "content": base_prompt}]
-        else:
-            # Always update the system prompt to ensure AI has latest budget data
-            self.conversation_history_store[session_id][0] = {"role": "system", "content": base_prompt}
-            print(f"📝 Updated system prompt with fresh budget data for session {session_id}")
-
-        conversation_history = self.conversation_history_store[session_id]
+        # Work on a private copy with the fresh system prompt: the stored history is only
+        # changed by the atomic append in _complete_chat_turn, so concurrent turns cannot interleave
+        stored_history = self.conversation_history_store.get(session_id) or []
+        conversation_history = [{"role": "system", "content": base_prompt}] + stored_history[1:]
         
         # Add user message to conversation
         conversation_history.append({"role": "user", "content": user_input})
+        return None, conversation_history
+
+    def _chat_request(self, conversation_history):
+        """Keyword arguments for the chat completion call behind a chat turn"""
+        return dict(
+            model="llama-3.3-70b-versatile",
+            messages=conversation_history,
+            temperature=0.7,
+            max_tokens=256,
+        )
+
+    def _complete_chat_turn(self, session_id, conversation_history, ai_response_content):
+        """Record the exchange, trim the history and format the reply"""
+        exchange = [conversation_history[-1], {"role": "assistant", "content": ai_response_content}]
+        system_message = conversation_history[0]
+
+        def append_exchange(stored_history):
+            # Appends to whatever the session holds now (another turn may have finished meanwhile)
+            # and keeps 1 system + 10 exchanges (20 messages)
+            messages = (stored_history or [])[1:] + exchange
+            return [system_message] + messages[-20:]
+
+        self.conversation_history_store.update(session_id, append_exchange)
+        return self._format_ai_response(ai_response_content)
+
+    def _abort_chat_turn(self, error):
+        """Reply to a failed model call; the turn was never stored, so nothing needs rolling back"""
+        logger.error("Chatbot API error: %s", error)
+        return "Sorry, I'm having trouble connecting right now. Please try again! 😅"
+
+    def get_chat_response(self, user_input: str, session_id: str = LEGACY_SHARED_SESSION, user_id: str = DEFAULT_USER_ID):
+        """Handles a single chat interaction with fresh budget data."""
+        reply, conversation_history = self._begin_chat_turn(user_input, session_id, user_id)
+        if reply is not None:
+            return reply
         
         try:
-            response = self.client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=conversation_history,
-                temperature=0.7,
-                max_tokens=256,
-            )
+            with track_llm_call('chat') as call:
+                response = self.client.chat.completions.create(**self._chat_request(conversation_history))
+                call.usage = response.usage
             ai_response_content = response.choices[0].message.content
-            
-            # Add AI response to conversation history
-            conversation_history.append({"role": "assistant", "content": ai_response_content})
-            
-            # Keep conversation history manageable
-            if len(conversation_history) > 21:  # 1 system + 10 exchanges (20 messages)
-                # Always keep the updated system prompt
-                fresh_system_prompt = self._get_base_prompt()
-                self.conversation_history_store[session_id] = [{"role": "system", "content": fresh_system_prompt}] + conversation_history[-20:]
-            else:
-                self.conversation_history_store[session_id] = conversation_history
-            
-            return self._format_ai_response(ai_response_content)
-            
+            return self._complete_chat_turn(session_id, conversation_history, ai_response_content)
+        except Exception as e:
+            return self._abort_chat_turn(e)
+
+    async def get_chat_response_async(self, user_input: str, session_id: str = LEGACY_SHARED_SESSION,
+                                      user_id: str = DEFAULT_USER_ID):
+        """Async variant of get_chat_response for the ASGI entry point.
+
+        Only the model call is awaited on the event loop; the turn's store reads and
+        writes (budget plan, sessions, pending confirmations) run in worker threads.
+        """
+        reply, conversation_history = await asyncio.to_thread(self._begin_chat_turn, user_input, session_id, user_id)
+        if reply is not None:
+            return reply
+        
+        try:
+            with track_llm_call('chat') as call:
+                response = await self.async_client.chat.completions.create(**self._chat_request(conversation_history))
+                call.usage = response.usage
+            ai_response_content = response.choices[0].message.content
+            return await asyncio.to_thread(self._complete_chat_turn, session_id, conversation_history,
+                                           ai_response_content)
         except Exception as e:
-            print(f"Chatbot API Error: {e}")
-            # Optionally remove the last user message if API call failed
-            if conversation_history and conversation_history[-1]["role"] == "user":
-                conversation_history.pop()
-            return "Sorry, I'm having trouble connecting right now. Please try again! 😅"
+            return self._abort_chat_turn(e)
 
-    def reset_conversation(self, session_id: str = "default_session"):
+    def reset_conversation(self, session_id: str = LEGACY_SHARED_SESSION, user_id: str = DEFAULT_USER_ID):
         """Reset conversation with fresh budget data"""
         # Clear budget cache to ensure fresh data
-        self._clear_budget_cache()
-        base_prompt = self._get_base_prompt()
+        self._clear_budget_cache(user_id)
+        base_prompt = self._get_base_prompt(user_id)
         self.conversation_history_store[session_id] = [{"role": "system", "content": base_prompt}]
         return "Conversation reset! How can I help you with your Amazon shopping today?"
 
-    def get_current_budget_info(self):
+    def get_current_budget_info(self, user_id=DEFAULT_USER_ID):
         """Get current budget info with fresh data"""
-        return self._load_user_budget(force_refresh=True)
+        return self._load_user_budget(force_refresh=True, user_id=user_id)
 
-    def force_budget_refresh(self):
+    def force_budget_refresh(self, user_id=DEFAULT_USER_ID):
         """Public method to force budget cache refresh"""
-        self._clear_budget_cache()
-        fresh_data = self._load_user_budget(force_refresh=True)
-        print(f"🔄 Forced budget refresh completed at {datetime.datetime.now().strftime('%H:%M:%S')}")
+        self._clear_budget_cache(user_id)
+        fresh_data = self._load_user_budget(force_refresh=True, user_id=user_id)
+        logger.info("Forced budget refresh completed")
         return fresh_data
 
-    def process_chatbot_budget_update(self, message):
+    def process_chatbot_budget_update(self, message, user_id=DEFAULT_USER_ID):
         """
         Process budget update requests from the frontend chatbot.
         This method is called by the frontend budgetService.
         """
         try:
-            print(f"🤖 Processing chatbot budget update: {message}")
+            logger.info("Processing chatbot budget update", extra={"update_message": message})
             
             # Parse the update request
-            update_request = self._parse_budget_update_request(message)
+            update_request = self._parse_budget_update_request(message, user_id)
             
             if not update_request:
                 return {
@@ -504,11 +569,11 @@ If a user asks "what's my current budget", show them the exact breakdown listed
                 }
             
             # Execute the update immediately (skip confirmation for API calls)
-            success = self._execute_budget_update(update_request)
+            success = self._execute_budget_update(update_request, user_id)
             
             if success:
                 # Get updated budget to show current state
-                updated_budget = self._load_user_budget(force_refresh=True)
+                updated_budget = self._load_user_budget(force_refresh=True, user_id=user_id)
                 total_budget = updated_budget.get('budget_plan', {}).get('total_budget', 0)
                 
                 return {
@@ -524,20 +589,20 @@ If a user asks "what's my current budget", show them the exact breakdown listed
                 }
                 
         except Exception as e:
-            print(f"❌ Error in process_chatbot_budget_update: {e}")
+            logger.error("Error in process_chatbot_budget_update: %s", e)
             return {
                 'success': False,
                 'message': 'An error occurred while processing your budget update.',
                 'error': str(e)
             }
 
-    def update_budget_from_complex_request(self, complex_message):
+    def update_budget_from_complex_request(self, complex_message, user_id=DEFAULT_USER_ID):
         """
         Handle complex budget update requests with multiple operations.
         Example: "increase electronics by 2000 and reduce books by 500"
         """
         try:
-            print(f"🔄 Processing complex budget request: {complex_message}")
+            logger.info("Processing complex budget request", extra={"update_message": complex_message})
             
             # Split complex requests by 'and', 'also', 'then'
             separators = [' and ', ' also ', ' then ', ', ']
@@ -558,7 +623,7 @@ If a user asks "what's my current budget", show them the exact breakdown listed
                 if not part:
                     continue
                     
-                update_request = self._parse_budget_update_request(part)
+                update_request = self._parse_budget_update_request(part, user_id)
                 if update_request:
                     updates.append(update_request)
             
@@ -577,7 +642,7 @@ If a user asks "what's my current budget", show them the exact breakdown listed
             failed_updates = []
             
             for update in updates:
-                success = self._execute_budget_update(update)
+                success = self._execute_budget_update(update, user_id)
                 if success:
                     successful_updates.append(update)
                     total_changes += 1
@@ -586,7 +651,7 @@ If a user asks "what's my current budget", show them the exact breakdown listed
             
             # Prepare response
             if successful_updates:
-                updated_budget = self._load_user_budget(force_refresh=True)
+                updated_budget = self._load_user_budget(force_refresh=True, user_id=user_id)
                 total_budget = updated_budget.get('budget_plan', {}).get('total_budget', 0)
                 
                 success_msg = f"Successfully updated {len(successful_updates)} budget categories:\n\n"
@@ -611,7 +676,7 @@ If a user asks "what's my current budget", show them the exact breakdown listed
                 }
                 
         except Exception as e:
-            print(f"❌ Error in complex budget update: {e}")
+            logger.error("Error in complex budget update: %s", e)
             return {
                 'success': False,
                 'message': 'Error processing complex budget request.',
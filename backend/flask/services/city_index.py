@@ -0,0 +1,209 @@
+"""City-name autocomplete and normalization over a prefix trie.
+
+Every known city name and alias (cities.json plus the catalog's seller
+cities) is inserted into a trie of normalized keys: lower case, accents
+and punctuation dropped, whitespace collapsed. Each trie node keeps its
+best completions precomputed in popularity order, so autocomplete costs
+one walk down the typed prefix.
+
+Misspellings fall back to Damerau-Levenshtein distance (adjacent
+transpositions count as one edit) computed while walking the same trie:
+one DP row per node, and a branch is abandoned as soon as every entry of
+its row exceeds the allowed distance, so only a thin slice of the trie is
+visited. A typo is corrected only when one city is strictly closest.
+
+    index = CityIndex.from_file("cities.json", extra_names=["Mumbai"])
+    index.resolve("bangalroe")   # {"name": "Bangalore", "match": "corrected", ...}
+    index.complete("ko")         # [{"name": "Kolkata", ...}, {"name": "Coimbatore", ...} (alias Kovai), ...]
+"""
+import json
+import logging
+import re
+import unicodedata
+
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+MAX_COMPLETIONS = 10
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Comparison key: "  Thiruvananthapuram (Kerala) " -> "thiruvananthapuram kerala\""""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def allowed_distance(length):
+    """Edits tolerated for a query of this length (short names are easy to confuse)"""
+    if length <= 3:
+        return 0
+    return 1 if length <= 5 else 2
+
+
+class _Node:
+    __slots__ = ('children', 'cities', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.cities = ()  # ids of the cities whose name or alias ends here
+        self.top = ()     # best completions below this node, most popular first
+
+
+class CityIndex:
+    def __init__(self, cities):
+        """`cities`: [{"name", "state", "aliases"}] in popularity order"""
+        self.cities = []
+        self._root = _Node()
+        self._canonical = set()  # Keys that are a city's own name (not an alias)
+        self._fuzzy_cache = LRUCache(max_size=2048)  # The index never changes, so typo lookups can be kept
+        seen = {}
+        for city in cities:
+            key = normalize(city['name'])
+            if not key or key in seen:
+                continue
+            seen[key] = len(self.cities)
+            self.cities.append({"name": city['name'], "state": city.get('state')})
+            self._canonical.add(key)
+        for city in cities:
+            city_id = seen.get(normalize(city['name']))
+            if city_id is None:
+                continue
+            for name in [city['name'], *city.get('aliases', ())]:
+                self._insert(normalize(name), city_id)
+        self._fill_top(self._root)
+
+    @classmethod
+    def from_file(cls, path, extra_names=()):
+        """Cities from a JSON file, plus any names it lacks (appended as least popular)"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                cities = json.load(f)['cities']
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Could not load city list %s: %s", path, e)
+            cities = []
+        known = {normalize(city['name']) for city in cities}
+        cities += [{"name": name} for name in sorted(extra_names) if normalize(name) not in known]
+        return cls(cities)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def _insert(self, key, city_id):
+        if not key:
+            return
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+        if city_id not in node.cities:
+            node.cities += (city_id,)
+
+    def _fill_top(self, node):
+        """Precompute each node's completions bottom-up (ids double as popularity ranks)"""
+        ids = set(node.cities)
+        for child in node.children.values():
+            ids.update(self._fill_top(child))
+        node.top = tuple(sorted(ids)[:MAX_COMPLETIONS])
+        return node.top
+
+    def _node(self, key):
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _fuzzy(self, key, max_distance, prefix=False):
+        """{city id: distance} for names within max_distance of key (of a name's prefix when `prefix`)"""
+        cached = self._fuzzy_cache.get((key, max_distance, prefix))
+        if cached is not None:
+            return cached
+        found = {}
+        width = len(key) + 1
+
+        def visit(node, char, row, previous_char, previous_row):
+            # Hot loop: plain comparisons instead of min() calls roughly halve the walk time
+            left = row[0] + 1
+            current = [left]
+            best = left
+            for i in range(1, width):
+                cost = row[i - 1] if key[i - 1] == char else row[i - 1] + 1
+                if row[i] + 1 < cost:
+                    cost = row[i] + 1
+                if left + 1 < cost:
+                    cost = left + 1
+                if previous_row is not None and i > 1 and key[i - 1] == previous_char and key[i - 2] == char \
+                        and previous_row[i - 2] + 1 < cost:
+                    cost = previous_row[i - 2] + 1  # Adjacent transposition
+                current.append(cost)
+                left = cost
+                if cost < best:
+                    best = cost
+            if left <= max_distance:
+                for city_id in (node.top if prefix else node.cities):
+                    if left < found.get(city_id, max_distance + 1):
+                        found[city_id] = left
+            if best <= max_distance:
+                for next_char, child in node.children.items():
+                    visit(child, next_char, current, char, row)
+
+        first_row = list(range(width))
+        for char, child in self._root.children.items():
+            visit(child, char, first_row, None, None)
+        self._fuzzy_cache.set((key, max_distance, prefix), found)
+        return found
+
+    def _ranked(self, distances, limit):
+        """City ids by distance, then popularity"""
+        return sorted(distances, key=lambda city_id: (distances[city_id], city_id))[:limit]
+
+    def _city(self, city_id, distance=0):
+        return {**self.cities[city_id], "distance": distance}
+
+    def complete(self, prefix, limit=MAX_COMPLETIONS):
+        """Cities whose name or alias starts with `prefix`, topped up with near misses"""
+        key = normalize(prefix)
+        if not key:
+            return []
+        limit = min(limit, MAX_COMPLETIONS)
+        node = self._node(key)
+        ids = list(node.top[:limit]) if node else []
+        if len(ids) < limit and allowed_distance(len(key)):
+            near = self._fuzzy(key, allowed_distance(len(key)), prefix=True)
+            ids += [city_id for city_id in self._ranked(near, limit) if city_id not in ids][:limit - len(ids)]
+            return [self._city(city_id, 0 if node and city_id in node.top else near[city_id]) for city_id in ids]
+        return [self._city(city_id) for city_id in ids]
+
+    def resolve(self, text, suggestions=5):
+        """Canonical city for free text and how it matched ("match" is None when unknown)
+
+        {"query", "match": "exact" | "alias" | "corrected" | None, "city": {"name", "state"} | None,
+         "suggestions": [...]}
+        """
+        key = normalize(text)
+        result = {"query": text, "match": None, "city": None, "suggestions": []}
+        if not key:
+            return result
+        node = self._node(key)
+        if node is not None and node.cities:
+            result["match"] = "exact" if key in self._canonical else "alias"
+            result["city"] = self.cities[node.cities[0]]
+            return result
+
+        if ',' in text:
+            # "Pune, Maharashtra" / "Mumbai, India": the first part is the city
+            head = self.resolve(text.split(',', 1)[0], suggestions)
+            if head["match"]:
+                return {**head, "query": text}
+
+        distances = self._fuzzy(key, allowed_distance(len(key)))
+        ranked = self._ranked(distances, max(suggestions, 2))
+        if len(ranked) == 1 or (ranked and distances[ranked[0]] < distances[ranked[1]]):
+            result["match"] = "corrected"
+            result["city"] = self.cities[ranked[0]]
+            return result
+        result["suggestions"] = ([self._city(city_id, distances[city_id]) for city_id in ranked[:suggestions]]
+                                 or self.complete(key, suggestions))
+        return result
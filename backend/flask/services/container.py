@@ -0,0 +1,143 @@
+"""Application service container.
+
+Services are built on first use instead of when their route modules are
+imported, so importing the app (worker boot, test collection, CLI tools)
+does not construct Groq/Nominatim clients or need GROQ_API_KEY. The
+container is attached to the Flask app by create_app and reached from
+request code through get_services().
+"""
+import atexit
+import logging
+import threading
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+logger = logging.getLogger(__name__)
+
+EXTENSION_KEY = 'services'
+
+
+class ServiceContainer:
+    """Lazily built, process-wide services plus startup/shutdown hooks"""
+
+    def __init__(self, eager=False):
+        self.eager = eager
+        self._lock = threading.RLock()
+        self._instances = {}
+        self._startup_hooks = []
+        self._shutdown_hooks = []
+        self._started = False
+        self._stopped = False
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions[EXTENSION_KEY] = self
+        atexit.register(self.shutdown)
+
+    def _get(self, name, factory):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = factory()
+        return instance
+
+    def built(self, name):
+        """The service if it has been created already, else None (never builds it)"""
+        return self._instances.get(name)
+
+    @property
+    def budget_service(self):
+        def build():
+            from services.budget_service import BudgetService
+            return BudgetService()
+        return self._get('budget_service', build)
+
+    @property
+    def chatbot_service(self):
+        def build():
+            from services.chatbot_service import ChatbotService
+            # Shares the app's BudgetService (and its store/caches) instead of building a second one
+            return ChatbotService(budget_service=self.budget_service)
+        return self._get('chatbot_service', build)
+
+    @property
+    def recommendation_service(self):
+        def build():
+            from services.recommendation_service import RecommendationService
+            return RecommendationService()
+        return self._get('recommendation_service', build)
+
+    @property
+    def plan_jobs(self):
+        def build():
+            from config import Config
+            from services.plan_jobs import PlanJobQueue
+            from utils.admission import EXTENSION_KEY as ADMISSION_KEY
+            # Jobs queue for the same LLM slots as the synchronous routes
+            admission = self.app.extensions.get(ADMISSION_KEY) if self.app is not None else None
+            return PlanJobQueue(self.budget_service, workers=Config.PLAN_JOB_WORKERS,
+                                max_pending=Config.PLAN_JOB_MAX_PENDING, ttl=Config.PLAN_JOB_TTL,
+                                stale_after=Config.PLAN_JOB_STALE_AFTER, admission=admission)
+        return self._get('plan_jobs', build)
+
+    @property
+    def bulk_jobs(self):
+        def build():
+            from config import Config
+            from services.bulk_plan_service import BulkJobRegistry
+            return BulkJobRegistry(Config.BULK_JOBS_DIR, ttl=Config.BULK_JOB_TTL)
+        return self._get('bulk_jobs', build)
+
+    # --- lifecycle -----------------------------------------------------------
+
+    def on_startup(self, hook):
+        self._startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook):
+        self._shutdown_hooks.append(hook)
+        return hook
+
+    def startup(self):
+        """Run startup hooks once; with eager=True also build every service now (e.g. before forking workers)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self.eager:
+            for name in ('budget_service', 'chatbot_service', 'recommendation_service'):
+                getattr(self, name)
+        for hook in self._startup_hooks:
+            hook(self)
+
+    def shutdown(self):
+        """Run shutdown hooks once, then close whatever clients were created"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        for hook in reversed(self._shutdown_hooks):
+            try:
+                hook(self)
+            except Exception:
+                logger.exception("Shutdown hook failed")
+        for instance in self._instances.values():
+            close = getattr(instance, 'close', None)
+            if close:
+                close()
+
+        from services.spend_rollup import stop_spend_rollup
+        stop_spend_rollup()
+
+
+def get_services(app=None):
+    return (app or current_app).extensions[EXTENSION_KEY]
+
+
+def service_proxy(name):
+    """Module-level stand-in for a service, resolved against the current app on each use"""
+    return LocalProxy(lambda: getattr(get_services(), name))
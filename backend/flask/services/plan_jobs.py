@@ -0,0 +1,222 @@
+"""Background budget plan generation: submit now, poll for the plan later.
+
+`POST /api/budget/plan` with `Prefer: respond-async` (or `?async=1`)
+returns 202 and a job id in milliseconds; a bounded thread pool then runs
+get_budget_recommendation and save_budget_plan, and
+`GET /api/budget/jobs/<id>` reports the job, with the same body the
+synchronous route returns once it has succeeded. Saving the plan also
+pushes it to /api/budget/watch and /api/budget/stream subscribers.
+
+Job records live in the shared state store, so with several workers any of
+them can answer a status poll. Submissions are idempotent:
+
+    * with an Idempotency-Key header, retries get the original job back for
+      as long as it is kept (PLAN_JOB_TTL); reusing a key for different
+      answers is an error
+    * without one, identical answers from the same user are merged while a
+      job for them is still queued or running
+
+Jobs run in the process that accepted them and, like the synchronous route,
+take a slot (and a global rate token) from the app's AdmissionController
+before calling the LLM; a job stays queued while it waits. The client's own
+token bucket was already charged when the job was submitted. A job that has
+not moved for
+PLAN_JOB_STALE_AFTER seconds (its worker was recycled or crashed) is
+reported as failed, and submitting it again starts a new attempt.
+"""
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from services.shared_state import get_state_store
+from utils.admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ('queued', 'running')
+_PROCESS_SALT = os.urandom(16).hex()  # Only used without SECRET_KEY, i.e. a single process
+
+
+class PlanQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Plan generation queue is full")
+        self.retry_after = retry_after
+
+
+class PlanJobConflict(Exception):
+    """An Idempotency-Key was reused with different questionnaire answers"""
+
+
+def answers_fingerprint(answers):
+    return hashlib.sha256(json.dumps(answers, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class PlanJobQueue:
+    def __init__(self, budget_service, workers=4, max_pending=64, ttl=3600, stale_after=300, admission=None):
+        self.budget_service = budget_service
+        self.admission = admission
+        self.workers = max(1, int(workers))
+        self.max_pending = max(0, int(max_pending))
+        self.stale_after = stale_after
+        self.jobs = get_state_store().namespace('plan_jobs', ttl=ttl)
+        self._lock = threading.Lock()
+        self._in_process = 0  # Jobs queued or running in this process
+        self._executor = None
+        self._pid = None
+        self._closed = False
+
+    def _pool(self):
+        # Threads do not survive a fork, so a pool created before it belongs to the parent
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='plan-job')
+            self._pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _job_id(*parts):
+        """Unguessable but stable id, so every worker maps a retry to the same job"""
+        salt = (Config.SECRET_KEY or _PROCESS_SALT).encode('utf-8')
+        return hmac.new(salt, '\x1f'.join(parts).encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def _stale(self, job, now=None):
+        return job['status'] in ACTIVE and (now or time.time()) - job['updated_at'] > self.stale_after
+
+    def view(self, job):
+        """Job as reported to clients (stale active jobs are shown as failed)"""
+        job = dict(job)
+        if self._stale(job):
+            job.update(status='failed', error="Plan generation was interrupted; submit the request again")
+        job.pop('fingerprint', None)
+        return job
+
+    def submit(self, answers, user_id, idempotency_key=None):
+        """Queue plan generation (or find the job already covering it); returns (job, created)
+
+        Raises PlanJobConflict or PlanQueueFull.
+        """
+        fingerprint = answers_fingerprint(answers)
+        if idempotency_key:
+            job_id = self._job_id('key', user_id, idempotency_key)
+        else:
+            job_id = self._job_id('answers', user_id, fingerprint)
+        created = []
+
+        def claim(job):
+            now = time.time()
+            if job is not None and not self._stale(job, now):
+                if idempotency_key or job['status'] in ACTIVE:
+                    return job
+            new_job = {
+                "id": job_id, "status": "queued", "user_id": user_id, "fingerprint": fingerprint,
+                "attempt": (job or {}).get('attempt', 0) + 1, "created_at": now, "updated_at": now,
+                "result": None, "error": None,
+            }
+            created.append(new_job)
+            return new_job
+
+        job = self.jobs.update(job_id, claim)
+        if not created:
+            if job['fingerprint'] != fingerprint:
+                raise PlanJobConflict("Idempotency-Key was already used with different questionnaire answers")
+            return self.view(job), False
+
+        with self._lock:
+            full = self._in_process >= self.workers + self.max_pending
+            if not full:
+                self._in_process += 1
+        if full:
+            self.jobs.pop(job_id)
+            raise PlanQueueFull(retry_after=max(1, int(Config.ADMISSION_QUEUE_TIMEOUT)))
+        self._pool().submit(self._run, job_id, job['attempt'], answers, user_id)
+        return self.view(job), True
+
+    def _set(self, job_id, attempt, **fields):
+        """Update this attempt's record (a newer attempt, or an expired record, is left alone)"""
+        def apply(job):
+            if job is None or job.get('attempt') != attempt:
+                return job
+            return {**job, **fields, "updated_at": time.time()}
+        if self.jobs.get(job_id) is not None:
+            self.jobs.update(job_id, apply)
+
+    def _admit(self, job_id, attempt):
+        """Wait for an LLM slot like a synchronous request would; a busy controller delays the job
+
+        Gives up after `stale_after` seconds (or on shutdown), failing the job so it can be resubmitted.
+        """
+        if self.admission is None:
+            return contextlib.nullcontext()
+        deadline = time.monotonic() + self.stale_after
+        while True:
+            try:
+                return self.admission.admit(None)
+            except AdmissionRejected as rejected:
+                if self._closed or time.monotonic() >= deadline:
+                    raise RuntimeError("The assistant is busy right now; submit the request again") from rejected
+                self._set(job_id, attempt)  # Still queued, not stale
+                time.sleep(min(rejected.retry_after, 1.0))
+
+    def _run(self, job_id, attempt, answers, user_id):
+        try:
+            with self._admit(job_id, attempt):
+                self._set(job_id, attempt, status='running')
+                recommendation = self.budget_service.get_budget_recommendation(answers)
+            if not recommendation:
+                self._set(job_id, attempt, status='failed', error="Failed to generate budget recommendation")
+            elif not self.budget_service.save_budget_plan(answers, recommendation, user_id):
+                self._set(job_id, attempt, status='failed', error="Failed to save budget plan")
+            else:
+                self._set(job_id, attempt, status='succeeded', result={
+                    "message": "Budget plan created and saved successfully",
+                    "questionnaire_answers": answers,
+                    "budget_plan": recommendation
+                })
+        except Exception as e:
+            logger.exception("Plan job failed", extra={"job_id": job_id})
+            self._set(job_id, attempt, status='failed', error=str(e))
+        finally:
+            with self._lock:
+                self._in_process -= 1
+
+    def get(self, job_id, wait=0.0, poll_interval=0.2):
+        """The job's client view, or None; with `wait`, long-poll until it finishes"""
+        deadline = time.monotonic() + wait
+        while True:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = self.view(job)
+            remaining = deadline - time.monotonic()
+            if job['status'] not in ACTIVE or remaining <= 0:
+                return job
+            time.sleep(min(poll_interval, remaining))
+
+    async def get_async(self, job_id, wait=0.0, poll_interval=0.2):
+        """Event-loop variant of get(): sleeps between polls instead of holding a thread"""
+        deadline = time.monotonic() + wait
+        while True:
+            job = await asyncio.to_thread(self.jobs.get, job_id)
+            if job is None:
+                return None
+            job = self.view(job)
+            remaining = deadline - time.monotonic()
+            if job['status'] not in ACTIVE or remaining <= 0:
+                return job
+            await asyncio.sleep(min(poll_interval, remaining))
+
+    def stats(self):
+        return {"in_process": self._in_process, "workers": self.workers, "max_pending": self.max_pending}
+
+    def close(self):
+        self._closed = True
+        if self._executor is not None and self._pid == os.getpid():
+            # Queued jobs are dropped; their records go stale and a resubmission starts them again
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,99 @@
+"""Incremental parser for streamed budget plan JSON.
+
+Tokens from a JSON-mode completion are fed in as they arrive. Every top-level
+member is validated as soon as it is complete, so a bad category or amount
+aborts the stream immediately, and `feed` reports when the object has closed
+so the caller can stop reading without waiting for the token cap.
+"""
+import json
+
+from services.budget_allocator import CATEGORY_RANGES
+
+PLAN_CATEGORIES = tuple(CATEGORY_RANGES)
+PLAN_META_KEYS = ('total_budget', 'recommendations')
+
+
+class PlanValidationError(ValueError):
+    """The streamed plan does not match the expected schema"""
+
+
+def validate_plan_member(key, value):
+    """Validate one top-level key/value pair of a budget plan"""
+    if key in PLAN_CATEGORIES or key == 'total_budget':
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise PlanValidationError(f"{key} must be a non-negative number, got {value!r}")
+    elif key == 'recommendations':
+        if not isinstance(value, list) or not all(isinstance(tip, str) for tip in value):
+            raise PlanValidationError("recommendations must be a list of strings")
+    else:
+        raise PlanValidationError(f"Unexpected plan key: {key!r}")
+
+
+class IncrementalPlanParser:
+    """Character-level scanner that tracks JSON nesting across chunks"""
+
+    def __init__(self):
+        self.plan = {}
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member = []  # Characters of the current top-level member
+
+    def feed(self, chunk):
+        """Consume a chunk; returns True once the top-level object has closed"""
+        for char in chunk:
+            if self.complete:
+                break
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                elif not char.isspace():
+                    raise PlanValidationError(f"Unexpected text before plan object: {char!r}")
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member()
+                    self.complete = True
+                    continue
+            elif char == ',' and self._depth == 1:
+                self._finish_member()
+                continue
+
+            self._member.append(char)
+        return self.complete
+
+    def _finish_member(self):
+        text = ''.join(self._member).strip()
+        self._member = []
+        if not text:
+            return
+        try:
+            member = json.loads('{' + text + '}')
+        except ValueError as e:
+            raise PlanValidationError(f"Malformed plan member: {text[:60]!r}") from e
+        for key, value in member.items():
+            validate_plan_member(key, value)
+            self.plan[key] = int(value) if isinstance(value, float) else value
+
+    def result(self):
+        """The validated plan; raises if the object never closed or misses categories"""
+        if not self.complete:
+            raise PlanValidationError("Plan object was truncated")
+        missing = [key for key in PLAN_CATEGORIES + ('total_budget',) if key not in self.plan]
+        if missing:
+            raise PlanValidationError(f"Plan is missing keys: {', '.join(missing)}")
+        return self.plan
@@ -1,69 +1,57 @@
 import json
+import logging
 import os
 from config import Config
 import math
-from geopy.geocoders import Nominatim
+import time
 # import requests # If you were to use a real API
 from typing import List, Dict
+from services.catalog import CatalogLoader
+from services.city_index import CityIndex
+from utils.metrics import GEOCODER_LATENCY
 
-# Mock data (can be moved to a separate file or database later)
-mock_recommendations_data = {
-    "laptop": ["laptop bag", "mouse", "cooling pad"],
-    "phone": ["phone case", "charger", "earphones"],
-    "book": ["bookmark", "reading light", "book stand"]
-}
-
-mock_products_data = {
-    "laptop bag": [
-        {"id": 1, "name": "Dell Laptop Bag", "seller_city": "Mumbai", "price": 1500},
-        {"id": 2, "name": "HP Laptop Bag", "seller_city": "Delhi", "price": 1200},
-        {"id": 3, "name": "Lenovo Bag", "seller_city": "Bangalore", "price": 1800}
-    ],
-    "mouse": [
-        {"id": 4, "name": "Logitech Mouse", "seller_city": "Pune", "price": 800},
-        {"id": 5, "name": "Dell Mouse", "seller_city": "Chennai", "price": 600},
-        {"id": 6, "name": "HP Mouse", "seller_city": "Hyderabad", "price": 700}
-    ],
-    "cooling pad": [
-        {"id": 7, "name": "Cooler Master Pad", "seller_city": "Kolkata", "price": 2000},
-        {"id": 8, "name": "Zebronics Pad", "seller_city": "Ahmedabad", "price": 1500}
-    ],
-    "phone case": [
-        {"id": 9, "name": "Samsung Galaxy Case", "seller_city": "Mumbai", "price": 500},
-        {"id": 10, "name": "iPhone Protective Case", "seller_city": "Delhi", "price": 800},
-    ],
-    "charger": [
-        {"id": 12, "name": "Fast Charger 25W", "seller_city": "Pune", "price": 1000},
-    ],
-    "earphones": [
-        {"id": 15, "name": "Sony WH-1000XM4", "seller_city": "Kolkata", "price": 25000},
-    ],
-    "bookmark": [
-        {"id": 18, "name": "Wooden Bookmark Set", "seller_city": "Mumbai", "price": 200},
-    ],
-    "reading light": [
-        {"id": 21, "name": "LED Reading Light", "seller_city": "Pune", "price": 800},
-    ],
-    "book stand": [
-        {"id": 24, "name": "Wooden Book Stand", "seller_city": "Kolkata", "price": 1500},
-    ]
-}
+logger = logging.getLogger(__name__)
 
 
 class RecommendationService:
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="amazon_budget_app_recommender", timeout=10)
-        self.mock_recommendations = mock_recommendations_data
-        self.mock_products = mock_products_data
+    def __init__(self, catalog=None):
+        self._geolocator = None
+        # Related items and products come from catalog.json, swapped in without a restart when it changes
+        self.catalog = catalog or CatalogLoader(Config.CATALOG_PATH, Config.CATALOG_RELOAD_INTERVAL)
+        self.catalog.start()
+        self._cities = None  # (seller cities it was built with, CityIndex)
+
+    def close(self):
+        self.catalog.stop()
+
+    @property
+    def geolocator(self):
+        """Nominatim geocoder, created (and geopy imported) on first lookup"""
+        if self._geolocator is None:
+            from geopy.geocoders import Nominatim
+            self._geolocator = Nominatim(user_agent="amazon_budget_app_recommender", timeout=10)
+        return self._geolocator
+
+    @property
+    def cities(self):
+        """Known-city index, rebuilt when a catalog reload changes the seller cities"""
+        seller_cities = self.catalog.snapshot.seller_cities
+        built = self._cities
+        if built is None or built[0] != seller_cities:
+            built = self._cities = (seller_cities, CityIndex.from_file(Config.CITIES_PATH, seller_cities))
+        return built[1]
 
     def _geocode_city(self, city_name: str):
+        started = time.perf_counter()
         try:
             location = self.geolocator.geocode(city_name)
+            GEOCODER_LATENCY.observe(time.perf_counter() - started, result='ok' if location else 'not_found')
             if location:
                 return location.latitude, location.longitude
             return None, None
         except Exception as e:
-            print(f"Error geocoding {city_name}: {e}")
+            GEOCODER_LATENCY.observe(time.perf_counter() - started, result='error')
+            logger.warning("Error geocoding %s: %s", city_name, e)
             return None, None
 
     def _calculate_distance(self, lat1, lon1, lat2, lon2):
@@ -92,36 +80,62 @@ class RecommendationService:
         return products_with_distance[0]
 
 
+    def _locate_user_city(self, user_city):
+        """(city name used, lat, lon, correction or None, suggestions) for the typed city
+
+        Exact and alias matches ("bombay" -> "Mumbai") are always used. A typo correction is
+        only a guess, since the list lacks many real towns ("Manipal" is not "Panipat"), so under
+        the default "geocode" policy the text as typed is geocoded first and the correction is
+        applied only when that fails.
+        """
+        resolved = self.cities.resolve(user_city)
+        if resolved["match"] in ("exact", "alias"):
+            name = resolved["city"]["name"]
+            return (name, *self._geocode_city(name), None, [])
+
+        if Config.CITY_UNKNOWN_POLICY != 'reject':
+            user_lat, user_lon = self._geocode_city(user_city)
+            if user_lat and user_lon:
+                return user_city, user_lat, user_lon, None, []
+        if resolved["match"] == "corrected":
+            name = resolved["city"]["name"]
+            correction = {"query": user_city, "city": name}
+            return (name, *self._geocode_city(name), correction, [])
+        return user_city, None, None, None, resolved["suggestions"]
+
     def get_distance_based_recommendations(self, main_product: str, user_city: str):
-        user_lat, user_lon = self._geocode_city(user_city)
+        user_city, user_lat, user_lon, correction, suggestions = self._locate_user_city(user_city)
         if not user_lat or not user_lon:
-            return {"error": f"Could not geocode user city: {user_city}", "recommendations": []}
+            return {"error": f"Could not geocode user city: {user_city}", "suggestions": suggestions,
+                    "recommendations": []}
 
-        recommended_item_names = self.mock_recommendations.get(main_product.lower(), [])
+        # One snapshot for the whole request, even if a reload swaps the catalog meanwhile
+        snapshot = self.catalog.snapshot
         recommendations_output = []
 
-        for item_name in recommended_item_names:
-            products_of_type = self.mock_products.get(item_name.lower(), [])
-            if products_of_type:
-                best_product = self._get_best_product_by_distance_and_price(
-                    products_of_type, user_lat, user_lon
-                )
-                if best_product:
-                    recommendations_output.append({
-                        "product_type": main_product,
-                        "category": item_name,
-                        "product": best_product
-                    })
+        for item_name, products_of_type in snapshot.related(main_product):
+            best_product = self._get_best_product_by_distance_and_price(
+                products_of_type, user_lat, user_lon
+            )
+            if best_product:
+                recommendations_output.append({
+                    "product_type": main_product,
+                    "category": item_name,
+                    "product": best_product
+                })
         
-        return self._format_recommendations(recommendations_output)
+        # city_correction tells the client when the typed city was replaced by a known one
+        return {**self._format_recommendations(recommendations_output, snapshot.version), "user_city": user_city,
+                "city_correction": correction}
 
-    def _format_recommendations(self, recommendations: List[Dict]):
+    def _format_recommendations(self, recommendations: List[Dict], catalog_version=None):
         if not recommendations:
             return {
                 "status": "no_recommendations",
                 "message": "No recommendations found",
                 "total_recommendations": 0,
-                "recommendations": []
+                "recommendations": [],
+                "catalog_version": catalog_version
             }
         
         formatted_recs = []
@@ -138,5 +152,6 @@ class RecommendationService:
         return {
             "status": "success",
             "total_recommendations": len(formatted_recs),
-            "recommendations": formatted_recs
+            "recommendations": formatted_recs,
+            "catalog_version": catalog_version
         }
@@ -0,0 +1,109 @@
+"""Single-pass layout of chatbot replies.
+
+Replies longer than 150 characters are wrapped: split into sentences on
+". ", each sentence closed with a full stop if it has no terminal
+punctuation, and sentences packed onto lines of up to 80 characters.
+Shorter replies are bulleted instead: list markers ("1. ", "• ", "- ",
+after "Here are ") start new lines and headings such as "Tips:" end one.
+
+`ResponseFormatter` consumes the reply in chunks as tokens arrive. Until
+151 characters have been seen it cannot know which layout applies, so it
+holds them; after that, every completed sentence is emitted right away and
+only the sentence in progress is kept. Output is identical to formatting
+the whole text at once.
+
+    formatter = ResponseFormatter()
+    for chunk in stream:
+        send(formatter.feed(chunk))
+    send(formatter.finish())
+"""
+import re
+
+SHORT_REPLY_LIMIT = 150
+LINE_WIDTH = 80
+
+# Every layout rule of a short reply, applied in one scan. No marker can
+# occur inside another, so leftmost matching finds all of them.
+_BULLET_MARKERS = re.compile(r"[123]\. |[•-] |Here are |Re(?:commendations|member):|Tips:|Options:|Consider:")
+_BULLET_LAYOUT = {
+    'Here are ': 'Here are \n\n• ',  # Opens a bullet, which itself starts on a fresh line
+    **{marker: '\n' + marker for marker in ('1. ', '2. ', '3. ', '• ', '- ')},
+    **{heading: heading + '\n' for heading in ('Recommendations:', 'Tips:', 'Options:', 'Consider:', 'Remember:')},
+}
+
+
+def _bullet_layout(match):
+    return _BULLET_LAYOUT[match[0]]
+
+
+class ResponseFormatter:
+    """Incremental formatter; feed() returns newly finished output, finish() the rest"""
+
+    def __init__(self):
+        self._held = []          # Opening text, until the layout is known
+        self._held_length = 0
+        self._wrapping = False
+        self._sentence = []      # Pieces of the sentence in progress
+        self._line_length = 0    # Unstripped length of the current output line
+        self._finished = False
+
+    def feed(self, chunk):
+        if not chunk:
+            return ''
+        if self._wrapping:
+            return self._wrap(chunk)
+        self._held.append(chunk)
+        self._held_length += len(chunk)
+        if self._held_length <= SHORT_REPLY_LIMIT:
+            return ''
+        self._wrapping = True
+        held, self._held = ''.join(self._held), []
+        return self._wrap(held)
+
+    def finish(self):
+        if self._finished:
+            return ''
+        self._finished = True
+        if not self._wrapping:
+            return _BULLET_MARKERS.sub(_bullet_layout, ''.join(self._held))
+        sentence, self._sentence = ''.join(self._sentence), []
+        return self._layout([sentence])
+
+    def _wrap(self, chunk):
+        # split() finds every ". " in C; the first piece continues the pending sentence
+        # and the last one stays pending until its separator (or the end) arrives
+        pieces = chunk.split('. ')
+        if chunk[0] == ' ' and self._sentence and self._sentence[-1].endswith('.'):
+            # A ". " separator split across two chunks
+            self._sentence[-1] = self._sentence[-1][:-1]
+            pieces[0] = pieces[0][1:]
+            pieces.insert(0, '')
+        if len(pieces) == 1:
+            self._sentence.append(pieces[0])
+            return ''
+        self._sentence.append(pieces[0])
+        pieces[0] = ''.join(self._sentence)
+        self._sentence = [pieces.pop()]
+        return self._layout(pieces)
+
+    def _layout(self, sentences):
+        output = []
+        line_length = self._line_length
+        for sentence in sentences:
+            if not sentence.endswith(('.', '!', '?')):
+                sentence += '.'
+            if line_length and line_length + len(sentence) > LINE_WIDTH:
+                output.append('\n')
+                line_length = 0
+            # Lines are stripped: no leading whitespace, and the space after the last sentence is never written
+            output.append(' ' + sentence if line_length else sentence.lstrip())
+            line_length += len(sentence) + 1
+        self._line_length = line_length
+        return ''.join(output)
+
+
+def format_response(text):
+    """Format a complete reply"""
+    if len(text) <= SHORT_REPLY_LIMIT:
+        return _BULLET_MARKERS.sub(_bullet_layout, text)
+    return ResponseFormatter()._layout(text.split('. '))
@@ -0,0 +1,316 @@
+"""Session and cache state shared by every worker process.
+
+`MemoryStateStore` keeps state in this process: the default for `python
+app.py` or a single ASGI worker. `SqliteStateStore` keeps it in one
+WAL-mode SQLite file, so preforked workers (gunicorn.conf.py) all see the
+same chat histories, pending budget confirmations and plan caches, and any
+worker can serve any request.
+
+Services use dict-like namespaces and LRUCache-compatible caches:
+
+    conversations = get_state_store().namespace('conversations', ttl=86400)
+    conversations[session_id] = history
+    plans = get_state_store().cache('budget_recommendations', max_size=256, ttl=3600)
+
+Values must be JSON-serializable and are replaced, never mutated in place:
+with SQLite every read returns a fresh copy, in memory the stored object
+itself. Read-modify-write goes through `update()`, which is atomic on both
+backends (a shard lock in memory, an IMMEDIATE transaction in SQLite).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+from config import Config
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _key(key):
+    """Namespaced keys are strings; tuples (cache keys) are stored as their JSON form"""
+    return key if isinstance(key, str) else json.dumps(key, default=str)
+
+
+class MemoryStateStore:
+    """Process-local state, split into lock-striped shards.
+
+    A key always lands on the same shard, so requests for different sessions
+    rarely share a lock and none is held for longer than a dict operation.
+    Values are stored as-is (no copies): replace them, never mutate them.
+    """
+
+    def __init__(self, shards=64):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]  # {(namespace, key): (value, expires_at)}
+
+    def _shard(self, namespace, key):
+        return self._shards[hash((namespace, key)) % len(self._shards)]
+
+    @staticmethod
+    def _live(entries, slot, now):
+        entry = entries.get(slot)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del entries[slot]
+            return None
+        return entry
+
+    def get(self, namespace, key, default=None):
+        entries, lock = self._shard(namespace, key)
+        with lock:
+            entry = self._live(entries, (namespace, key), time.time())
+        return default if entry is None else entry[0]
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        entries, lock = self._shard(namespace, key)
+        with lock:
+            entries[(namespace, key)] = (value, expires_at)
+
+    def update(self, namespace, key, fn, ttl=None):
+        """Atomically replace the value with fn(current value or None); returns the new value"""
+        entries, lock = self._shard(namespace, key)
+        with lock:
+            entry = self._live(entries, (namespace, key), time.time())
+            value = fn(None if entry is None else entry[0])
+            entries[(namespace, key)] = (value, time.time() + ttl if ttl else None)
+        return value
+
+    def delete(self, namespace, key):
+        entries, lock = self._shard(namespace, key)
+        with lock:
+            return entries.pop((namespace, key), None) is not None
+
+    def pop(self, namespace, key, default=None):
+        entries, lock = self._shard(namespace, key)
+        with lock:
+            entry = self._live(entries, (namespace, key), time.time())
+            if entry is None:
+                return default
+            del entries[(namespace, key)]
+            return entry[0]
+
+    def keys(self, namespace):
+        now = time.time()
+        keys = []
+        for entries, lock in self._shards:
+            with lock:
+                keys.extend(slot[1] for slot in list(entries)
+                            if slot[0] == namespace and self._live(entries, slot, now) is not None)
+        return keys
+
+    def clear(self, namespace):
+        for entries, lock in self._shards:
+            with lock:
+                for slot in [slot for slot in entries if slot[0] == namespace]:
+                    del entries[slot]
+
+    def namespace(self, name, ttl=None):
+        return StateNamespace(self, name, ttl)
+
+    def cache(self, name, max_size=256, ttl=None):
+        # In one process the plain LRU is both exact and cheaper than a shared table
+        return LRUCache(max_size=max_size, ttl=ttl)
+
+
+class SqliteStateStore:
+    """State in a WAL-mode SQLite file shared by the worker processes on this host"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS shared_state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS shared_state_age ON shared_state (namespace, updated_at);
+    """
+    SELECT = "SELECT value FROM shared_state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)"
+    UPSERT = """
+        INSERT INTO shared_state (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (namespace, key) DO UPDATE SET
+            value = excluded.value, expires_at = excluded.expires_at, updated_at = excluded.updated_at
+    """
+    DELETE = "DELETE FROM shared_state WHERE namespace = ? AND key = ?"
+    POP = DELETE + " AND (expires_at IS NULL OR expires_at > ?) RETURNING value"
+    KEYS = "SELECT key FROM shared_state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)"
+    CLEAR = "DELETE FROM shared_state WHERE namespace = ?"
+    # Oldest entries beyond the newest `max_size`
+    TRIM = """
+        DELETE FROM shared_state WHERE namespace = ? AND key IN (
+            SELECT key FROM shared_state WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)
+    """
+    PURGE = "DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?"
+
+    def __init__(self, path=None, purge_interval=300):
+        self.path = path or os.path.join(BASE_DIR, 'shared_state.db')
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._next_purge = 0.0
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        """One connection per thread and process (connections must not cross a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._connection().execute(self.SELECT, (namespace, _key(key), time.time())).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        self._connection().execute(self.UPSERT, (namespace, _key(key), json.dumps(value), now + ttl if ttl else None, now))
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self._connection().execute(self.PURGE, (now,))
+
+    def update(self, namespace, key, fn, ttl=None):
+        """Atomically replace the value with fn(current value or None); returns the new value.
+
+        The read and the write share one IMMEDIATE transaction, so concurrent
+        updates from any worker process are applied one after another.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(self.SELECT, (namespace, _key(key), now)).fetchone()
+            value = fn(None if row is None else json.loads(row[0]))
+            conn.execute(self.UPSERT, (namespace, _key(key), json.dumps(value), now + ttl if ttl else None, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, namespace, key):
+        return self._connection().execute(self.DELETE, (namespace, _key(key))).rowcount > 0
+
+    def pop(self, namespace, key, default=None):
+        """Read and delete in one statement, so two workers cannot both take the value"""
+        # fetchall() runs the statement to completion, which ends its implicit transaction
+        rows = self._connection().execute(self.POP, (namespace, _key(key), time.time())).fetchall()
+        return json.loads(rows[0][0]) if rows else default
+
+    def keys(self, namespace):
+        return [row[0] for row in self._connection().execute(self.KEYS, (namespace, time.time()))]
+
+    def clear(self, namespace):
+        self._connection().execute(self.CLEAR, (namespace,))
+
+    def trim(self, namespace, max_size):
+        self._connection().execute(self.TRIM, (namespace, namespace, max_size))
+
+    def namespace(self, name, ttl=None):
+        return StateNamespace(self, name, ttl)
+
+    def cache(self, name, max_size=256, ttl=None):
+        return SharedCache(self, name, max_size, ttl)
+
+
+class StateNamespace(MutableMapping):
+    """Dict view of one namespace; entries expire `ttl` seconds after their last write"""
+
+    def __init__(self, store, name, ttl=None):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+
+    def __getitem__(self, key):
+        value = self.store.get(self.name, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        return self.store.get(self.name, key, default)
+
+    def __setitem__(self, key, value):
+        self.store.set(self.name, key, value, self.ttl)
+
+    def __delitem__(self, key):
+        if not self.store.delete(self.name, key):
+            raise KeyError(key)
+
+    def pop(self, key, default=None):
+        """Atomic read-and-remove"""
+        return self.store.pop(self.name, key, default)
+
+    def update(self, key, fn):
+        """Atomic read-modify-write: store and return fn(current value or None)"""
+        return self.store.update(self.name, key, fn, self.ttl)
+
+    def __contains__(self, key):
+        return self.store.get(self.name, key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return iter(self.store.keys(self.name))
+
+    def __len__(self):
+        return len(self.store.keys(self.name))
+
+    def clear(self):
+        self.store.clear(self.name)
+
+
+class SharedCache:
+    """LRUCache-compatible cache over a shared namespace.
+
+    Eviction is by age of the last write rather than last read, so lookups
+    stay read-only statements.
+    """
+
+    def __init__(self, store, name, max_size=256, ttl=None):
+        self.store = store
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        return self.store.get(self.name, key, default)
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        self.store.set(self.name, key, value, self.ttl)
+        self.store.trim(self.name, self.max_size)
+
+    def clear(self):
+        self.store.clear(self.name)
+
+    def __len__(self):
+        return len(self.store.keys(self.name))
+
+
+_MISSING = object()
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Process-wide store selected by Config.SHARED_STATE ("memory" or "sqlite")"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            if Config.SHARED_STATE == 'sqlite':
+                _state_store = SqliteStateStore(Config.SHARED_STATE_PATH)
+                logger.info("Shared state in SQLite", extra={"path": _state_store.path})
+            else:
+                _state_store = MemoryStateStore()
+        return _state_store
@@ -0,0 +1,306 @@
+"""Spend-vs-budget rollups built from the Express order database.
+
+Orders are read incrementally from prisma/dev.db (keyset cursor on
+deliveryDate, with a lookback window for late writes) and folded into
+per-user, per-month, per-category totals stored next to the budget data.
+Readers only touch the in-memory copy of those totals, so "spent vs
+allocated" costs a dict lookup instead of an order scan.
+"""
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+from services.budget_allocator import (
+    CATEGORY_KEYWORDS, ELECTRONICS, GROCERIES, FASHION, BOOKS, HOME, EMERGENCY
+)
+from services.budget_store import DEFAULT_USER_ID, BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Product words in Item.name -> budget category (checked before the plan's own category keywords)
+ITEM_KEYWORDS = {
+    ELECTRONICS: ("laptop", "mobile", "phone", "charger", "keyboard", "mouse", "headphone", "earbud",
+                  "cable", "tablet", "camera", "speaker", "monitor", "watch"),
+    GROCERIES: ("rice", "atta", "flour", "oil", "snack", "tea", "coffee", "soap", "detergent", "shampoo"),
+    FASHION: ("shirt", "jeans", "dress", "shoe", "glasses", "bag", "cream", "perfume"),
+    BOOKS: ("novel", "magazine", "kindle", "dvd"),
+    HOME: ("bottle", "pan", "cooker", "plate", "mug", "bedsheet", "lamp"),
+}
+UNCATEGORIZED = EMERGENCY  # Anything we cannot place counts against the unplanned budget
+
+
+def category_for_item(name):
+    text = (name or "").lower()
+    for keywords in (ITEM_KEYWORDS, CATEGORY_KEYWORDS):
+        for category, words in keywords.items():
+            if any(word in text for word in words):
+                return category
+    return UNCATEGORIZED
+
+
+def _epoch_ms(value):
+    """Prisma stores SQLite DateTime as epoch milliseconds; older rows may be ISO strings"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp() * 1000)
+
+
+def month_key(epoch_ms):
+    return time.strftime('%Y-%m', time.localtime(epoch_ms / 1000))
+
+
+class SpendRollup:
+    """Incremental order -> (user, month, category) spend aggregates"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS spend_rollup (
+        user_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        orders INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS rollup_orders (
+        order_id TEXT PRIMARY KEY,
+        delivery_ms INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS rollup_cursor (
+        source TEXT PRIMARY KEY,
+        delivery_ms INTEGER NOT NULL
+    );
+    """
+
+    SELECT_ORDERS = """
+        SELECT orderId, userId, value, deliveryDate FROM "Order"
+        WHERE deliveryDate > ? OR (deliveryDate = ? AND orderId > ?)
+        ORDER BY deliveryDate, orderId
+        LIMIT ?
+    """
+    SELECT_ITEMS = """
+        SELECT oi.B, i.name, i.price FROM _OrderItems oi JOIN Item i ON i.itemId = oi.A
+        WHERE oi.B IN ({placeholders})
+    """
+    MARK_ORDER = "INSERT OR IGNORE INTO rollup_orders (order_id, delivery_ms) VALUES (?, ?)"
+    ADD_SPEND = """
+        INSERT INTO spend_rollup (user_id, month, category, amount, orders) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(user_id, month, category) DO UPDATE SET
+            amount = amount + excluded.amount,
+            orders = orders + 1
+    """
+    SELECT_CURSOR = "SELECT delivery_ms FROM rollup_cursor WHERE source = 'orders'"
+    SAVE_CURSOR = """
+        INSERT INTO rollup_cursor (source, delivery_ms) VALUES ('orders', ?)
+        ON CONFLICT(source) DO UPDATE SET delivery_ms = MAX(delivery_ms, excluded.delivery_ms)
+    """
+
+    def __init__(self, orders_db_path, path=None, lookback_seconds=86400, batch_size=500,
+                 default_order_user=None):
+        self.orders_db_path = orders_db_path
+        self.path = path or os.path.join(BASE_DIR, 'spend_rollup.db')
+        self.lookback_ms = int(lookback_seconds * 1000)
+        self.batch_size = batch_size
+        self.default_order_user = default_order_user or None
+
+        self._totals = {}  # (user_id, month) -> {category: amount}
+        self._ingest_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_ingest_at = None
+
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        conn.close()
+        self._reload_totals()
+
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+
+    def _orders_connection(self):
+        """Read-only, so a running Express server keeps ownership of dev.db"""
+        return sqlite3.connect(f"file:{self.orders_db_path}?mode=ro", uri=True, timeout=10)
+
+    # --- ingestion -----------------------------------------------------------
+
+    def ingest(self):
+        """Fold orders newer than the cursor (minus the lookback window) into the rollup.
+
+        Each order is recorded in rollup_orders in the same transaction as its
+        spend, so overlapping windows and several workers never count it twice.
+        Returns the number of newly counted orders.
+        """
+        if not os.path.exists(self.orders_db_path):
+            return 0
+
+        with self._ingest_lock:
+            conn = self._connection()
+            orders_conn = self._orders_connection()
+            try:
+                row = conn.execute(self.SELECT_CURSOR).fetchone()
+                start_ms = (row[0] - self.lookback_ms) if row else -1
+                last_ms, last_id = start_ms, ''
+                counted = 0
+
+                while True:
+                    orders = orders_conn.execute(
+                        self.SELECT_ORDERS, (last_ms, last_ms, last_id, self.batch_size)).fetchall()
+                    if not orders:
+                        break
+                    counted += self._ingest_batch(conn, orders_conn, orders)
+                    last_ms, last_id = _epoch_ms(orders[-1][3]), orders[-1][0]
+                    if len(orders) < self.batch_size:
+                        break
+            finally:
+                orders_conn.close()
+                conn.close()
+
+            self._reload_totals()
+            self.last_ingest_at = time.time()
+            if counted:
+                logger.info("Spend rollup ingested new orders", extra={"orders": counted})
+            return counted
+
+    def _ingest_batch(self, conn, orders_conn, orders):
+        order_ids = [order[0] for order in orders]
+        items = {}
+        query = self.SELECT_ITEMS.format(placeholders=",".join("?" * len(order_ids)))
+        for order_id, name, price in orders_conn.execute(query, order_ids):
+            items.setdefault(order_id, []).append((name, price or 0))
+
+        counted = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for order_id, user_id, value, delivery_date in orders:
+                delivery_ms = _epoch_ms(delivery_date)
+                if conn.execute(self.MARK_ORDER, (order_id, delivery_ms)).rowcount == 0:
+                    continue  # Already counted
+                month = month_key(delivery_ms)
+                for category, amount in self._split_order(value, items.get(order_id, ())).items():
+                    conn.execute(self.ADD_SPEND, (user_id, month, category, amount))
+                conn.execute(self.SAVE_CURSOR, (delivery_ms,))
+                counted += 1
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return counted
+
+    @staticmethod
+    def _split_order(value, items):
+        """Spread the order value over its items' categories by item price"""
+        item_total = sum(price for _, price in items)
+        if not items or item_total <= 0:
+            return {UNCATEGORIZED: value}
+        split = {}
+        for name, price in items:
+            category = category_for_item(name)
+            split[category] = split.get(category, 0) + value * price / item_total
+        return split
+
+    def _reload_totals(self):
+        conn = self._connection()
+        try:
+            totals = {}
+            for user_id, month, category, amount in conn.execute(
+                    "SELECT user_id, month, category, amount FROM spend_rollup"):
+                totals.setdefault((user_id, month), {})[category] = amount
+        finally:
+            conn.close()
+        self._totals = totals  # Swapped whole, so readers never see a half-built dict
+
+    # --- background refresh --------------------------------------------------
+
+    def start(self, interval):
+        """Ingest every `interval` seconds on a daemon thread (idempotent)"""
+        if self._thread is not None or interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="spend-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.ingest()
+            except Exception:
+                logger.exception("Spend rollup ingest failed")
+            self._stop.wait(interval)
+
+    # --- reads ---------------------------------------------------------------
+
+    def spent(self, user_id=DEFAULT_USER_ID, month=None):
+        """Spend per category for a budget user and month (YYYY-MM, default: current)"""
+        month = month or time.strftime('%Y-%m')
+        totals = self._totals
+        if user_id == DEFAULT_USER_ID and not self.default_order_user:
+            # Single-user setup: the default budget covers every order in the database
+            combined = {}
+            for (_, order_month), categories in totals.items():
+                if order_month == month:
+                    for category, amount in categories.items():
+                        combined[category] = combined.get(category, 0) + amount
+            return combined
+        order_user = self.default_order_user if user_id == DEFAULT_USER_ID else user_id
+        return dict(totals.get((order_user, month), {}))
+
+    def spend_vs_budget(self, budget_plan, user_id=DEFAULT_USER_ID, month=None):
+        """Allocated, spent and remaining amounts for every category in the plan"""
+        spent = self.spent(user_id, month)
+        categories = {}
+        for category, allocated in budget_plan.items():
+            if category in ('total_budget', 'recommendations'):
+                continue
+            try:
+                allocated = float(allocated)
+            except (TypeError, ValueError):
+                continue
+            used = round(spent.get(category, 0), 2)
+            categories[category] = {
+                "allocated": allocated,
+                "spent": used,
+                "remaining": round(allocated - used, 2)
+            }
+        total_allocated = sum(c["allocated"] for c in categories.values())
+        total_spent = round(sum(spent.values()), 2)
+        return {
+            "month": month or time.strftime('%Y-%m'),
+            "categories": categories,
+            "total_allocated": total_allocated,
+            "total_spent": total_spent,
+            "total_remaining": round(total_allocated - total_spent, 2)
+        }
+
+
+_rollup = None
+_rollup_lock = threading.Lock()
+
+
+def get_spend_rollup():
+    """Process-wide rollup, created and started on first use"""
+    global _rollup
+    with _rollup_lock:
+        if _rollup is None:
+            _rollup = SpendRollup(
+                Config.ORDERS_DB_PATH,
+                Config.SPEND_ROLLUP_PATH,
+                lookback_seconds=Config.SPEND_ROLLUP_LOOKBACK,
+                default_order_user=Config.SPEND_DEFAULT_ORDER_USER
+            )
+            _rollup.start(Config.SPEND_ROLLUP_INTERVAL)
+        return _rollup
+
+
+def stop_spend_rollup():
+    """Stop the background ingest thread if the rollup was ever started"""
+    with _rollup_lock:
+        if _rollup is not None:
+            _rollup.stop()
@@ -0,0 +1,75 @@
+"""Report where application startup time goes.
+
+Usage:
+    python startup_report.py            # import + create_app timings, slowest imports
+    python startup_report.py --top 40 --services
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, so the
+numbers match a cold worker boot, then times create_app() and (with
+--services) the first construction of each lazily built service.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module):
+    """(cumulative_us, self_us, name) for every module imported by `import module`"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Application startup time report")
+    parser.add_argument('--top', type=int, default=20, help="Slowest imports to list")
+    parser.add_argument('--services', action='store_true', help="Also time building each service")
+    args = parser.parse_args()
+
+    rows = import_times('app')
+    total_us = next((cumulative for cumulative, _, name in rows if name.strip() == 'app'), 0)
+    print(f"import app: {total_us / 1000:.1f} ms ({len(rows)} modules)")
+    print("\nDirect imports of app (cumulative):")
+    direct = [row for row in rows if row[2].startswith('  ') and not row[2].startswith('    ')]
+    for cumulative, _, name in sorted(direct, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+    print("\nSlowest modules (self time):")
+    for _, self_us, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name.strip()}")
+
+    # Phase timings in this interpreter
+    sys.path.insert(0, HERE)
+    started = time.perf_counter()
+    from app import create_app
+    from services.container import get_services
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    print(f"\nimport app (warm process): {(imported - started) * 1000:.1f} ms")
+    print(f"create_app():              {(created - imported) * 1000:.1f} ms")
+
+    if args.services:
+        services = get_services(app)
+        for name in ('budget_service', 'chatbot_service', 'recommendation_service'):
+            started = time.perf_counter()
+            getattr(services, name)
+            print(f"first {name}: {(time.perf_counter() - started) * 1000:.1f} ms")
+        heavy = [module for module in ('groq', 'geopy', 'pandas', 'numpy') if module in sys.modules]
+        print(f"heavy SDKs loaded after building services: {', '.join(heavy) or 'none'}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
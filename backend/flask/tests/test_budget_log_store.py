@@ -0,0 +1,58 @@
+import pytest
+
+from services.budget_log_store import LogBudgetStore
+from services.budget_store import BudgetVersionConflict
+
+PLAN = {'Groceries': 4000, 'Books': 1000, 'total_budget': 5000}
+
+
+def test_stale_expected_version_raises_conflict(tmp_path):
+    store = LogBudgetStore(str(tmp_path))
+    store.save('alice', {}, dict(PLAN))
+    store.update_category('alice', 'Books', 1500, expected_version=1)
+
+    with pytest.raises(BudgetVersionConflict) as conflict:
+        store.update_category('alice', 'Books', 2000, expected_version=1)
+    assert (conflict.value.expected, conflict.value.actual) == (1, 2)
+    assert store.load('alice')['budget_plan']['Books'] == 1500
+
+
+def test_truncated_last_line_is_skipped_on_reload(tmp_path):
+    store = LogBudgetStore(str(tmp_path))
+    store.save('alice', {}, dict(PLAN))
+    store.update_category('alice', 'Books', 1500)
+    segment = store._segment_path(store._segment)
+    with open(segment, 'ab') as f:
+        f.write(b'{"user":"alice","op":"set","version":3,"category":"Bo')  # Crash mid-append
+
+    reloaded = LogBudgetStore(str(tmp_path))
+    plan = reloaded.load('alice')
+    assert plan['version'] == 2
+    assert plan['budget_plan']['Books'] == 1500
+
+    # The next append overwrites the torn tail instead of following it
+    reloaded.update_category('alice', 'Books', 1800, expected_version=2)
+    assert LogBudgetStore(str(tmp_path)).load('alice')['budget_plan']['Books'] == 1800
+
+
+def test_instances_sharing_a_directory_see_each_others_writes(tmp_path):
+    first, second = LogBudgetStore(str(tmp_path)), LogBudgetStore(str(tmp_path))
+    first.save('alice', {}, dict(PLAN))
+    assert second.load('alice')['budget_plan'] == PLAN
+
+    second.update_category('alice', 'Books', 1500, expected_version=1)
+    assert first.version('alice') == 2
+    assert first.load('alice')['budget_plan']['total_budget'] == 5500
+    with pytest.raises(BudgetVersionConflict):
+        first.save('alice', {}, dict(PLAN), expected_version=1)
+
+
+def test_instances_follow_each_others_compactions(tmp_path):
+    first = LogBudgetStore(str(tmp_path), snapshot_every=2)
+    second = LogBudgetStore(str(tmp_path), snapshot_every=2)
+    first.save('alice', {}, dict(PLAN))
+    first.update_category('alice', 'Books', 1500)  # Second record: snapshot and a new segment
+    first.update_category('alice', 'Books', 1700)
+
+    assert second.load('alice')['budget_plan']['Books'] == 1700
+    assert LogBudgetStore(str(tmp_path)).load('alice')['version'] == 3
@@ -0,0 +1,44 @@
+import pytest
+
+from services.budget_store import BudgetVersionConflict, JsonFileBudgetStore, SqliteBudgetStore
+
+PLAN = {'Groceries': 4000, 'Books': 1000, 'total_budget': 5000, 'recommendations': []}
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def make_store(request, tmp_path):
+    if request.param == 'json':
+        return lambda: JsonFileBudgetStore(str(tmp_path / 'budget_plan.json'))
+    return lambda: SqliteBudgetStore(str(tmp_path / 'budget_plans.db'))
+
+
+def test_stale_expected_version_raises_conflict(make_store):
+    store = make_store()
+    store.save('alice', {}, dict(PLAN))
+    store.update_category('alice', 'Books', 1500, expected_version=1)
+
+    with pytest.raises(BudgetVersionConflict) as conflict:
+        store.update_category('alice', 'Books', 2000, expected_version=1)
+    assert (conflict.value.expected, conflict.value.actual) == (1, 2)
+    with pytest.raises(BudgetVersionConflict):
+        store.save('alice', {}, dict(PLAN), expected_version=1)
+    assert store.load('alice')['budget_plan']['Books'] == 1500
+
+
+def test_instances_sharing_a_path_see_each_others_writes(make_store):
+    first, second = make_store(), make_store()
+    first.save('alice', {}, dict(PLAN))
+    assert second.load('alice')['budget_plan'] == PLAN
+
+    second.update_category('alice', 'Books', 1500, expected_version=1)
+    reloaded = first.load('alice')
+    assert reloaded['version'] == 2
+    assert reloaded['budget_plan']['Books'] == 1500
+    assert reloaded['budget_plan']['total_budget'] == 5500
+
+
+def test_user_ids_that_sanitize_alike_get_separate_files(tmp_path):
+    store = JsonFileBudgetStore(str(tmp_path / 'budget_plan.json'))
+    for amount, user_id in enumerate(['a/b', 'a b', 'a_b']):
+        store.save(user_id, {}, {'Books': amount, 'total_budget': amount})
+    assert [store.load(u)['budget_plan']['Books'] for u in ['a/b', 'a b', 'a_b']] == [0, 1, 2]
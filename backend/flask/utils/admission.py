@@ -0,0 +1,260 @@
+"""Admission control for the LLM-backed routes.
+
+Each request to a limited route passes three gates before it may call Groq:
+
+    1. its client's token bucket (per user id, else chat session, else
+       address; see `rate_limit_key`); an empty bucket is an immediate 429
+    2. a cap on LLM requests in flight in this process; over the cap a
+       request waits in a bounded queue, and a full queue or a wait longer
+       than `queue_timeout` is a 503
+    3. the process-wide token bucket (requests per second to the provider);
+       the request waits for a token within what is left of its queue time
+
+Rejections carry Retry-After. Because only limited routes are gated and the
+in-flight cap sits below the server's thread count, cheap endpoints such as
+GET /api/budget/plan keep free threads during LLM spikes. Limits apply per
+process; with several workers the effective global rate is rate x workers.
+
+    @budget_bp.route('/plan', methods=['POST'])
+    @admission_controlled
+    def create_budget_plan(): ...
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify, make_response, request, session
+
+from services.budget_store import DEFAULT_USER_ID
+from services.chatbot_service import LEGACY_SHARED_SESSION
+from utils.metrics import registry
+from utils.token_bucket import TokenBucket
+
+EXTENSION_KEY = 'admission'
+
+ADMISSION_REJECTIONS = registry.counter(
+    'admission_rejections_total', 'LLM route requests turned away by reason (session_rate, queue_full, ...)')
+ADMISSION_QUEUE_WAIT = registry.histogram(
+    'admission_queue_wait_seconds', 'Time admitted LLM requests waited for a slot and a rate token',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionTicket:
+    """A held in-flight slot; release exactly once when the LLM work is done"""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=16, max_queue=16, queue_timeout=5.0, global_rate=0.0, global_burst=None,
+                 session_rate=0.0, session_burst=None, max_sessions=10000):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = queue_timeout
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_sessions = max_sessions
+
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._sessions = OrderedDict()  # client key -> TokenBucket, least recently used first
+        self._sessions_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_concurrent=config.ADMISSION_MAX_CONCURRENT,
+            max_queue=config.ADMISSION_MAX_QUEUE,
+            queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+            global_rate=config.ADMISSION_GLOBAL_RATE,
+            global_burst=config.ADMISSION_GLOBAL_BURST or None,
+            session_rate=config.ADMISSION_SESSION_RATE,
+            session_burst=config.ADMISSION_SESSION_BURST or None
+        )
+
+    def stats(self):
+        return {"active": self._active, "waiting": self._waiting, "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue, "tracked_clients": len(self._sessions)}
+
+    def _session_bucket(self, key):
+        with self._sessions_lock:
+            bucket = self._sessions.get(key)
+            if bucket is None:
+                bucket = self._sessions[key] = TokenBucket(self.session_rate, self.session_burst)
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(key)
+            return bucket
+
+    def _check_session(self, client_key):
+        if self.session_rate > 0 and client_key is not None:
+            wait = self._session_bucket(client_key).try_acquire()
+            if wait:
+                raise AdmissionRejected(429, 'session_rate', wait)
+
+    def _release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def _try_enter(self):
+        """Take a slot if one is free (caller holds the condition)"""
+        if self._active < self.max_concurrent:
+            self._active += 1
+            return True
+        return False
+
+    def _queue_full(self):
+        # A full queue clears about as fast as one queue timeout
+        return AdmissionRejected(503, 'queue_full', self.queue_timeout)
+
+    def _take_rate_token(self, ticket, deadline):
+        if self.global_bucket is not None and not self.global_bucket.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            ticket.release()
+            raise AdmissionRejected(503, 'global_rate', 1 / self.global_bucket.rate)
+
+    def admit(self, client_key):
+        """Block until admitted (returns an AdmissionTicket) or raise AdmissionRejected
+
+        A client_key of None skips the per-client bucket, for work whose request already passed it.
+        """
+        self._check_session(client_key)
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._condition:
+            if not self._try_enter():
+                if self._waiting >= self.max_queue:
+                    raise self._queue_full()
+                self._waiting += 1
+                try:
+                    while not self._try_enter():
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise AdmissionRejected(503, 'queue_timeout', self.queue_timeout)
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+        ticket = AdmissionTicket(self)
+        self._take_rate_token(ticket, deadline)
+        ADMISSION_QUEUE_WAIT.observe(time.monotonic() - started)
+        return ticket
+
+    async def admit_async(self, client_key, poll_interval=0.01):
+        """Event-loop variant of admit(): waits by sleeping instead of blocking the loop"""
+        self._check_session(client_key)
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._condition:
+            admitted = self._try_enter()
+            if not admitted:
+                if self._waiting >= self.max_queue:
+                    raise self._queue_full()
+                self._waiting += 1
+        if not admitted:
+            try:
+                while True:
+                    with self._condition:
+                        if self._try_enter():
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionRejected(503, 'queue_timeout', self.queue_timeout)
+                    await asyncio.sleep(min(poll_interval, remaining))
+            finally:
+                with self._condition:
+                    self._waiting -= 1
+        ticket = AdmissionTicket(self)
+        if self.global_bucket is not None:
+            while True:
+                wait = self.global_bucket.try_acquire()
+                if not wait:
+                    break
+                if time.monotonic() + wait > deadline:
+                    ticket.release()
+                    raise AdmissionRejected(503, 'global_rate', wait)
+                await asyncio.sleep(wait)
+        ADMISSION_QUEUE_WAIT.observe(time.monotonic() - started)
+        return ticket
+
+
+def rejection_body(rejected):
+    messages = {
+        429: "Too many requests from this client; please slow down",
+        503: "The assistant is busy right now; please try again shortly",
+    }
+    return {"error": messages[rejected.status], "reason": rejected.reason, "retry_after": rejected.retry_after}
+
+
+def rate_limit_key(user_id, session_id, address):
+    """Per-client bucket key: the caller's user id, else its chat session, else its address.
+
+    The address is only an identity when it is the client's own: behind a
+    proxy or load balancer set TRUSTED_PROXY_HOPS so it is read from
+    X-Forwarded-For, or every caller shares the proxy's bucket. None (no
+    identity at all) skips the per-client bucket; the global gates still apply.
+    """
+    if user_id and user_id != DEFAULT_USER_ID:
+        return f"user:{user_id}"
+    if session_id and session_id != LEGACY_SHARED_SESSION:  # The pre-per-client shared id is not a client
+        return f"session:{session_id}"
+    return f"addr:{address}" if address else None
+
+
+def client_key():
+    """Rate-limit key of the current Flask request (remote_addr is already proxy-corrected by ProxyFix)"""
+    return rate_limit_key(request.headers.get('X-User-Id') or request.args.get('user_id'),
+                          session.get('session_id'), request.remote_addr)
+
+
+def admission_controlled(view):
+    """Gate a Flask view through the app's AdmissionController (no-op when none is configured)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        controller = current_app.extensions.get(EXTENSION_KEY)
+        if controller is None:
+            return view(*args, **kwargs)
+        try:
+            ticket = controller.admit(client_key())
+        except AdmissionRejected as rejected:
+            ADMISSION_REJECTIONS.inc(route=request.url_rule.rule, reason=rejected.reason)
+            response = make_response(jsonify(rejection_body(rejected)), rejected.status)
+            response.headers['Retry-After'] = str(rejected.retry_after)
+            return response
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            ticket.release()
+            raise
+        if response.is_streamed:
+            response.call_on_close(ticket.release)  # Streamed bodies keep the LLM busy until sent
+        else:
+            ticket.release()
+        return response
+    return wrapper
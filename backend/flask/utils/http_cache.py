@@ -0,0 +1,58 @@
+import hashlib
+import json
+
+from flask import Response, jsonify, request
+
+
+def plan_etag(plan):
+    """ETag for a stored budget document: its version, or a content hash for unversioned files"""
+    version = plan.get('version')
+    if version is not None:
+        return f"budget-v{version}"
+    digest = hashlib.sha1(json.dumps(plan, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return f"budget-{digest}"
+
+
+def parse_plan_version(value):
+    """Plan version from a body field or If-Match value: 3, "3", "budget-v3" or W/"budget-v3".
+
+    Raises ValueError for anything else, including a content-hash ETag of an unversioned plan.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid plan version: {value!r}")
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if text.startswith('W/'):
+        text = text[2:]
+    text = text.strip('"')
+    if text.startswith('budget-v'):
+        text = text[len('budget-v'):]
+    if not text.isdigit():
+        raise ValueError(f"Invalid plan version: {value!r}")
+    return int(text)
+
+
+def conditional_plan_response(plan, budget_service, user_id):
+    """Serve a budget document with ETag/304 handling and optional ?since=<version> deltas.
+
+    The If-None-Match check runs before anything is serialized, so unchanged
+    documents cost a version lookup and an empty 304.
+    """
+    etag = plan_etag(plan)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    body = plan
+    since = request.args.get('since', type=int)
+    if since is not None:
+        delta = budget_service.get_plan_delta(since, plan, user_id)
+        if delta is not None:
+            body = delta
+
+    response = jsonify(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
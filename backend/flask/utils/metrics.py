@@ -0,0 +1,270 @@
+"""Minimal Prometheus-text metrics with lock-free recording.
+
+Each thread records into its own shard (plain dicts only that thread
+writes), so observing a latency or bumping a counter never takes a lock or
+contends with other request threads. A scrape copies every shard and
+merges them. Only the first observation from a new thread takes the
+metric's lock, to register its shard.
+
+    REQUEST_LATENCY.observe(0.12, method="GET", route="/api/budget/plan", status="200")
+    CACHE_REQUESTS.inc(cache="budget_recommendation", result="hit")
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Route template of the request being served, used to attribute LLM calls to endpoints
+current_route = contextvars.ContextVar('current_route', default='background')
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._local = threading.local()
+        self._shards = []    # (thread, shard) for threads that have recorded
+        self._retired = {}   # Shards of finished threads, merged
+        self._shards_lock = threading.Lock()
+        registry.register(self)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._retire_dead_threads()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_threads(self):
+        """Fold shards of finished threads into one (thread-per-request servers start many)"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = alive
+
+    def _snapshots(self):
+        with self._shards_lock:
+            self._retire_dead_threads()
+            return [self._copy(self._retired)] + [self._copy(shard) for _, shard in self._shards]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = _label_key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, value in shard.items():
+            target[key] = target.get(key, 0) + value
+
+    @staticmethod
+    def _copy(shard):
+        return shard.copy()
+
+    def totals(self):
+        merged = {}
+        for shard in self._snapshots():
+            self._merge(merged, shard)
+        return merged
+
+    def collect(self):
+        for key, value in sorted(self.totals().items()):
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = _label_key(labels)
+        series = shard.get(key)
+        if series is None:
+            # [per-bucket counts (last is +Inf), sum, count]
+            series = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, (counts, total, count) in shard.items():
+            series = target.get(key)
+            if series is None:
+                target[key] = [list(counts), total, count]
+            else:
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+
+    @staticmethod
+    def _copy(shard):
+        return {key: [list(counts), total, count] for key, (counts, total, count) in list(shard.items())}
+
+    def collect(self):
+        merged = {}
+        for shard in self._snapshots():
+            self._merge(merged, shard)
+        for key, (counts, total, count) in sorted(merged.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+
+class Gauge:
+    """Value computed at scrape time by a callback returning {labels_tuple_or_dict: value} or a number"""
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help_text, callback):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        registry.register(self)
+
+    def collect(self):
+        values = self.callback()
+        if values is None:
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items(), key=lambda item: str(item[0])):
+            key = _label_key(labels) if isinstance(labels, dict) else tuple(labels)
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        # Re-registering a name (e.g. create_app called again) replaces the old metric
+        self._metrics = [existing for existing in self._metrics if existing.name != metric.name] + [metric]
+
+    def counter(self, name, help_text):
+        return Counter(self, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return Histogram(self, name, help_text, buckets)
+
+    def gauge(self, name, help_text, callback):
+        return Gauge(self, name, help_text, callback)
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.collect())
+            except Exception as e:
+                samples = []
+                lines.append(f"# {metric.name} collection failed: {e}")
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template and status')
+LLM_LATENCY = registry.histogram(
+    'groq_request_duration_seconds', 'Groq chat completion latency (whole stream for streamed calls)')
+LLM_REQUESTS = registry.counter(
+    'groq_requests_total', 'Groq chat completion calls by endpoint, call site and outcome')
+LLM_TOKENS = registry.counter(
+    'groq_tokens_total', 'Tokens reported in response.usage by endpoint, call site and kind')
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit/miss)')
+PLAN_FALLBACKS = registry.counter(
+    'budget_plan_fallbacks_total', 'Budget plans served by the local allocator because the LLM gave none')
+GEOCODER_LATENCY = registry.histogram(
+    'geocoder_request_duration_seconds', 'Nominatim geocoding latency by result')
+
+
+def _cache_hit_ratio():
+    totals = {}
+    for key, value in CACHE_REQUESTS.totals().items():
+        labels = dict(key)
+        hits, lookups = totals.get(labels['cache'], (0, 0))
+        totals[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), lookups + value)
+    return {(('cache', cache),): hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+CACHE_HIT_RATIO = registry.gauge('cache_hit_ratio', 'Hits / lookups since process start', _cache_hit_ratio)
+
+
+class _LLMCall:
+    usage = None
+
+    def record_chunk(self, chunk):
+        """Pick up usage from the final chunk of a Groq stream (sent as x_groq.usage)"""
+        usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        if usage is not None:
+            self.usage = usage
+
+
+@contextmanager
+def track_llm_call(call):
+    """Time one Groq call and count its tokens; set `.usage` (or feed stream chunks) inside the block"""
+    endpoint = current_route.get()
+    tracker = _LLMCall()
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield tracker
+        outcome = 'ok'
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, call=call)
+        LLM_REQUESTS.inc(endpoint=endpoint, call=call, outcome=outcome)
+        usage = tracker.usage
+        if usage is not None:
+            LLM_TOKENS.inc(getattr(usage, 'prompt_tokens', 0) or 0, endpoint=endpoint, call=call, kind='prompt')
+            LLM_TOKENS.inc(getattr(usage, 'completion_tokens', 0) or 0, endpoint=endpoint, call=call, kind='completion')
@@ -0,0 +1,123 @@
+"""Opt-in per-request profiling.
+
+A request is profiled when profiling is enabled and either the caller asks
+for it (X-Profile header, optionally with a shared token) or it falls into
+the configured random sample. Two modes:
+
+    sample    a background thread snapshots the request thread's stack every
+              few milliseconds; written as collapsed stacks (`a;b;c count`),
+              which flamegraph.pl, speedscope and inferno read directly
+    cprofile  deterministic cProfile, written as a .pstats file
+              (python -m pstats / snakeviz); higher overhead
+
+Artifacts are named <timestamp>-<route>-<request id>.folded|.pstats.
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_REQUEST_ID_LENGTH = 64
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _CProfileSession:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+class RequestProfiler:
+    """Decides which requests to profile and writes their artifacts"""
+
+    EXTENSIONS = {'sample': 'folded', 'cprofile': 'pstats'}
+
+    def __init__(self, directory, mode='sample', sample_rate=0.0, interval_ms=5, token=None):
+        self.directory = directory
+        self.mode = mode if mode in self.EXTENSIONS else 'sample'
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.token = token or None
+
+    def wanted(self, header_value):
+        """Profile when the header asks for it (and carries the token, if one is set) or by sampling"""
+        if header_value:
+            return self.token is None or header_value == self.token
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        session = StackSampler(threading.get_ident(), self.interval) if self.mode == 'sample' else _CProfileSession()
+        try:
+            session.start()
+        except ValueError as e:
+            # cProfile refuses to nest with another active profiler
+            logger.warning("Request profiling not started: %s", e)
+            return None
+        session.started_at = time.perf_counter()
+        return session
+
+    def finish(self, session, route, request_id):
+        """Stop the session and write its artifact; returns the file name, or None if writing failed"""
+        try:
+            session.stop()
+            elapsed_ms = (time.perf_counter() - session.started_at) * 1000
+            os.makedirs(self.directory, exist_ok=True)
+            route_slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+            # The request id may come from the client's X-Request-Id header
+            request_slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(request_id))[:MAX_REQUEST_ID_LENGTH] or 'request'
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route_slug}-{request_slug}.{self.EXTENSIONS[self.mode]}"
+            session.write(os.path.join(self.directory, name))
+        except Exception:
+            logger.exception("Request profile not written", extra={"route": route})
+            return None
+        logger.info("Request profile written", extra={"artifact": name, "route": route,
+                                                      "elapsed_ms": round(elapsed_ms, 1)})
+        return name
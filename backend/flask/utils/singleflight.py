@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution (threads)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once per key; concurrent callers share the result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn(*args, **kwargs)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['event'].set()
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent awaits with the same key into one coroutine run"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        """Await coro_fn(*args, **kwargs) once per key; concurrent callers share the result"""
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await coro_fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
@@ -0,0 +1,158 @@
+"""Leveled, structured logging that stays off the request thread.
+
+Request threads only put LogRecords on a bounded queue; a QueueListener
+thread formats them (JSON lines or plain text) and writes them out. DEBUG
+records are sampled, every record carries the current request's
+correlation id, and a full queue drops records instead of blocking.
+
+    logger = logging.getLogger(__name__)
+    logger.info("budget plan saved", extra={"user_id": user_id, "version": 3})
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+_listener = None
+_queue_handler = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id=None):
+    """Bind a correlation id to the current thread/task; returns the id and a reset token"""
+    request_id = request_id or new_request_id()
+    return request_id, request_id_var.set(request_id)
+
+
+def reset_request_id(token):
+    request_id_var.reset(token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp the caller's correlation id on the record before it crosses threads"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get() or '-'
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records; INFO and above always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id != '-':
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enqueue raw records; formatting happens on the listener thread"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same process, so the record does not need to be made picklable here
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level='INFO', fmt='json', debug_sample_rate=1.0, queue_size=10000, stream=None):
+    """Route the root logger through a background queue listener (idempotent)"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _queue_handler
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    _queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = QueueListener(_queue_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+    return _queue_handler
+
+
+def _restart_listener_after_fork():
+    """A forked worker inherits the queue but not the listener thread; give it both afresh"""
+    global _listener
+    if _listener is None:
+        return
+    _queue_handler.queue = queue.Queue(maxsize=_queue_handler.queue.maxsize)
+    _queue_handler.dropped = 0
+    _listener = QueueListener(_queue_handler.queue, *_listener.handlers, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _queue_handler.dropped:
+            sys.stderr.write(f"logging: dropped {_queue_handler.dropped} record(s) while the queue was full\n")
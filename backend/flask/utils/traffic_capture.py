@@ -0,0 +1,141 @@
+"""Sanitized request traces for capacity planning (replayed by replay_traffic.py).
+
+One JSON line per request:
+
+    {"ts": 1760851380.503, "method": "POST", "route": "/api/chatbot/chat", "query": {},
+     "body": {"message": {"$str": 34}}, "session": "9f2c0a51b7e4", "status": 200, "ms": 812.4}
+
+`ts` is the request's start time, so gaps between lines are the real
+inter-arrival times. Nothing identifying is written: free text becomes its
+length, amounts are rounded to two significant digits, and session and user
+ids are replaced by salted hashes that only keep one client's requests
+together. Questionnaire choices and query values such as product and city
+are kept so a replay exercises the same code paths.
+
+Requests are sampled per session (a sampled client is recorded completely)
+and written by a background thread; a full queue drops traces instead of
+slowing requests down. A forked worker writes to its own file
+(trace.<pid>.jsonl next to trace.jsonl); the replay tool merges them.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Body fields whose string values are choices from a fixed set, not user text
+ENUM_FIELDS = {'age_group', 'shopping_behavior', 'unplanned_purchases', 'primary_goal', 'top_categories',
+               'category', 'action', 'month'}
+# Query parameters kept verbatim (everything else is reduced to its length)
+PASSTHROUGH_PARAMS = {'product', 'city', 'month', 'since', 'timeout'}
+SKIPPED_ROUTES = {'/metrics'}
+
+
+def _round_amount(value):
+    """Two significant digits: 12345 -> 12000, keeps magnitude but not the exact figure"""
+    if isinstance(value, bool) or not value:
+        return value
+    if isinstance(value, float) and not math.isfinite(value):
+        return None  # NaN/Infinity parse from JSON bodies but have no magnitude (and are not valid JSON)
+    digits = 1 - int(math.floor(math.log10(abs(value))))
+    rounded = round(value, digits)
+    if isinstance(rounded, int):
+        return rounded  # Exact, however large (a float() of it can overflow)
+    return int(rounded) if rounded.is_integer() else rounded
+
+
+def body_shape(value, field=None, depth=0):
+    """Structure of a JSON body with private values replaced"""
+    if depth > 4:
+        return {"$truncated": True}
+    if isinstance(value, dict):
+        return {key: body_shape(item, key, depth + 1) for key, item in list(value.items())[:50]}
+    if isinstance(value, list):
+        return [body_shape(item, field, depth + 1) for item in value[:20]]
+    if isinstance(value, str):
+        return value[:100] if field in ENUM_FIELDS else {"$str": len(value)}
+    if isinstance(value, (int, float)):
+        return _round_amount(value)
+    return value
+
+
+class TrafficRecorder:
+    def __init__(self, path, sample_rate=1.0, queue_size=10000, salt=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.salt = salt if salt is not None else os.urandom(8).hex()  # Fresh per capture: hashes do not link runs
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._owner_pid = os.getpid()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_writer(self):
+        """Start the writer thread in this process (threads do not survive a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            path = self.path
+            if os.getpid() != self._owner_pid:
+                root, ext = os.path.splitext(self.path)
+                path = f"{root}.{os.getpid()}{ext}"
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._thread = threading.Thread(target=self._write_loop, args=(path,), name='trace-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def anonymize(self, value):
+        return hashlib.sha256(f"{self.salt}:{value}".encode('utf-8')).hexdigest()[:12]
+
+    def sampled(self, client):
+        """Whole clients are in or out of the sample, so their request sequences stay intact"""
+        if self.sample_rate >= 1:
+            return True
+        return int(self.anonymize(client)[:8], 16) / 0xFFFFFFFF < self.sample_rate
+
+    def record(self, started, method, route, query, body, client, user_id, status, duration):
+        """Queue one trace line; `started` is the request's time.time() start"""
+        if route in SKIPPED_ROUTES or not self.sampled(client):
+            return
+        self._ensure_writer()
+        entry = {
+            "ts": round(started, 3),
+            "method": method,
+            "route": route,
+            "query": {key: (value if key in PASSTHROUGH_PARAMS else {"$str": len(value)})
+                      for key, value in query.items()},
+            "body": body_shape(body) if body is not None else None,
+            "session": self.anonymize(client),
+            "status": status,
+            "ms": round(duration * 1000, 1),
+        }
+        if user_id:
+            entry["user"] = self.anonymize(user_id)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    break
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self):
+        """Write out queued traces and stop the writer"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        if self.dropped:
+            logger.warning("Traffic capture dropped traces while its queue was full", extra={"dropped": self.dropped})
@@ -43,6 +43,7 @@ const RecommendationsScreen = ({ navigation }) => {
   const [product, setProduct] = useState('');
   const [city, setCity] = useState('');
   const [recommendations, setRecommendations] = useState([]);
+  const [cityCorrection, setCityCorrection] = useState(null);
   const [loading, setLoading] = useState(false);
   const [searched, setSearched] = useState(false);
   const [isDarkMode, setIsDarkMode] = useState(false);
@@ -71,6 +72,8 @@ const RecommendationsScreen = ({ navigation }) => {
       setLoading(true);
       const data = await getRecommendations(product, city);
       setRecommendations(data.recommendations || []);
+      // Set when the backend replaced a city it could not find with the closest known one
+      setCityCorrection(data.city_correction || null);
       setSearched(true);
     } catch (error) {
       console.error('Error fetching recommendations:', error);
@@ -310,9 +313,14 @@ const RecommendationsScreen = ({ navigation }) => {
                   </Text>
                   <Text style={[styles.resultsSubtitle, { color: currentTheme.textSecondary }]}>
                     {recommendations.length > 0 
-                      ? `Best matches for "${product}"${city ? ` in ${city}` : ''}` 
+                      ? `Best matches for "${product}"${city ? ` in ${cityCorrection ? cityCorrection.city : city}` : ''}` 
                       : 'Try adjusting your search criteria'}
                   </Text>
+                  {cityCorrection && (
+                    <Text style={[styles.resultsSubtitle, { color: currentTheme.textSecondary }]}>
+                      {`Showing results for ${cityCorrection.city} (you typed "${cityCorrection.query}")`}
+                    </Text>
+                  )}
               </View>
             </View>
             </Card.Content>
@@ -21,6 +21,8 @@ class BudgetService {
     this.currentCallback = null;
     this.navigationCallback = null;
     this.lastFileCheck = null;
+    this.lastServerVersion = undefined;
+    this.lastServerEtag = null;
 
     if (typeof window !== "undefined") {
       window.budgetService = this;
@@ -69,12 +71,21 @@ class BudgetService {
               method: "GET",
               headers: {
                 "Content-Type": "application/json",
+                ...(this.lastServerEtag && this.cache
+                  ? { "If-None-Match": this.lastServerEtag }
+                  : {}),
               },
               cache: "no-cache",
             },
             5000
           );
 
+          if (response.status === 304) {
+            // Unchanged since our last copy; nothing to download or diff
+            this.lastFetch = Date.now();
+            return this.cache;
+          }
+
           if (response.ok) {
             console.log(`✅ Successfully connected to: ${endpoint}`);
             break;
@@ -94,8 +105,22 @@ class BudgetService {
         throw lastError || new Error("All server endpoints failed");
       }
 
+      this.lastServerEtag = response.headers.get("ETag");
       const serverData = await response.json();
 
+      return this.applyServerData(serverData, notifyCallback);
+    } catch (error) {
+      console.error("❌ Error fetching budget from server:", error);
+      return this.getLocalBudgetFallback();
+    }
+  }
+
+  applyServerData(serverData, notifyCallback = true) {
+    try {
+      if (serverData.version !== undefined) {
+        this.lastServerVersion = serverData.version;
+      }
+
       const serverDataHash = this.createDataHash(serverData);
 
       const dataChanged = this.lastServerDataHash !== serverDataHash;
@@ -159,7 +184,7 @@ class BudgetService {
         return this.getLocalBudgetFallback();
       }
     } catch (error) {
-      console.error("❌ Error fetching budget from server:", error);
+      console.error("❌ Error processing budget from server:", error);
       return this.getLocalBudgetFallback();
     }
   }
@@ -207,6 +232,7 @@ class BudgetService {
     this.cache = null;
     this.lastFetch = null;
     this.lastServerDataHash = null;
+    this.lastServerEtag = null;
     console.log("🗑️ Budget cache cleared");
   }
 
@@ -230,19 +256,42 @@ class BudgetService {
       callback(initialBudget);
     }
 
-    this.pollInterval = setInterval(async () => {
-      if (!this.isPolling) return;
+    this.watchForChanges(checkInterval);
 
+    return () => {
+      this.stopChangeDetection();
+    };
+  }
+
+  // Long-poll /budget/watch: the server answers only when the budget version
+  // changes (or with 204 after ~25s), so an idle client costs almost nothing.
+  async watchForChanges(retryInterval = 30000) {
+    while (this.isPolling) {
       try {
-        await this.fetchBudgetFromServer(true);
+        const version =
+          this.lastServerVersion !== undefined ? this.lastServerVersion : -1;
+        const response = await fetchWithTimeout(
+          `${FLASK_API}/budget/watch?version=${version}&timeout=25`,
+          { method: "GET", cache: "no-cache" },
+          35000
+        );
+
+        if (!this.isPolling) break;
+
+        if (response.status === 200) {
+          this.applyServerData(await response.json(), true);
+        } else if (response.status === 503) {
+          // The server is holding as many waiting clients as it allows; back off briefly
+          const retryAfter = Number(response.headers.get("Retry-After")) || 5;
+          await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+        } else if (response.status !== 204 && response.status !== 304) {
+          throw new Error(`Server responded with ${response.status}`);
+        }
       } catch (error) {
         console.warn("⚠️ Change detection error:", error.message);
+        await new Promise((resolve) => setTimeout(resolve, retryInterval));
       }
-    }, checkInterval);
-
-    return () => {
-      this.stopChangeDetection();
-    };
+    }
   }
 
   stopChangeDetection() {